@@ -1,10 +1,18 @@
 import asyncio
 import os
+import argparse
 import pytz
-import requests
 import xml.etree.ElementTree as ET
 from datetime import datetime, timedelta
 from loguru import logger
+from channel_identity import ChannelIdentityMap
+from schedule_store import get_schedule_store, coverage_end, FETCH_DAYS
+from now_next import write_now_next
+from epg_binary import write_epg_binary
+from compress_sink import CompressedOutput, parse_compressions
+from epg_db import DEFAULT_DB_FILE, write_epg_db
+from http_pool import get_session
+from payload_schema import SchemaError, decode_hami_layout
 
 UA = "HamiVideo/7.12.806(Android 11;GM1910) OKHTTP/3.12.2"
 headers = {
@@ -28,33 +36,33 @@ async def request_channel_list():
     url = "https://apl-hamivideo.cdn.hinet.net/HamiVideo/getUILayoutById.php"
     channel_list = []
     try:
-        response = requests.get(url, params=params, headers=headers, timeout=REQUEST_TIMEOUT)
+        response = get_session().get(url, params=params, headers=headers, timeout=REQUEST_TIMEOUT)
         if response.status_code == 200:
-            data = response.json()
+            data = decode_hami_layout(response.content)
             elements = []
 
-            for info in data.get("UIInfo", []):
-                if info.get("title") == "頻道一覽":
-                    elements = info.get('elements', [])
+            for info in data.UIInfo:
+                if info.title == "頻道一覽":
+                    elements = info.elements
                     break
             
             for element in elements:
                 channel_list.append({
-                    "channelId": element.get('contentPk', ''), 
-                    "channelName": element.get('title', ''),
-                    "contentPk": element.get('contentPk', '')
+                    "channelId": element.contentPk, 
+                    "channelName": element.title,
+                    "contentPk": element.contentPk
                 })
     except Exception as e:
         print(f"獲取頻道列表時出錯: {e}")
     
     return channel_list
 
-async def get_programs_with_retry(channel):
+async def get_programs_with_retry(channel, start_day=0):
     retries = 0
 
     while retries < MAX_RETRIES:
         try:
-            programs = await request_epg(channel['channelName'], channel['contentPk'])
+            programs = await request_epg(channel['channelName'], channel['contentPk'], start_day)
             return programs
         except Exception as e:
             retries += 1
@@ -72,28 +80,62 @@ async def request_all_epg():
     
     all_programs = []
     
-    # 使用asyncio.gather並行獲取所有頻道的節目
-    tasks = []
+    # 與 4gtv/ofiii 共享的實體頻道直接沿用已抓取的節目表
+    identity_map = ChannelIdentityMap.from_known_sources()
     for channel in rawChannels:
-        tasks.append(get_programs_with_retry(channel))
+        identity_map.add('hami', channel['contentPk'], channel['channelName'])
+    
+    store = get_schedule_store()
+    to_fetch, reused = store.plan_fetches(
+        identity_map, 'hami', [(channel['contentPk'], channel['channelName']) for channel in rawChannels]
+    )
+    for source, programs in reused.values():
+        all_programs.extend(programs)
     
-    results = await asyncio.gather(*tasks)
+    # 其他來源只涵蓋前幾天的頻道 (例如 4gtv 約 3 天)，沿用已涵蓋的部分，只抓取缺少的尾段日期
+    start_days = {
+        channel_id: store.fetch_start_day('hami', reused[channel_id][1]) if channel_id in reused else 0
+        for channel_id in to_fetch
+    }
+    partial = sum(1 for channel_id in to_fetch if channel_id in reused)
+    print(f"沿用其他來源節目表的頻道: {len(reused)} 個 (其中 {partial} 個只抓取尾段)，需要抓取: {len(to_fetch)} 個")
     
-    for programs in results:
-        if programs:
-            all_programs.extend(programs)
+    # 使用asyncio.gather並行獲取所有頻道的節目
+    fetching = [channel for channel in rawChannels if channel['contentPk'] in start_days]
+    results = await asyncio.gather(*[
+        get_programs_with_retry(channel, start_days[channel['contentPk']]) for channel in fetching
+    ])
+    
+    fetched_programs = []
+    shared_programs = []
+    for channel, programs in zip(fetching, results):
+        if not programs:
+            continue
+        if channel['contentPk'] in reused:
+            # 尾段從沿用節目表結束處接上，並與沿用的部分一起保存為完整的 Hami 節目表
+            head = reused[channel['contentPk']][1]
+            end = coverage_end(head)
+            programs = [program for program in programs if program['start'] >= end]
+            shared_programs.extend(head)
+        fetched_programs.extend(programs)
+    all_programs.extend(fetched_programs)
+    
+    try:
+        store.publish('hami', shared_programs + fetched_programs)
+    except Exception as e:
+        print(f"保存共用節目表失敗: {e}")
     
     print(f"共獲取 {len(all_programs)} 個節目")
     return rawChannels, all_programs
 
-async def request_epg(channel_name: str, content_pk: str):
+async def request_epg(channel_name: str, content_pk: str, start_day: int = 0):
     url = "https://apl-hamivideo.cdn.hinet.net/HamiVideo/getEpgByContentIdAndDate.php"
     print(f"獲取 {channel_name} 的節目表...")
     
     epgResult = []
     today = datetime.now(pytz.timezone('Asia/Taipei'))
     
-    for i in range(7):
+    for i in range(start_day, FETCH_DAYS['hami']):
         date = today + timedelta(days=i)
         formatted_date = date.strftime('%Y-%m-%d')
         params = {
@@ -103,26 +145,27 @@ async def request_epg(channel_name: str, content_pk: str):
         }
         
         try:
-            response = requests.get(url, params=params, headers=headers, timeout=REQUEST_TIMEOUT)
+            response = get_session().get(url, params=params, headers=headers, timeout=REQUEST_TIMEOUT)
             if response.status_code == 200:
-                data = response.json()
-                ui_info = data.get('UIInfo', [])
-                if ui_info:
-                    elements = ui_info[0].get('elements', [])
-                    for element in elements:
-                        program_info_list = element.get('programInfo', [])
-                        if program_info_list:
-                            program_info = program_info_list[0]
-                            start_time, end_time = hami_time_to_datetime(program_info['hintSE'])
+                data = decode_hami_layout(response.content)
+                if data.UIInfo:
+                    for element in data.UIInfo[0].elements:
+                        if element.programInfo:
+                            program_info = element.programInfo[0]
+                            start_time, end_time = hami_time_to_datetime(program_info.hintSE)
                             
                             epgResult.append({
                                 "channelId": content_pk,
-                                "channelName": element.get('title', ''),
-                                "programName": program_info.get('programName', ''),
-                                "description": program_info.get('description', ''),
+                                "channelName": element.title,
+                                "programName": program_info.programName,
+                                "description": program_info.description,
                                 "start": start_time,
                                 "end": end_time
                             })
+        except SchemaError as e:
+            # 結構改變時後續日期的回應同樣無法解析，不再逐日重試
+            print(f"獲取 {channel_name} 的節目表時出錯: {e}")
+            break
         except Exception as e:
             print(f"獲取 {channel_name} 在 {formatted_date} 的節目表時出錯: {e}")
     
@@ -137,7 +180,7 @@ def hami_time_to_datetime(time_range: str):
     end_time_shanghai = shanghai_tz.localize(end_time)
     return start_time_shanghai, end_time_shanghai
 
-def generate_xml_epg(channels, programs):
+def generate_xml_epg(channels, programs, now_next_file=None, binary_file=None):
     # 建立XML結構
     root = ET.Element("tv")
     root.set("info-name", "Hami電視節目表")
@@ -147,6 +190,8 @@ def generate_xml_epg(channels, programs):
     for channel in channels:
         channel_name_map[channel["contentPk"]] = channel["channelName"]
     
+    programs_by_channel = {}
+    
     # 按頻道順序處理
     for channel in channels:
         # 使用頻道名稱作為ID
@@ -166,6 +211,7 @@ def generate_xml_epg(channels, programs):
         
         # 按開始時間排序
         channel_programs.sort(key=lambda p: p["start"])
+        programs_by_channel[channel_id] = channel_programs
         
         for program in channel_programs:
             programme = ET.SubElement(root, "programme")
@@ -177,16 +223,30 @@ def generate_xml_epg(channels, programs):
             title.set("lang", "zh")
             title.text = program["programName"]
             
+            # 沿用 ofiii 節目表的頻道帶有副標題
+            if program.get("subtitle"):
+                sub_title = ET.SubElement(programme, "sub-title")
+                sub_title.set("lang", "zh")
+                sub_title.text = program["subtitle"]
+            
             if program["description"]:
                 desc = ET.SubElement(programme, "desc")
                 desc.set("lang", "zh")
                 desc.text = program["description"]
     
+    if now_next_file:
+        write_now_next(programs_by_channel, now_next_file)
+        print(f"now/next 索引已生成: {now_next_file}")
+    
+    if binary_file:
+        write_epg_binary(programs_by_channel, binary_file)
+        print(f"二進位節目表已生成: {binary_file}")
+    
     # 建立XML樹
     tree = ET.ElementTree(root)
     return tree
 
-async def main():
+async def main(db_path=None, compressions=()):
     print("開始生成Hami電視節目表...")
     
     # 建立輸出目錄
@@ -201,14 +261,25 @@ async def main():
     channels, programs = await request_all_epg()
     
     # 生成XML EPG
-    xml_tree = generate_xml_epg(channels, programs)
+    xml_tree = generate_xml_epg(channels, programs, os.path.join(output_dir, "hami.now.json"),
+                                os.path.join(output_dir, "hami.epgb"))
     output_file = os.path.join(output_dir, "hami.xml")
     
     # 正確寫入XML文件
-    xml_tree.write(output_file, encoding="utf-8", xml_declaration=True)
+    with CompressedOutput(output_file, compressions) as f:
+        xml_tree.write(f, encoding="utf-8", xml_declaration=True)
     
     print(f"電視節目表已成功生成: {output_file}")
-    print(f"檔案大小: {os.path.getsize(output_file) / 1024:.2f} KB")
+    print(f"檔案大小: {f.describe()}")
+    
+    if db_path:
+        write_epg_db(db_path, 'hami', channels, programs)
 
 if __name__ == '__main__':
-    asyncio.run(main())
+    parser = argparse.ArgumentParser(description='Hami電視節目表')
+    parser.add_argument('--db', nargs='?', const=DEFAULT_DB_FILE, default=os.environ.get('EPG_DB'),
+                        help=f'同時寫入 SQLite 資料庫 (不帶路徑時為 {DEFAULT_DB_FILE}，也可用 EPG_DB 環境變量指定)')
+    parser.add_argument('--compress', type=parse_compressions, default='',
+                        help='同時輸出壓縮檔，例如 gz 或 gz,zst (zst 需安裝 zstandard)')
+    args = parser.parse_args()
+    asyncio.run(main(args.db, args.compress))
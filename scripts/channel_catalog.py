@@ -0,0 +1,142 @@
+import os
+import json
+import time
+import threading
+
+from cookie_store import CACHE_DIR
+from payload_schema import SchemaError, decode_fourgtv_channel_set, to_dict
+
+CATALOG_FILE = os.path.join(CACHE_DIR, 'channel_catalog.json')
+CATALOG_TTL = 6 * 3600  # 頻道目錄有效期 (秒)
+CHANNEL_SET_IDS = [1, 4]  # 已知的頻道集合ID
+CATALOG_URL = 'https://api2.4gtv.tv/Channel/GetChannelBySetId/{set_id}/pc/L/V'
+
+
+def fetch_channel_catalog(session, user_agent, timeout=30, log=print):
+    """以同一個會話下載所有頻道集合，按 fs4GTV_ID 去除重複頻道；每個頻道只保留 FourgtvChannel 中的欄位"""
+    headers = {
+        "accept": "*/*",
+        "origin": "https://www.4gtv.tv",
+        "referer": "https://www.4gtv.tv/",
+        "User-Agent": user_agent
+    }
+    all_channels = []
+    seen_channel_ids = set()
+
+    for set_id in CHANNEL_SET_IDS:
+        log(f"📡 正在獲取頻道集合 {set_id}...")
+        try:
+            resp = session.get(CATALOG_URL.format(set_id=set_id), headers=headers, timeout=timeout)
+            resp.raise_for_status()
+            data = decode_fourgtv_channel_set(resp.content)
+        except SchemaError as e:
+            log(f"   ❌ 頻道集合 {set_id}: {e}")
+            continue
+        except Exception as e:
+            log(f"   ❌ 獲取頻道集合 {set_id} 失敗: {e}")
+            continue
+
+        if not data.Success:
+            continue
+
+        for channel in data.Data or []:
+            if channel.fs4GTV_ID in seen_channel_ids:
+                log(f"   ⏭️  跳過重複頻道: {channel.fsNAME or '未知'}")
+                continue
+            seen_channel_ids.add(channel.fs4GTV_ID)
+            all_channels.append(to_dict(channel))
+
+    log(f"   ✅ 頻道目錄共 {len(all_channels)} 個頻道")
+    return all_channels
+
+
+class ChannelCatalog:
+    """4GTV 頻道目錄磁碟快取，由先抓取的腳本寫入、其他腳本讀取，並按 fs4GTV_ID 建立索引"""
+
+    def __init__(self, path=CATALOG_FILE, ttl=CATALOG_TTL):
+        self.path = path
+        self.ttl = ttl
+        self.channels = []
+        self.by_id = {}
+        self.fetched_at = 0
+        self._lock = threading.Lock()
+        self._refresh_thread = None
+        self.load()
+
+    def load(self):
+        """從磁碟載入頻道目錄，返回是否成功"""
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            self._set_channels(data.get('channels', []), data.get('fetched_at', 0))
+            return True
+        except (OSError, ValueError, AttributeError):
+            return False
+
+    def _set_channels(self, channels, fetched_at):
+        self.channels = channels
+        self.by_id = {channel.get('fs4GTV_ID', ''): channel for channel in channels}
+        self.fetched_at = fetched_at
+
+    def is_fresh(self):
+        return bool(self.channels) and time.time() - self.fetched_at < self.ttl
+
+    def get(self, channel_id):
+        """按 fs4GTV_ID 查詢頻道"""
+        return self.by_id.get(channel_id)
+
+    def store(self, channels):
+        """更新記憶體中的目錄並原子寫回磁碟"""
+        fetched_at = time.time()
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'fetched_at': fetched_at, 'channels': channels}, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.path)
+        self._set_channels(channels, fetched_at)
+
+    def refresh(self, fetcher):
+        """呼叫 fetcher 重新下載目錄，下載結果為空時保留舊資料"""
+        with self._lock:
+            # 其他腳本可能已在此期間寫入較新的目錄
+            self.load()
+            if self.is_fresh():
+                return self.channels
+
+            channels = fetcher()
+            if channels:
+                self.store(channels)
+            return self.channels
+
+    def refresh_in_background(self, fetcher):
+        """在背景執行緒中刷新目錄，同一時間只會有一個刷新執行緒"""
+        if self._refresh_thread and self._refresh_thread.is_alive():
+            return self._refresh_thread
+        # 非守護執行緒：腳本結束前會等待刷新寫入完成
+        self._refresh_thread = threading.Thread(
+            target=self.refresh, args=(fetcher,), name="channel-catalog-refresh"
+        )
+        self._refresh_thread.start()
+        return self._refresh_thread
+
+    def get_channels(self, fetcher, background=True):
+        """取得頻道目錄：新鮮時直接返回；過期時先返回舊資料並背景刷新；沒有快取時同步下載"""
+        if self.is_fresh():
+            return self.channels
+        if self.channels and background:
+            self.refresh_in_background(fetcher)
+            return self.channels
+        return self.refresh(fetcher)
+
+
+_catalog = None
+_catalog_lock = threading.Lock()
+
+
+def get_channel_catalog():
+    """取得行程內共用的頻道目錄 (首次呼叫時從磁碟載入)"""
+    global _catalog
+    with _catalog_lock:
+        if _catalog is None:
+            _catalog = ChannelCatalog()
+        return _catalog
@@ -0,0 +1,104 @@
+import os
+import re
+import json
+import unicodedata
+
+from channel_catalog import get_channel_catalog
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+OUTPUT_DIR = os.path.join(BASE_DIR, 'output')
+
+# 各來源抓取一個頻道節目表的相對成本：
+# 4gtv ProgList 一次請求即得三天節目，ofiii 需下載整個頁面，Hami 需按天請求七次
+PROVIDER_COST = {
+    '4gtv': 1,
+    'ofiii': 2,
+    'hami': 3
+}
+
+# ofiii 與 4gtv 共用相同ID的頻道前綴 (例如 4gtv-4gtv009、litv-ftv16)
+SHARED_ID_PREFIXES = ('4gtv-', 'litv-')
+
+# 頻道名稱中的備註，例如「台視《11/26即將下架》」
+_ANNOTATION_RE = re.compile(r'《[^》]*》|\([^)]*\)|\[[^\]]*\]')
+_HD_SUFFIX_RE = re.compile(r'(hd|高畫質)$')
+
+
+def normalize_channel_name(name):
+    """將頻道名稱正規化以便跨來源比對"""
+    if not name:
+        return ''
+    name = unicodedata.normalize('NFKC', name)
+    name = _ANNOTATION_RE.sub('', name)
+    name = re.sub(r'\s+', '', name).lower()
+    return _HD_SUFFIX_RE.sub('', name)
+
+
+class ChannelIdentityMap:
+    """將 ofiii、4gtv、Hami 的頻道ID與名稱連結到同一個實體頻道"""
+
+    def __init__(self):
+        self._members = {}      # 實體頻道鍵 -> {來源: 頻道ID}
+        self._by_provider = {}  # (來源, 頻道ID) -> 實體頻道鍵
+        self._by_name = {}      # 正規化名稱 -> 實體頻道鍵
+
+    def add(self, provider, channel_id, name=''):
+        """登記一個來源頻道，返回其實體頻道鍵"""
+        if not channel_id:
+            return None
+
+        existing = self._by_provider.get((provider, channel_id))
+        if existing:
+            return existing
+
+        normalized = normalize_channel_name(name)
+        if channel_id.startswith(SHARED_ID_PREFIXES):
+            key = channel_id
+        elif normalized in self._by_name:
+            key = self._by_name[normalized]
+        else:
+            key = f"{provider}:{channel_id}"
+
+        members = self._members.setdefault(key, {})
+        # 同一來源的同一實體頻道只保留第一個ID
+        members.setdefault(provider, channel_id)
+        self._by_provider[(provider, channel_id)] = key
+        if normalized:
+            self._by_name.setdefault(normalized, key)
+        return key
+
+    def key_for(self, provider, channel_id):
+        return self._by_provider.get((provider, channel_id))
+
+    def members(self, key):
+        """返回實體頻道在各來源的頻道ID"""
+        return dict(self._members.get(key, {}))
+
+    def providers_by_cost(self, key):
+        """按抓取成本由低到高列出承載此頻道的來源"""
+        return sorted(self._members.get(key, {}), key=lambda p: PROVIDER_COST.get(p, len(PROVIDER_COST) + 1))
+
+    @classmethod
+    def from_known_sources(cls):
+        """從已有的頻道清單建立對照表：fourgtv.json、頻道目錄快取與 ofiii.json"""
+        identity_map = cls()
+
+        for item in _load_json_list(os.path.join(OUTPUT_DIR, 'fourgtv.json')):
+            identity_map.add('4gtv', item.get('fs4GTV_ID'), item.get('fsNAME', ''))
+
+        for item in get_channel_catalog().channels:
+            identity_map.add('4gtv', item.get('fs4GTV_ID'), item.get('fsNAME', ''))
+
+        for item in _load_json_list(os.path.join(OUTPUT_DIR, 'ofiii.json')):
+            identity_map.add('ofiii', item.get('id'), item.get('channelName', ''))
+
+        return identity_map
+
+
+def _load_json_list(path):
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        return data if isinstance(data, list) else []
+    except (OSError, ValueError):
+        return []
@@ -0,0 +1,146 @@
+import os
+import argparse
+import gzip
+import queue
+import threading
+
+try:
+    import zstandard
+except ImportError:  # zstd 為選用依賴，未安裝時只輸出 .gz
+    zstandard = None
+
+COMPRESSIONS = ('gz', 'zst')
+GZIP_LEVEL = 9
+ZSTD_LEVEL = 19
+CHUNK_SIZE = 1024 * 1024  # 累積到此大小才交給壓縮執行緒
+QUEUE_SIZE = 8
+
+_warned_missing_zstd = False
+
+
+def parse_compressions(value):
+    """解析命令行的壓縮格式，例如 'gz,zst'；未安裝 zstandard 時略過 zst"""
+    global _warned_missing_zstd
+    formats = [item.strip() for item in (value or '').split(',') if item.strip()]
+    invalid = [item for item in formats if item not in COMPRESSIONS]
+    if invalid:
+        raise argparse.ArgumentTypeError(f"未知的壓縮格式: {', '.join(invalid)} (可用: {', '.join(COMPRESSIONS)})")
+    if 'zst' in formats and zstandard is None:
+        if not _warned_missing_zstd:
+            print("⚠️ 未安裝 zstandard，略過 .zst 輸出 (pip install zstandard)")
+            _warned_missing_zstd = True
+        formats.remove('zst')
+    return tuple(formats)
+
+
+def _open_compressor(fmt, raw):
+    if fmt == 'gz':
+        # 固定 mtime 與空檔名，內容不變時壓縮檔也逐位元組相同
+        return gzip.GzipFile(filename='', mode='wb', fileobj=raw, compresslevel=GZIP_LEVEL, mtime=0)
+    # threads=-1：大檔案由 zstd 內部多執行緒壓縮
+    return zstandard.ZstdCompressor(level=ZSTD_LEVEL, threads=-1).stream_writer(raw, closefd=False)
+
+
+class _CompressorThread(threading.Thread):
+    """在獨立執行緒中壓縮並寫入一個變體 (zlib 與 zstd 壓縮時會釋放 GIL)"""
+
+    def __init__(self, fmt, path):
+        super().__init__(name=f"compress-{fmt}", daemon=True)
+        self.path = path
+        self.queue = queue.Queue(QUEUE_SIZE)
+        self.error = None
+        self._raw = open(path, 'wb')
+        self._writer = _open_compressor(fmt, self._raw)
+
+    def run(self):
+        try:
+            while True:
+                chunk = self.queue.get()
+                if chunk is None:
+                    break
+                if self.error is None:
+                    self._writer.write(chunk)
+            self._writer.close()
+        except Exception as e:
+            self.error = e
+            # 繼續取出剩餘資料，避免寫入端卡在已滿的佇列
+            while self.queue.get() is not None:
+                pass
+        finally:
+            self._raw.close()
+
+
+class CompressedOutput:
+    """同時寫出原始檔案與其 .gz/.zst 變體的檔案物件，所有檔案先寫暫存檔，成功關閉後才替換
+
+    可直接傳給 ElementTree.write() 或逐段呼叫 write()；str 以 UTF-8 編碼。
+    """
+
+    def __init__(self, path, compressions=()):
+        self.path = str(path)
+        self.sizes = {}
+        self._buffer = bytearray()
+        self._raw = open(f"{self.path}.tmp", 'wb')
+        self._threads = []
+        for fmt in compressions:
+            thread = _CompressorThread(fmt, f"{self.path}.{fmt}.tmp")
+            thread.start()
+            self._threads.append((fmt, thread))
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+        self._raw.write(data)
+        if self._threads:
+            self._buffer += data
+            if len(self._buffer) >= CHUNK_SIZE:
+                self._flush_chunk()
+        return len(data)
+
+    def _flush_chunk(self):
+        chunk = bytes(self._buffer)
+        self._buffer.clear()
+        for _, thread in self._threads:
+            thread.queue.put(chunk)
+
+    def close(self, abort=False):
+        """完成所有輸出並替換目標檔案，返回 {格式: 位元組數}"""
+        if self._buffer:
+            self._flush_chunk()
+        self._raw.close()
+        for _, thread in self._threads:
+            thread.queue.put(None)
+        for _, thread in self._threads:
+            thread.join()
+
+        failed = [(fmt, thread.error) for fmt, thread in self._threads if thread.error]
+        if abort or failed:
+            for path in [f"{self.path}.tmp"] + [thread.path for _, thread in self._threads]:
+                if os.path.exists(path):
+                    os.remove(path)
+            if failed:
+                raise IOError(f"壓縮 {self.path} 失敗: " + ', '.join(f"{fmt}: {error}" for fmt, error in failed))
+            return {}
+
+        os.replace(f"{self.path}.tmp", self.path)
+        self.sizes['raw'] = os.path.getsize(self.path)
+        for fmt, thread in self._threads:
+            target = f"{self.path}.{fmt}"
+            os.replace(thread.path, target)
+            self.sizes[fmt] = os.path.getsize(target)
+        return self.sizes
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close(abort=exc_type is not None)
+
+    def describe(self):
+        """例如 '2.01 MB (gz 312.5 KB, zst 250.1 KB)'"""
+        raw = self.sizes.get('raw', 0)
+        variants = ', '.join(f"{fmt} {size / 1024:.1f} KB" for fmt, size in self.sizes.items() if fmt != 'raw')
+        return f"{raw / 1024:.1f} KB" + (f" ({variants})" if variants else '')
@@ -0,0 +1,155 @@
+import os
+import json
+import time
+import hashlib
+import threading
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CACHE_DIR = os.path.join(BASE_DIR, 'cache')
+DEFAULT_COOKIE_STORE = os.path.join(CACHE_DIR, 'cookies.json')
+
+# Cloudflare 通行證 Cookie 名稱
+CLEARANCE_COOKIE = 'cf_clearance'
+# 沒有過期時間的會話 Cookie 最多沿用的秒數
+SESSION_COOKIE_TTL = 3600
+
+
+def proxy_fingerprint(proxy):
+    """將代理地址轉為不含帳號密碼的指紋，避免憑證寫入磁碟"""
+    if not proxy:
+        return 'direct'
+    return hashlib.sha256(proxy.encode('utf-8')).hexdigest()[:16]
+
+
+def session_proxy(session):
+    """取得會話上設定的代理 (優先 HTTPS)"""
+    proxies = getattr(session, 'proxies', None) or {}
+    return proxies.get('https') or proxies.get('http') or ''
+
+
+def domain_matches(cookie_domain, host):
+    """判斷 Cookie 網域是否適用於指定主機"""
+    domain = (cookie_domain or '').lstrip('.')
+    return bool(domain) and (host == domain or host.endswith('.' + domain))
+
+
+class CookieStore:
+    """按 主機 + User-Agent + 代理 分組保存 Cookie 與 Cloudflare 通行證的磁碟存儲"""
+
+    def __init__(self, path=DEFAULT_COOKIE_STORE):
+        self.path = path
+        self._lock = threading.Lock()
+        self._entries = self._load()
+        self._dirty = False
+
+    def _load(self):
+        """從磁碟載入存儲內容，檔案不存在或損壞時返回空存儲"""
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            return data if isinstance(data, dict) else {}
+        except (OSError, ValueError):
+            return {}
+
+    @staticmethod
+    def make_key(host, user_agent, proxy=''):
+        return f"{host}|{user_agent}|{proxy_fingerprint(proxy)}"
+
+    @staticmethod
+    def _is_valid(cookie, now):
+        expires = cookie.get('expires')
+        if expires is None:
+            return now - cookie.get('saved_at', 0) < SESSION_COOKIE_TTL
+        return expires > now
+
+    def _valid_cookies(self, key, now):
+        entry = self._entries.get(key, {})
+        return [c for c in entry.get('cookies', []) if self._is_valid(c, now)]
+
+    def has_clearance(self, host, user_agent, proxy=''):
+        """是否存在仍在有效期內的 Cloudflare 通行證"""
+        now = time.time()
+        with self._lock:
+            cookies = self._valid_cookies(self.make_key(host, user_agent, proxy), now)
+        return any(c['name'] == CLEARANCE_COOKIE for c in cookies)
+
+    def load_into(self, session, host, user_agent, proxy=''):
+        """將仍有效的 Cookie 載入到會話中，返回載入的數量"""
+        now = time.time()
+        with self._lock:
+            cookies = self._valid_cookies(self.make_key(host, user_agent, proxy), now)
+
+        for cookie in cookies:
+            session.cookies.set(
+                cookie['name'],
+                cookie['value'],
+                domain=cookie.get('domain', host),
+                path=cookie.get('path', '/'),
+                secure=cookie.get('secure', False),
+                expires=cookie.get('expires')
+            )
+        return len(cookies)
+
+    def update_from(self, session, host, user_agent, proxy=''):
+        """記錄會話中適用於該主機的 Cookie 及其過期時間"""
+        now = time.time()
+        cookies = [
+            {
+                'name': cookie.name,
+                'value': cookie.value,
+                'domain': cookie.domain,
+                'path': cookie.path,
+                'secure': cookie.secure,
+                'expires': cookie.expires,
+                'saved_at': now
+            }
+            for cookie in session.cookies
+            if domain_matches(cookie.domain, host) and not (cookie.expires and cookie.expires <= now)
+        ]
+        if not cookies:
+            return 0
+
+        key = self.make_key(host, user_agent, proxy)
+        fingerprint = [(c['name'], c['value'], c['expires']) for c in cookies]
+        with self._lock:
+            stored = self._entries.get(key, {}).get('cookies', [])
+            if [(c['name'], c['value'], c.get('expires')) for c in stored] != fingerprint:
+                self._entries[key] = {'host': host, 'updated_at': now, 'cookies': cookies}
+                self._dirty = True
+        return len(cookies)
+
+    def save(self):
+        """清除過期項目後原子寫回磁碟"""
+        now = time.time()
+        with self._lock:
+            for key in list(self._entries):
+                cookies = self._valid_cookies(key, now)
+                if cookies:
+                    self._entries[key]['cookies'] = cookies
+                else:
+                    del self._entries[key]
+                    self._dirty = True
+
+            if not self._dirty:
+                return False
+
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self._entries, f, ensure_ascii=False, indent=2)
+            os.replace(tmp_path, self.path)
+            self._dirty = False
+            return True
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_cookie_store():
+    """取得行程內共用的 Cookie 存儲 (首次呼叫時從磁碟載入)"""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = CookieStore()
+        return _store
@@ -0,0 +1,171 @@
+import os
+import time
+import argparse
+import re
+import json
+import glob
+import hashlib
+from datetime import datetime
+
+from cookie_store import CACHE_DIR
+
+PARTIAL_DIR = os.path.join(CACHE_DIR, 'partials')
+DATETIME_FIELDS = ('start', 'end')
+MAX_PARTIAL_AGE = 6 * 3600  # 分片結果的有效期 (秒)，快取目錄中更舊的分片視為上一輪殘留
+DEFAULT_RUN_ID = os.environ.get('GITHUB_RUN_ID')  # 同一次 workflow 的各個 job 共用同一個執行批次ID
+
+_SHARD_RE = re.compile(r'^(\d+)/(\d+)$')
+_PARTIAL_RE = re.compile(r'^shard-(\d+)-of-(\d+)\.(json|zip)$')
+
+
+def parse_shard(value):
+    """解析命令行的分片參數 'i/N' (i 從 0 開始)，返回 (i, N)"""
+    match = _SHARD_RE.match(value.strip())
+    if not match:
+        raise argparse.ArgumentTypeError(f"分片格式應為 i/N，例如 0/4: {value}")
+    index, count = int(match.group(1)), int(match.group(2))
+    if count < 1 or index >= count:
+        raise argparse.ArgumentTypeError(f"分片編號需在 0 到 {count - 1} 之間: {value}")
+    return index, count
+
+
+def shard_of(key, count):
+    """按鍵的雜湊決定分片，頻道清單增減時其他頻道的分片不變"""
+    return int(hashlib.sha1(str(key).encode('utf-8')).hexdigest(), 16) % count
+
+
+def select_shard(items, shard, key=lambda item: item):
+    """返回屬於指定分片的項目，保持原有順序"""
+    index, count = shard
+    return [item for item in items if shard_of(key(item), count) == index]
+
+
+def partial_dir(provider, directory=None):
+    return directory or os.path.join(PARTIAL_DIR, provider)
+
+
+def partial_path(directory, shard, extension='json'):
+    index, count = shard
+    return os.path.join(directory, f"shard-{index}-of-{count}.{extension}")
+
+
+def partial_meta_path(path):
+    return f"{path}.meta"
+
+
+def write_partial_meta(path, shard, run_id=None):
+    """在分片結果旁寫出執行批次ID與抓取時間，合併時據此排除上一輪殘留的分片"""
+    meta_path = partial_meta_path(path)
+    tmp_path = f"{meta_path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump({
+            'shard': list(shard),
+            'run_id': run_id,
+            'fetched_at': datetime.now().astimezone().isoformat(timespec='seconds')
+        }, f)
+    os.replace(tmp_path, meta_path)
+
+
+def _partial_problem(path, run_id, max_age):
+    """檢查分片結果是否屬於本輪，返回 (執行批次ID, 問題描述)；沒有問題時描述為 None"""
+    try:
+        with open(partial_meta_path(path), 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        fetched_at = datetime.fromisoformat(meta['fetched_at'])
+    except (OSError, ValueError, KeyError, TypeError):
+        return None, "缺少抓取時間"
+    if run_id is not None and meta.get('run_id') != run_id:
+        return meta.get('run_id'), f"屬於執行批次 {meta.get('run_id')}"
+    if time.time() - fetched_at.timestamp() > max_age:
+        return meta.get('run_id'), f"已過期 (抓取於 {meta['fetched_at']})"
+    return meta.get('run_id'), None
+
+
+def find_partials(directory, extension='json', run_id=None, max_age=MAX_PARTIAL_AGE):
+    """找出目錄中屬於本輪的分片結果並確認分片完整，返回按分片編號排序的路徑
+
+    run_id 不為 None 時只接受該執行批次的分片；超過 max_age 秒或沒有抓取時間的分片一律排除。
+    """
+    found = {}
+    rejected = []
+    run_ids = set()
+    for path in glob.glob(os.path.join(directory, f"shard-*-of-*.{extension}")):
+        match = _PARTIAL_RE.match(os.path.basename(path))
+        if not match:
+            continue
+        shard_run_id, problem = _partial_problem(path, run_id, max_age)
+        if problem:
+            rejected.append(f"{os.path.basename(path)} {problem}")
+            continue
+        found[(int(match.group(1)), int(match.group(2)))] = path
+        run_ids.add(shard_run_id)
+
+    for reason in rejected:
+        print(f"⚠️ 略過分片結果: {reason}")
+    if not found:
+        raise ValueError(f"{directory} 中沒有本輪的分片結果")
+    if len(run_ids) > 1:
+        raise ValueError(f"{directory} 中混有不同執行批次的分片: {sorted(map(str, run_ids))}，請用 --run-id 指定")
+    counts = {count for _, count in found}
+    if len(counts) > 1:
+        raise ValueError(f"{directory} 中混有不同分片數的結果: {sorted(counts)}")
+    count = counts.pop()
+    missing = [index for index in range(count) if (index, count) not in found]
+    if missing:
+        raise ValueError(f"缺少分片 {', '.join(f'{index}/{count}' for index in missing)}")
+    return [found[(index, count)] for index in range(count)]
+
+
+def remove_partials(paths):
+    """合併成功後刪除已合併的分片結果，避免下一輪誤用"""
+    for path in paths:
+        for target in (path, partial_meta_path(path)):
+            try:
+                os.remove(target)
+            except FileNotFoundError:
+                pass
+
+
+def write_partial(directory, shard, channels, programs, fetched=None, run_id=None):
+    """寫出單一分片的頻道與節目；fetched 為本分片實際抓取 (非沿用其他來源) 的頻道ID，默認為全部"""
+    if fetched is None:
+        fetched = {program['channelId'] for program in programs}
+    os.makedirs(directory, exist_ok=True)
+    path = partial_path(directory, shard)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump({
+            'shard': list(shard),
+            'channels': channels,
+            'programs': [
+                dict(program, **{field: program[field].isoformat() for field in DATETIME_FIELDS if field in program})
+                for program in programs
+            ],
+            'fetched': sorted(fetched)
+        }, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+    write_partial_meta(path, shard, run_id)
+    return path
+
+
+def load_partials(paths):
+    """合併 find_partials 找到的分片，返回 (頻道, 節目, 實際抓取的頻道ID)"""
+    channels = []
+    programs = []
+    fetched = set()
+    for path in paths:
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        channels.extend(data.get('channels', []))
+        programs.extend(
+            dict(program, **{field: datetime.fromisoformat(program[field]) for field in DATETIME_FIELDS if field in program})
+            for program in data.get('programs', [])
+        )
+        fetched.update(data.get('fetched', []))
+    return channels, programs, fetched
+
+
+def order_by_registry(items, registry, key):
+    """按頻道登記表的順序重新排列合併結果，同一頻道內保持原順序"""
+    position = {channel_id: index for index, channel_id in enumerate(registry)}
+    return sorted(items, key=lambda item: position.get(key(item), len(position)))
@@ -0,0 +1,189 @@
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import importlib
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from cookie_store import BASE_DIR, get_cookie_store
+from compress_sink import parse_compressions
+from xmltv_shards import parse_shard_modes
+from epg_db import DEFAULT_DB_FILE
+
+OUTPUT_DIR = os.path.join(BASE_DIR, 'output')
+PLAYLIST_DIR = os.path.join(BASE_DIR, 'playlist')
+FOURGTV_JSON = os.path.join(OUTPUT_DIR, 'fourgtv.json')
+FOURGTV_JSON_FIELDS = ('fsNAME', 'fs4GTV_ID', 'fsLOGO_MOBILE', 'fsDESCRIPTION')
+
+
+def run_catalog(args):
+    """刷新 4GTV 頻道目錄快取，並寫出 fourgtv_epg 讀取的 output/fourgtv.json"""
+    m3u8 = importlib.import_module('4g_m3u8')
+    # 目錄過期時同步刷新，寫出的 fourgtv.json 不會是舊資料
+    channels = m3u8.get_all_channels(m3u8.DEFAULT_USER_AGENT, m3u8.DEFAULT_TIMEOUT, background=False)
+    if not channels:
+        print("❌ 無法取得 4GTV 頻道目錄")
+        return False
+
+    os.makedirs(OUTPUT_DIR, exist_ok=True)
+    tmp_path = f"{FOURGTV_JSON}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump([{field: channel.get(field, '') for field in FOURGTV_JSON_FIELDS} for channel in channels],
+                  f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, FOURGTV_JSON)
+    print(f"📦 已寫出 {FOURGTV_JSON} ({len(channels)} 個頻道)")
+    return True
+
+
+def run_ofiii(args):
+    import ofiii_epg
+    return ofiii_epg.run(os.path.join(OUTPUT_DIR, 'ofiii.xml'), not args.no_reuse, args.db,
+                         args.shard_by, args.compress)
+
+
+def run_fourgtv(args):
+    import fourgtv_epg
+    fourgtv_epg.run(fourgtv_epg.DEFAULT_WORKERS, fourgtv_epg.DEFAULT_RATE, args.db, args.shard_by, args.compress)
+    return True
+
+
+def run_playlist(args):
+    m3u8 = importlib.import_module('4g_m3u8')
+    return m3u8.generate_m3u_playlist(m3u8.DEFAULT_USER_AGENT, m3u8.DEFAULT_TIMEOUT, PLAYLIST_DIR,
+                                      compressions=args.compress)
+
+
+def run_ofiii_m3u(args):
+    import generate_ofiii_m3u
+    asyncio.run(generate_ofiii_m3u.main(args.split, args.compress))
+    return True
+
+
+def run_hami(args):
+    import Hami
+    # 各階段在自己的執行緒中運行，Hami 使用該執行緒專屬的事件循環
+    asyncio.run(Hami.main(args.db, args.compress))
+    return True
+
+
+# 階段名稱 -> (依賴的階段, 執行函數)
+STAGES = {
+    'catalog': ((), run_catalog),
+    'ofiii': ((), run_ofiii),
+    'fourgtv': (('catalog',), run_fourgtv),
+    'playlist': (('catalog',), run_playlist),
+    'hami': ((), run_hami),
+    'ofiii_m3u': ((), run_ofiii_m3u),
+}
+
+# 沿用共用節目表的階段 -> 發佈節目表的階段：兩者都被選中時等後者結束 (不論成敗) 才開始，
+# 讓 ofiii/Hami 能沿用 4GTV 本輪剛發佈的節目表；4GTV 失敗時照常自行抓取，也不會因此自動加入 4GTV 階段
+REUSE_AFTER = {
+    'ofiii': ('fourgtv',),
+    'hami': ('fourgtv',),
+}
+
+
+def stage_after(name, args, names):
+    """返回該階段需要等待結束的沿用來源階段 (僅限已選中的階段；ofiii 指定 --no-reuse 時不等待)"""
+    if name == 'ofiii' and args.no_reuse:
+        return ()
+    return tuple(dep for dep in REUSE_AFTER.get(name, ()) if dep in names)
+
+
+def resolve_stages(names):
+    """補上所選階段的依賴，按 STAGES 的順序返回"""
+    selected = set()
+    pending = list(names)
+    while pending:
+        name = pending.pop()
+        if name not in STAGES:
+            raise ValueError(f"未知的階段: {name} (可用: {', '.join(STAGES)})")
+        if name not in selected:
+            selected.add(name)
+            pending.extend(STAGES[name][0])
+    return [name for name in STAGES if name in selected]
+
+
+def run_stages(names, args):
+    """在同一進程中並發執行各階段：依賴完成後才開始，依賴失敗的階段直接略過，返回 {階段: 狀態}"""
+    names = resolve_stages(names)
+    status = {}
+    started = {}
+    futures = {}
+    after = {name: stage_after(name, args, names) for name in names}
+
+    def ready(name):
+        return (all(status.get(dep) == 'ok' for dep in STAGES[name][0])
+                and all(dep in status for dep in after[name]))
+
+    def blocked(name):
+        return any(status.get(dep) in ('failed', 'skipped') for dep in STAGES[name][0])
+
+    with ThreadPoolExecutor(max_workers=len(names), thread_name_prefix='epg-stage') as executor:
+        while len(status) < len(names):
+            for name in names:
+                if name in status or name in futures.values():
+                    continue
+                if blocked(name):
+                    status[name] = 'skipped'
+                    print(f"⏭️ [{name}] 依賴的階段失敗，略過")
+                elif ready(name):
+                    print(f"🚀 [{name}] 開始")
+                    started[name] = time.time()
+                    futures[executor.submit(STAGES[name][1], args)] = name
+
+            if not futures:
+                continue
+            done, _ = wait(futures, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = futures.pop(future)
+                try:
+                    ok = future.result()
+                except Exception as e:
+                    print(f"❌ [{name}] 執行出錯: {e}")
+                    ok = False
+                status[name] = 'ok' if ok else 'failed'
+                print(f"{'✅' if ok else '❌'} [{name}] 完成，耗時 {time.time() - started[name]:.1f} 秒")
+
+    # 各階段共用同一個 Cookie 存儲，結束時統一寫回
+    get_cookie_store().save()
+    return status
+
+
+def add_stage_arguments(parser):
+    """各階段共用的命令行參數 (epg.py 與 epg_daemon.py 共用)"""
+    parser.add_argument('--no-reuse', action='store_true', help='ofiii 不沿用其他來源已抓取的節目表')
+    parser.add_argument('--db', nargs='?', const=DEFAULT_DB_FILE, default=os.environ.get('EPG_DB'),
+                        help=f'同時寫入 SQLite 資料庫 (不帶路徑時為 {DEFAULT_DB_FILE}，也可用 EPG_DB 環境變量指定)')
+    parser.add_argument('--shard-by', type=parse_shard_modes, default=None,
+                        help='ofiii 與 4GTV 同時輸出分片 XMLTV，例如 channel、day 或 channel,day')
+    parser.add_argument('--compress', type=parse_compressions, default='',
+                        help='同時輸出壓縮檔，例如 gz 或 gz,zst (zst 需安裝 zstandard)')
+    parser.add_argument('--split', action='store_true', help='ofiii 播放清單同時輸出分拆播放清單')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='在同一進程中並發執行 ofiii、4GTV 節目表、4GTV 播放清單、Hami 與 ofiii 播放清單')
+    parser.add_argument('stages', nargs='*', default=list(STAGES),
+                        help=f"要執行的階段，依賴會自動加入 (可用: {', '.join(STAGES)}；默認: 全部)")
+    add_stage_arguments(parser)
+    args = parser.parse_args()
+
+    started = time.time()
+    try:
+        status = run_stages(args.stages, args)
+    except ValueError as e:
+        print(f"❌ {e}")
+        return 2
+
+    print(f"\n📊 全部階段完成，耗時 {time.time() - started:.1f} 秒")
+    for name, result in status.items():
+        print(f"   {'✅' if result == 'ok' else '⏭️' if result == 'skipped' else '❌'} {name}: {result}")
+    return 0 if all(result == 'ok' for result in status.values()) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
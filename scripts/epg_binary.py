@@ -0,0 +1,186 @@
+# 精簡二進位節目表格式 (.epgb) 的寫入與 mmap 讀取
+#
+# 檔案布局 (小端序)：
+#     檔頭      MAGIC, 版本, 頻道數, 節目數, 字串數, 各區段位移
+#     字串位移  (字串數 + 1) 個 uint32，第 i 個字串為 blob[off[i]:off[i+1]]，0 號為空字串
+#     字串內容  UTF-8，節目名稱/副標題/描述/頻道ID 去重後只存一次
+#     頻道表    每個頻道 (頻道ID字串號, 第一筆節目索引, 節目數)，按頻道ID的 UTF-8 位元組排序
+#     節目記錄  每筆 (開始, 結束, 名稱字串號, 副標題字串號, 描述字串號)，按 (頻道, 開始時間) 排序
+import os
+import sys
+import mmap
+import time
+import struct
+
+MAGIC = b'EPGB'
+VERSION = 1
+
+HEADER = struct.Struct('<4sHHIIIIIII')
+CHANNEL = struct.Struct('<III')
+RECORD = struct.Struct('<IIIII')
+OFFSET = struct.Struct('<I')
+
+
+def write_epg_binary(programs_by_channel, output_file):
+    """由 {頻道ID: [節目]} 寫出二進位節目表，返回 (頻道數, 節目數)"""
+    strings = ['']
+    string_ids = {'': 0}
+
+    def intern(value):
+        value = value or ''
+        string_id = string_ids.get(value)
+        if string_id is None:
+            string_id = string_ids[value] = len(strings)
+            strings.append(value)
+        return string_id
+
+    channel_entries = []
+    records = []
+    for channel in sorted(programs_by_channel, key=lambda name: name.encode('utf-8')):
+        programs = sorted(programs_by_channel[channel], key=lambda p: p['start'])
+        channel_entries.append((intern(channel), len(records), len(programs)))
+        for program in programs:
+            records.append((
+                int(program['start'].timestamp()),
+                int(program['end'].timestamp()),
+                intern(program.get('programName', '')),
+                intern(program.get('subtitle', '')),
+                intern(program.get('description', ''))
+            ))
+
+    encoded = [value.encode('utf-8') for value in strings]
+    offsets = [0]
+    for data in encoded:
+        offsets.append(offsets[-1] + len(data))
+
+    offsets_offset = HEADER.size
+    blob_offset = offsets_offset + OFFSET.size * len(offsets)
+    channels_offset = blob_offset + offsets[-1]
+    channels_offset += -channels_offset % 4  # 對齊 4 位元組
+    records_offset = channels_offset + CHANNEL.size * len(channel_entries)
+
+    tmp_file = f"{output_file}.tmp"
+    with open(tmp_file, 'wb') as f:
+        f.write(HEADER.pack(
+            MAGIC, VERSION, 0, len(channel_entries), len(records), len(strings),
+            offsets_offset, blob_offset, channels_offset, records_offset
+        ))
+        f.write(struct.pack(f'<{len(offsets)}I', *offsets))
+        f.write(b''.join(encoded))
+        f.write(b'\0' * (channels_offset - blob_offset - offsets[-1]))
+        for entry in channel_entries:
+            f.write(CHANNEL.pack(*entry))
+        for record in records:
+            f.write(RECORD.pack(*record))
+    os.replace(tmp_file, output_file)
+    return len(channel_entries), len(records)
+
+
+class EpgBinaryReader:
+    """以 mmap 開啟 .epgb 檔案，查詢時才解碼需要的記錄與字串"""
+
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        (magic, version, _, self.channel_count, self.programme_count, self.string_count,
+         self._offsets_offset, self._blob_offset, self._channels_offset, self._records_offset) = HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC or version != VERSION:
+            self._mm.close()
+            raise ValueError(f"不是有效的二進位節目表: {path}")
+
+    def close(self):
+        self._mm.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _string_bytes(self, string_id):
+        start, end = struct.unpack_from('<II', self._mm, self._offsets_offset + OFFSET.size * string_id)
+        return self._mm[self._blob_offset + start:self._blob_offset + end]
+
+    def string(self, string_id):
+        return self._string_bytes(string_id).decode('utf-8')
+
+    def _channel(self, index):
+        return CHANNEL.unpack_from(self._mm, self._channels_offset + CHANNEL.size * index)
+
+    def _start(self, record_index):
+        return OFFSET.unpack_from(self._mm, self._records_offset + RECORD.size * record_index)[0]
+
+    def channels(self):
+        return [self.string(self._channel(i)[0]) for i in range(self.channel_count)]
+
+    def find_channel(self, channel):
+        """二分搜尋頻道表，返回 (第一筆節目索引, 節目數)，找不到時返回 None"""
+        key = channel.encode('utf-8')
+        lo, hi = 0, self.channel_count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            name_id, first, count = self._channel(mid)
+            name = self._string_bytes(name_id)
+            if name == key:
+                return first, count
+            if name < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        return None
+
+    def programme(self, record_index):
+        start, stop, title, sub_title, desc = RECORD.unpack_from(self._mm, self._records_offset + RECORD.size * record_index)
+        return {
+            'start': start,
+            'stop': stop,
+            'title': self.string(title),
+            'sub_title': self.string(sub_title),
+            'desc': self.string(desc)
+        }
+
+    def _bisect_start(self, first, count, t):
+        """頻道節目中第一個開始時間大於 t 的記錄索引"""
+        lo, hi = first, first + count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._start(mid) <= t:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def at(self, channel, t):
+        """頻道在 t 時刻播出的節目"""
+        found = self.find_channel(channel)
+        if not found:
+            return None
+        first, count = found
+        i = self._bisect_start(first, count, t) - 1
+        if i < first:
+            return None
+        programme = self.programme(i)
+        return programme if programme['stop'] > t else None
+
+    def between(self, channel, t1, t2):
+        """頻道在 [t1, t2) 內播出的節目"""
+        found = self.find_channel(channel)
+        if not found:
+            return []
+        first, count = found
+        i = max(first, self._bisect_start(first, count, t1) - 1)
+        result = []
+        while i < first + count and self._start(i) < t2:
+            programme = self.programme(i)
+            if programme['stop'] > t1:
+                result.append(programme)
+            i += 1
+        return result
+
+
+if __name__ == '__main__':
+    # 用法: python scripts/epg_binary.py output/4g.epgb [頻道ID]
+    with EpgBinaryReader(sys.argv[1]) as reader:
+        print(f"📺 頻道數: {reader.channel_count}, 節目數: {reader.programme_count}, 字串數: {reader.string_count}")
+        for channel in ([sys.argv[2]] if len(sys.argv) > 2 else reader.channels()[:5]):
+            print(f"  {channel}: {reader.at(channel, time.time())}")
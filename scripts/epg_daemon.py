@@ -0,0 +1,277 @@
+import os
+import sys
+import json
+import time
+import random
+import signal
+import asyncio
+import argparse
+import importlib
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+
+import epg
+from cookie_store import CACHE_DIR, get_cookie_store
+from channel_catalog import CATALOG_TTL
+
+DEFAULT_SOCKET = os.path.join(CACHE_DIR, 'epg_daemon.sock')
+DAY = 24 * 3600
+
+# 各階段的刷新週期 (秒)；播放清單另按播放地址令牌的過期時間提前刷新
+JOB_INTERVALS = {
+    'catalog': CATALOG_TTL,
+    'ofiii': DAY,
+    'fourgtv': DAY,
+    'playlist': 4 * 3600,
+    'hami': DAY,
+    'ofiii_m3u': DAY,
+}
+MIN_PLAYLIST_INTERVAL = 600   # 播放清單最短刷新間隔
+RETRY_INTERVAL = 15 * 60      # 失敗後重試的間隔
+JITTER = 0.05                 # 週期隨機延後的比例，避免多個階段同時觸發
+MAX_SLEEP = 60
+
+
+def _iso(timestamp):
+    return datetime.fromtimestamp(timestamp).astimezone().isoformat(timespec='seconds') if timestamp else None
+
+
+class Job:
+    """常駐模式中的一個階段：記錄下次執行時間與最近一次結果"""
+
+    def __init__(self, name, needs, func, interval, after=()):
+        self.name = name
+        self.needs = needs
+        self.after = after
+        self.func = func
+        self.interval = interval
+        self.next_run = 0
+        self.running = False
+        self.runs = 0
+        self.failures = 0
+        self.last_status = None
+        self.last_started = 0
+        self.last_finished = 0
+        self.last_error = ''
+
+    def snapshot(self):
+        return {
+            'running': self.running,
+            'next_run': _iso(self.next_run),
+            'interval': self.interval,
+            'runs': self.runs,
+            'failures': self.failures,
+            'last_status': self.last_status,
+            'last_started': _iso(self.last_started),
+            'last_duration': round(self.last_finished - self.last_started, 1) if self.last_finished else None,
+            'last_error': self.last_error
+        }
+
+
+class EpgDaemon:
+    """常駐進程：會話、頻道目錄、共用節目表與播放地址快取都留在記憶體中，各階段按自己的週期刷新
+
+    各生成器的輸出檔案都先寫暫存檔再以 os.replace 原子替換，刷新期間讀取端只會讀到完整的舊檔或新檔；
+    ofiii 分拆播放清單則以整個目錄換新，替換的瞬間目錄可能短暫不存在。
+    """
+
+    def __init__(self, args, names, socket_path=DEFAULT_SOCKET):
+        self.args = args
+        self.socket_path = socket_path
+        names = epg.resolve_stages(names)
+        self.jobs = {
+            name: Job(name, epg.STAGES[name][0], epg.STAGES[name][1], JOB_INTERVALS.get(name, DAY),
+                      epg.stage_after(name, args, names))
+            for name in names
+        }
+        self.started_at = time.time()
+        self._executor = ThreadPoolExecutor(max_workers=len(self.jobs), thread_name_prefix='epg-daemon')
+        self._tasks = set()
+        self._wakeup = None
+        self._stopping = None
+
+    def _next_interval(self, job):
+        if job.name != 'playlist':
+            return job.interval
+        # 播放地址在令牌過期前失效，下次刷新時只有即將過期的頻道會重新請求；預留向後浮動的幅度，浮動後仍在過期前
+        expiry = importlib.import_module('4g_m3u8').next_play_url_expiry()
+        if expiry is None:
+            return job.interval
+        return max(MIN_PLAYLIST_INTERVAL, min(job.interval, (expiry - time.time()) / (1 + JITTER)))
+
+    def _is_due(self, job, now):
+        if job.running or now < job.next_run:
+            return False
+        # 依賴的階段需至少成功過一次且目前不在刷新中
+        # 沿用其節目表的階段需至少執行過一次 (不論成敗) 且目前不在刷新中
+        return all(
+            self.jobs[dep].last_status == 'ok' and not self.jobs[dep].running
+            for dep in job.needs if dep in self.jobs
+        ) and all(
+            self.jobs[dep].last_status is not None and not self.jobs[dep].running
+            for dep in job.after
+        )
+
+    async def _run_job(self, job):
+        job.running = True
+        job.last_started = time.time()
+        print(f"🚀 [{job.name}] 開始刷新")
+        try:
+            ok = await asyncio.get_running_loop().run_in_executor(self._executor, job.func, self.args)
+            job.last_error = ''
+        except Exception as e:
+            ok = False
+            job.last_error = str(e)
+            print(f"❌ [{job.name}] 執行出錯: {e}")
+        job.last_finished = time.time()
+        job.running = False
+        job.runs += 1
+        job.last_status = 'ok' if ok else 'failed'
+        if not ok:
+            job.failures += 1
+
+        interval = self._next_interval(job) if ok else RETRY_INTERVAL
+        # 只向後浮動：頻道目錄等有效期與週期相同的快取在下次執行時必定已過期，不會沿用到兩倍週期
+        job.next_run = job.last_finished + interval * random.uniform(1, 1 + JITTER)
+        get_cookie_store().save()
+        print(f"{'✅' if ok else '❌'} [{job.name}] 完成，耗時 {job.last_finished - job.last_started:.1f} 秒，"
+              f"下次刷新: {_iso(job.next_run)}")
+        self._wakeup.set()
+
+    async def _scheduler(self):
+        while not self._stopping.is_set():
+            now = time.time()
+            for job in self.jobs.values():
+                if self._is_due(job, now):
+                    task = asyncio.ensure_future(self._run_job(job))
+                    self._tasks.add(task)
+                    task.add_done_callback(self._tasks.discard)
+
+            waiting = [job.next_run for job in self.jobs.values() if not job.running]
+            delay = min([MAX_SLEEP] + [max(0, next_run - time.time()) for next_run in waiting])
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=max(1, delay))
+            except asyncio.TimeoutError:
+                pass
+
+    def refresh(self, names=None):
+        """強制指定階段 (默認全部) 在下一輪立即刷新，返回實際排入的階段"""
+        names = names or list(self.jobs)
+        unknown = [name for name in names if name not in self.jobs]
+        if unknown:
+            raise ValueError(f"未知的階段: {', '.join(unknown)} (可用: {', '.join(self.jobs)})")
+        for name in names:
+            self.jobs[name].next_run = 0
+        self._wakeup.set()
+        return names
+
+    def status(self):
+        m3u8 = sys.modules.get('4g_m3u8')
+        return {
+            'pid': os.getpid(),
+            'started_at': _iso(self.started_at),
+            'uptime': round(time.time() - self.started_at),
+            'play_url_cache': len(m3u8.cache_play_urls) if m3u8 else 0,
+            'jobs': {name: job.snapshot() for name, job in self.jobs.items()}
+        }
+
+    async def _handle_control(self, reader, writer):
+        """控制通道：每行一個命令，status / refresh [階段...] / stop，回覆一行 JSON"""
+        try:
+            line = (await reader.readline()).decode('utf-8').split()
+            command, params = (line[0], line[1:]) if line else ('status', [])
+            if command == 'status':
+                reply = {'ok': True, 'status': self.status()}
+            elif command == 'refresh':
+                reply = {'ok': True, 'refreshing': self.refresh(params)}
+            elif command == 'stop':
+                self._stopping.set()
+                self._wakeup.set()
+                reply = {'ok': True}
+            else:
+                reply = {'ok': False, 'error': f"未知的命令: {command}"}
+        except ValueError as e:
+            reply = {'ok': False, 'error': str(e)}
+        writer.write((json.dumps(reply, ensure_ascii=False) + '\n').encode('utf-8'))
+        await writer.drain()
+        writer.close()
+
+    async def run(self):
+        self._wakeup = asyncio.Event()
+        self._stopping = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, lambda: (self._stopping.set(), self._wakeup.set()))
+
+        os.makedirs(os.path.dirname(self.socket_path), exist_ok=True)
+        if os.path.exists(self.socket_path):
+            os.remove(self.socket_path)
+        server = await asyncio.start_unix_server(self._handle_control, path=self.socket_path)
+        print(f"🛰️ 常駐模式已啟動，控制通道: {self.socket_path} (階段: {', '.join(self.jobs)})")
+
+        try:
+            await self._scheduler()
+        finally:
+            server.close()
+            await server.wait_closed()
+            if os.path.exists(self.socket_path):
+                os.remove(self.socket_path)
+            if self._tasks:
+                print(f"⏳ 等待 {len(self._tasks)} 個刷新中的階段完成...")
+                await asyncio.gather(*self._tasks, return_exceptions=True)
+            self._executor.shutdown(wait=True)
+            get_cookie_store().save()
+            print("👋 常駐模式已停止")
+
+
+async def send_command(socket_path, command):
+    """向常駐進程發送控制命令並返回回覆"""
+    reader, writer = await asyncio.open_unix_connection(socket_path)
+    writer.write((command + '\n').encode('utf-8'))
+    await writer.drain()
+    reply = json.loads((await reader.readline()).decode('utf-8'))
+    writer.close()
+    return reply
+
+
+def main():
+    parser = argparse.ArgumentParser(description='EPG 常駐模式：保持狀態在記憶體中，各階段按週期刷新並原子替換輸出')
+    parser.add_argument('--socket', type=str, default=DEFAULT_SOCKET, help=f'控制通道路徑 (默認: {DEFAULT_SOCKET})')
+    subparsers = parser.add_subparsers(dest='command')
+
+    run_parser = subparsers.add_parser('run', help='啟動常駐進程')
+    run_parser.add_argument('stages', nargs='*', default=list(epg.STAGES),
+                            help=f"要執行的階段，依賴會自動加入 (可用: {', '.join(epg.STAGES)}；默認: 全部)")
+    epg.add_stage_arguments(run_parser)
+    subparsers.add_parser('status', help='查看各階段狀態')
+    refresh_parser = subparsers.add_parser('refresh', help='立即刷新指定階段 (默認: 全部)')
+    refresh_parser.add_argument('stages', nargs='*')
+    subparsers.add_parser('stop', help='停止常駐進程')
+    args = parser.parse_args()
+
+    if args.command == 'run':
+        try:
+            daemon = EpgDaemon(args, args.stages, args.socket)
+        except ValueError as e:
+            print(f"❌ {e}")
+            return 2
+        asyncio.run(daemon.run())
+        return 0
+
+    if not args.command:
+        parser.print_help()
+        return 1
+
+    command = ' '.join([args.command] + getattr(args, 'stages', []))
+    try:
+        reply = asyncio.run(send_command(args.socket, command))
+    except OSError as e:
+        print(f"❌ 無法連接常駐進程 {args.socket}: {e}")
+        return 1
+    print(json.dumps(reply, ensure_ascii=False, indent=2))
+    return 0 if reply.get('ok') else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,173 @@
+import os
+import time
+import sqlite3
+
+from cookie_store import CACHE_DIR
+
+DEFAULT_DB_FILE = os.path.join(CACHE_DIR, 'epg.sqlite')
+HISTORY_DAYS = 14  # 保留已結束節目的天數
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS channels (
+    id INTEGER PRIMARY KEY,
+    provider TEXT NOT NULL,
+    channel_id TEXT NOT NULL,
+    name TEXT NOT NULL,
+    logo TEXT,
+    description TEXT,
+    updated_at REAL NOT NULL,
+    UNIQUE (provider, channel_id)
+);
+CREATE TABLE IF NOT EXISTS programmes (
+    id INTEGER PRIMARY KEY,
+    channel INTEGER NOT NULL REFERENCES channels(id) ON DELETE CASCADE,
+    start INTEGER NOT NULL,
+    stop INTEGER NOT NULL,
+    title TEXT NOT NULL,
+    sub_title TEXT,
+    description TEXT,
+    refreshed_at REAL NOT NULL,
+    UNIQUE (channel, start)
+);
+CREATE INDEX IF NOT EXISTS idx_programmes_title ON programmes(title);
+CREATE INDEX IF NOT EXISTS idx_programmes_stop ON programmes(stop);
+"""
+
+
+class EpgDatabase:
+    """各來源節目表的 SQLite 儲存：channels/programmes 兩張表，(頻道, 開始時間) 唯一並以 upsert 更新"""
+
+    def __init__(self, path=DEFAULT_DB_FILE):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.conn = sqlite3.connect(path)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.execute('PRAGMA foreign_keys=ON')
+        self.conn.executescript(SCHEMA)
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _upsert_channels(self, provider, channels, now):
+        self.conn.executemany(
+            """
+            INSERT INTO channels (provider, channel_id, name, logo, description, updated_at)
+            VALUES (?, ?, ?, ?, ?, ?)
+            ON CONFLICT (provider, channel_id) DO UPDATE SET
+                name = excluded.name,
+                logo = COALESCE(NULLIF(excluded.logo, ''), channels.logo),
+                description = COALESCE(NULLIF(excluded.description, ''), channels.description),
+                updated_at = excluded.updated_at
+            """,
+            [
+                (provider, channel_id, name, logo, description, now)
+                for channel_id, (name, logo, description) in channels.items()
+            ]
+        )
+        return dict(
+            (channel_id, row_id) for row_id, channel_id in
+            self.conn.execute("SELECT id, channel_id FROM channels WHERE provider = ?", (provider,))
+        )
+
+    def write(self, provider, channels, programs):
+        """在單一交易中寫入某來源本次的頻道與節目，返回寫入的節目數
+
+        同一頻道在本次節目時間範圍內、但這次沒有出現的舊節目 (節目表異動) 會被刪除。
+        """
+        now = time.time()
+        channel_rows = {}
+        for channel in channels:
+            channel_id = channel.get('channelId') or channel.get('id')
+            if channel_id:
+                channel_rows[channel_id] = (channel.get('channelName', ''), channel.get('logo', ''),
+                                            channel.get('description', ''))
+        for program in programs:
+            # 沿用其他來源或沒有頻道資料的節目，以節目上的頻道名稱建立頻道
+            channel_rows.setdefault(program['channelId'], (program.get('channelName', ''), '', ''))
+
+        with self.conn:
+            channel_ids = self._upsert_channels(provider, channel_rows, now)
+
+            rows = []
+            ranges = {}
+            for program in programs:
+                channel = channel_ids[program['channelId']]
+                start = int(program['start'].timestamp())
+                rows.append((
+                    channel, start, int(program['end'].timestamp()), program.get('programName', ''),
+                    program.get('subtitle', ''), program.get('description', ''), now
+                ))
+                low, high = ranges.get(channel, (start, start))
+                ranges[channel] = (min(low, start), max(high, start))
+
+            self.conn.executemany(
+                """
+                INSERT INTO programmes (channel, start, stop, title, sub_title, description, refreshed_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (channel, start) DO UPDATE SET
+                    stop = excluded.stop,
+                    title = excluded.title,
+                    sub_title = excluded.sub_title,
+                    description = excluded.description,
+                    refreshed_at = excluded.refreshed_at
+                """,
+                rows
+            )
+            self.conn.executemany(
+                "DELETE FROM programmes WHERE channel = ? AND start BETWEEN ? AND ? AND refreshed_at < ?",
+                [(channel, low, high, now) for channel, (low, high) in ranges.items()]
+            )
+        return len(rows)
+
+    def prune(self, days=HISTORY_DAYS):
+        """刪除結束超過指定天數的節目，返回刪除數"""
+        with self.conn:
+            cursor = self.conn.execute("DELETE FROM programmes WHERE stop < ?", (int(time.time()) - days * 86400,))
+        return cursor.rowcount
+
+    def programmes(self, provider, channel_id, start, end):
+        """查詢頻道在 [start, end) 內播出的節目 (Unix 秒數)"""
+        return self.conn.execute(
+            """
+            SELECT p.start, p.stop, p.title, p.sub_title, p.description
+            FROM programmes p JOIN channels c ON c.id = p.channel
+            WHERE c.provider = ? AND c.channel_id = ? AND p.start < ? AND p.stop > ?
+            ORDER BY p.start
+            """,
+            (provider, channel_id, int(end), int(start))
+        ).fetchall()
+
+    def search_title(self, title, limit=100):
+        """按節目名稱前綴搜尋 (可使用 title 索引)"""
+        return self.conn.execute(
+            """
+            SELECT c.provider, c.name, p.start, p.stop, p.title
+            FROM programmes p JOIN channels c ON c.id = p.channel
+            WHERE p.title >= ? AND p.title < ?
+            ORDER BY p.title, p.start LIMIT ?
+            """,
+            (title, title + '￿', limit)
+        ).fetchall()
+
+
+def write_epg_db(path, provider, channels, programs, log=print):
+    """將某來源的頻道與節目寫入 SQLite，失敗不影響 XML 輸出"""
+    try:
+        started = time.time()
+        with EpgDatabase(path) as db:
+            count = db.write(provider, channels, programs)
+            pruned = db.prune()
+        log(f"🗄️ 已寫入 SQLite {path}: {provider} {count} 個節目，清除過期 {pruned} 個 ({time.time() - started:.2f} 秒)")
+        return True
+    except Exception as e:
+        log(f"⚠️ 寫入 SQLite 失敗: {e}")
+        return False
@@ -0,0 +1,278 @@
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+from bisect import bisect_left, bisect_right
+from datetime import datetime
+import xml.etree.ElementTree as ET
+
+import pytz
+from aiohttp import web
+
+from channel_identity import OUTPUT_DIR
+
+TAIPEI_TZ = pytz.timezone('Asia/Taipei')
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 5001
+RELOAD_INTERVAL = 5  # 檢查 XML 是否更新的間隔 (秒)
+DEFAULT_NEXT_COUNT = 3
+
+# 來源名稱 -> 各腳本產生的 XMLTV 檔案
+EPG_SOURCES = {
+    '4g': os.path.join(OUTPUT_DIR, '4g.xml'),
+    'ofiii': os.path.join(OUTPUT_DIR, 'ofiii.xml'),
+    'litv': os.path.join(OUTPUT_DIR, 'litv.xml'),
+    'hami': os.path.join(OUTPUT_DIR, 'hami.xml')
+}
+
+
+def parse_xmltv_time(value):
+    """解析 XMLTV 時間，兼容 '20250101080000 +0800' 與 '20250101080000+0800' 兩種寫法"""
+    return datetime.strptime(value.replace(' ', ''), '%Y%m%d%H%M%S%z').timestamp()
+
+
+def parse_query_time(value):
+    """解析查詢參數中的時間：Unix 秒數、ISO 8601 或 XMLTV 格式，未指定時區時視為台北時間"""
+    if value is None or value == '':
+        return time.time()
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    try:
+        return parse_xmltv_time(value)
+    except ValueError:
+        pass
+    parsed = datetime.fromisoformat(value)
+    if parsed.tzinfo is None:
+        parsed = TAIPEI_TZ.localize(parsed)
+    return parsed.timestamp()
+
+
+def format_time(timestamp):
+    return datetime.fromtimestamp(timestamp, TAIPEI_TZ).isoformat()
+
+
+class ChannelSchedule:
+    """單一頻道按開始時間排序的節目，以二分搜尋回答時間查詢"""
+
+    def __init__(self, programmes):
+        programmes.sort(key=lambda p: p['start'])
+        self.programmes = programmes
+        self.starts = [p['start'] for p in programmes]
+        # 節目可能重疊，回溯搜尋時以最長節目時長為界
+        self.max_duration = max((p['stop'] - p['start'] for p in programmes), default=0)
+
+    def between(self, t1, t2):
+        """與 [t1, t2) 有重疊的節目"""
+        i = bisect_left(self.starts, t1 - self.max_duration)
+        end = bisect_left(self.starts, t2)
+        return [p for p in self.programmes[i:end] if p['stop'] > t1]
+
+    def at(self, t):
+        """t 時刻正在播出的節目 (重疊時取最晚開始的一個)"""
+        i = bisect_right(self.starts, t) - 1
+        while i >= 0 and self.starts[i] > t - self.max_duration:
+            if self.programmes[i]['stop'] > t:
+                return self.programmes[i]
+            i -= 1
+        return None
+
+    def upcoming(self, t, count):
+        i = bisect_right(self.starts, t)
+        return self.programmes[i:i + count]
+
+
+def load_xmltv(path):
+    """以串流方式解析 XMLTV，返回 {頻道ID: ChannelSchedule}"""
+    display_names = {}
+    programmes = {}
+    for _, elem in ET.iterparse(path, events=('end',)):
+        if elem.tag == 'channel':
+            display_names[elem.get('id')] = elem.findtext('display-name') or elem.get('id')
+            elem.clear()
+        elif elem.tag == 'programme':
+            try:
+                programme = {
+                    'start': parse_xmltv_time(elem.get('start')),
+                    'stop': parse_xmltv_time(elem.get('stop')),
+                    'title': elem.findtext('title') or '',
+                    'sub_title': elem.findtext('sub-title') or '',
+                    'desc': elem.findtext('desc') or ''
+                }
+            except (TypeError, ValueError):
+                elem.clear()
+                continue
+            programmes.setdefault(elem.get('channel'), []).append(programme)
+            elem.clear()
+
+    for channel_id in programmes:
+        display_names.setdefault(channel_id, channel_id)
+    return {channel_id: ChannelSchedule(programmes.get(channel_id, [])) for channel_id in display_names}
+
+
+class EpgIndex:
+    """各來源 XMLTV 的頻道索引，檔案更新時重新載入並整體替換"""
+
+    def __init__(self, sources=EPG_SOURCES):
+        self.sources = sources
+        self.schedules = {}  # 來源 -> {頻道ID: ChannelSchedule}
+        self.mtimes = {}
+
+    def reload_changed(self):
+        """重新載入修改時間有變的來源，返回已重新載入的來源"""
+        reloaded = []
+        for source, path in self.sources.items():
+            try:
+                mtime = os.stat(path).st_mtime
+            except OSError:
+                continue
+            if self.mtimes.get(source) == mtime:
+                continue
+            started = time.time()
+            try:
+                schedules = load_xmltv(path)
+            except ET.ParseError as e:
+                # 檔案可能正在寫入，下次檢查再載入
+                print(f"⚠️ 解析 {path} 失敗: {e}")
+                continue
+            # 整體替換字典，查詢端不需要加鎖
+            self.schedules = dict(self.schedules, **{source: schedules})
+            self.mtimes[source] = mtime
+            count = sum(len(s.programmes) for s in schedules.values())
+            print(f"📥 已載入 {source}: {len(schedules)} 個頻道, {count} 個節目 ({time.time() - started:.2f} 秒)")
+            reloaded.append(source)
+        return reloaded
+
+    def find(self, channel_id, source=None):
+        """查詢頻道，未指定來源時按來源順序取第一個符合的，返回 (來源, ChannelSchedule)"""
+        schedules = self.schedules
+        for name in ([source] if source else schedules):
+            schedule = schedules.get(name, {}).get(channel_id)
+            if schedule is not None:
+                return name, schedule
+        return None, None
+
+
+def programme_json(programme):
+    return dict(programme, start=format_time(programme['start']), stop=format_time(programme['stop']))
+
+
+class EpgService:
+    """節目表查詢 HTTP 服務"""
+
+    def __init__(self, index, reload_interval=RELOAD_INTERVAL):
+        self.index = index
+        self.reload_interval = reload_interval
+        self._watcher = None
+
+    async def watch(self):
+        while True:
+            await asyncio.sleep(self.reload_interval)
+            try:
+                await asyncio.to_thread(self.index.reload_changed)
+            except Exception as e:
+                print(f"⚠️ 重新載入節目表失敗: {e}")
+
+    async def start(self, app):
+        await asyncio.to_thread(self.index.reload_changed)
+        self._watcher = asyncio.ensure_future(self.watch())
+
+    async def close(self, app):
+        if self._watcher:
+            self._watcher.cancel()
+
+    def lookup(self, request):
+        channel_id = request.query.get('channel')
+        if not channel_id:
+            raise web.HTTPBadRequest(text="缺少 channel 參數")
+        source, schedule = self.index.find(channel_id, request.query.get('source'))
+        if schedule is None:
+            raise web.HTTPNotFound(text=f"找不到頻道 {channel_id}")
+        return source, channel_id, schedule
+
+    @staticmethod
+    def query_time(request, name, default=None):
+        try:
+            return parse_query_time(request.query.get(name, default))
+        except ValueError:
+            raise web.HTTPBadRequest(text=f"無法解析時間參數 {name}")
+
+    async def handle_channels(self, request):
+        return web.json_response({
+            source: sorted(schedules) for source, schedules in self.index.schedules.items()
+        }, dumps=_dumps)
+
+    async def handle_programmes(self, request):
+        source, channel_id, schedule = self.lookup(request)
+        t1 = self.query_time(request, 'start')
+        t2 = self.query_time(request, 'end', str(t1 + 86400))
+        return web.json_response({
+            'source': source,
+            'channel': channel_id,
+            'programmes': [programme_json(p) for p in schedule.between(t1, t2)]
+        }, dumps=_dumps)
+
+    async def handle_now_next(self, request):
+        source, channel_id, schedule = self.lookup(request)
+        t = self.query_time(request, 't')
+        try:
+            count = int(request.query.get('count', DEFAULT_NEXT_COUNT))
+        except ValueError:
+            raise web.HTTPBadRequest(text="count 參數必須是整數")
+        current = schedule.at(t)
+        return web.json_response({
+            'source': source,
+            'channel': channel_id,
+            'now': programme_json(current) if current else None,
+            'next': [programme_json(p) for p in schedule.upcoming(t, count)]
+        }, dumps=_dumps)
+
+    async def handle_on_air(self, request):
+        """所有頻道在 t 時刻播出的節目"""
+        t = self.query_time(request, 't')
+        wanted = request.query.get('source')
+        result = {}
+        for source, schedules in self.index.schedules.items():
+            if wanted and source != wanted:
+                continue
+            result[source] = {}
+            for channel_id, schedule in schedules.items():
+                current = schedule.at(t)
+                if current:
+                    result[source][channel_id] = programme_json(current)
+        return web.json_response({'time': format_time(t), 'channels': result}, dumps=_dumps)
+
+    def create_app(self):
+        app = web.Application()
+        app.on_startup.append(self.start)
+        app.on_cleanup.append(self.close)
+        app.router.add_get('/channels', self.handle_channels)
+        app.router.add_get('/programmes', self.handle_programmes)
+        app.router.add_get('/now-next', self.handle_now_next)
+        app.router.add_get('/on-air', self.handle_on_air)
+        return app
+
+
+def _dumps(value):
+    return json.dumps(value, ensure_ascii=False)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='本地節目表查詢服務')
+    parser.add_argument('--host', type=str, default=DEFAULT_HOST, help=f'監聽地址 (默認: {DEFAULT_HOST})')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT, help=f'監聽端口 (默認: {DEFAULT_PORT})')
+    parser.add_argument('--reload-interval', type=float, default=RELOAD_INTERVAL,
+                        help=f'檢查 XML 是否更新的間隔秒數 (默認: {RELOAD_INTERVAL})')
+    args = parser.parse_args()
+
+    service = EpgService(EpgIndex(), args.reload_interval)
+    print(f"🚀 節目表查詢服務啟動: http://{args.host}:{args.port}/now-next?channel=頻道名稱")
+    web.run_app(service.create_app(), host=args.host, port=args.port, print=None)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -10,11 +10,26 @@ from requests.adapters import HTTPAdapter
 from urllib3.util.retry import Retry
 import time
 import random
+import argparse
+import threading
 import cloudscraper
+from concurrent.futures import ThreadPoolExecutor
 from selenium import webdriver
 from selenium.webdriver.chrome.service import Service
 from webdriver_manager.chrome import ChromeDriverManager
 from selenium.webdriver.chrome.options import Options
+from rate_limiter import get_rate_limiter
+from cookie_store import get_cookie_store, session_proxy
+from channel_catalog import get_channel_catalog, fetch_channel_catalog
+from schedule_store import get_schedule_store
+from now_next import write_now_next
+from epg_binary import write_epg_binary
+from compress_sink import CompressedOutput, parse_compressions
+from xmltv_shards import XmltvShardWriter, SHARD_MODES, parse_shard_modes
+from epg_db import DEFAULT_DB_FILE, write_epg_db
+from crawl_shards import (parse_shard, select_shard, partial_dir, write_partial, find_partials, load_partials,
+                          remove_partials, order_by_registry, DEFAULT_RUN_ID)
+from payload_schema import decode_fourgtv_programs
 
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 OUTPUT_DIR = os.path.join(BASE_DIR, 'output')
@@ -26,6 +41,16 @@ BLOCKED_CHANNELS = [
     "芭樂直擊台"
 ]
 
+# 節目表抓取的預設併發設定
+DEFAULT_WORKERS = 4
+DEFAULT_RATE = 2.0  # 所有工作執行緒共用的每秒請求數
+
+# 節目表請求使用固定的主機與User-Agent，Cloudflare 通行證按此組合持久化
+PROGLIST_HOST = "www.4gtv.tv"
+PROGLIST_USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/125.0.0.0 Safari/537.36"
+
+_thread_local = threading.local()
+
 def create_cloudscraper():
     """建立Cloudscraper實例，繞過Cloudflare防護"""
     return cloudscraper.create_scraper(
@@ -36,6 +61,19 @@ def create_cloudscraper():
         }
     )
 
+def load_clearance(scraper):
+    """載入上次執行保存的Cookie，通行證仍有效時可跳過Cloudflare驗證"""
+    store = get_cookie_store()
+    proxy = session_proxy(scraper)
+    loaded = store.load_into(scraper, PROGLIST_HOST, PROGLIST_USER_AGENT, proxy)
+    if store.has_clearance(PROGLIST_HOST, PROGLIST_USER_AGENT, proxy):
+        logger.debug(f"已載入有效的 Cloudflare 通行證 ({loaded} 個Cookie)")
+    return scraper
+
+def save_clearance(scraper):
+    """記錄會話目前的Cookie與過期時間，供後續請求及下次執行使用"""
+    get_cookie_store().update_from(scraper, PROGLIST_HOST, PROGLIST_USER_AGENT, session_proxy(scraper))
+
 def create_session():
     """建立帶有重試機制的會話"""
     session = requests.Session()
@@ -49,13 +87,72 @@ def create_session():
     session.mount("https://", adapter)
     return session
 
-def get_4gtv_epg():
+def get_thread_scraper():
+    """取得目前工作執行緒專屬的Cloudscraper實例"""
+    scraper = getattr(_thread_local, 'scraper', None)
+    if scraper is None:
+        scraper = load_clearance(create_cloudscraper())
+        _thread_local.scraper = scraper
+    return scraper
+
+def fetch_channel_programs(channel, rate_limiter):
+    """在工作執行緒中獲取單一頻道節目表，受全域速率限制"""
+    channel_name = channel['channelName']
+    rate_limiter.acquire()
+    try:
+        return get_4gtv_programs_scraper(channel['channelId'], channel_name, get_thread_scraper())
+    except Exception as e:
+        logger.error(f"獲取 {channel_name} 節目表失敗: {e}")
+        return None
+
+def get_4gtv_epg(workers=DEFAULT_WORKERS, rate=DEFAULT_RATE, shard=None):
+    """獲取節目表；指定 shard=(i, N) 時只抓取屬於該分片的頻道，共用節目表留待合併時保存"""
     logger.info("正在獲取 四季線上 電子節目表")
     channels = get_4gtv_channels()
     programs = []
+    if shard:
+        channels = select_shard(channels, shard, key=lambda channel: channel['channelId'])
+        logger.info(f"分片 {shard[0]}/{shard[1]}: 負責 {len(channels)} 個頻道")
+    
+    if workers <= 1:
+        programs = get_4gtv_programs_serial(channels)
+        get_cookie_store().save()
+        if not shard:
+            publish_schedules(programs)
+        return channels, programs
+    
+    logger.info(f"使用 {workers} 個工作執行緒獲取節目表 (全域速率 {rate}/秒)")
+    rate_limiter = get_rate_limiter(PROGLIST_HOST, rate)
+    
+    # executor.map 按輸入順序返回結果，保持與 fourgtv.json 相同的頻道順序
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="4gtv-epg") as executor:
+        results = executor.map(lambda channel: fetch_channel_programs(channel, rate_limiter), channels)
+        
+        for channel, channel_programs in zip(channels, results):
+            if channel_programs:
+                programs.extend(channel_programs)
+            else:
+                logger.warning(f"無法獲取 {channel['channelName']} 節目表")
+    
+    get_cookie_store().save()
+    if not shard:
+        publish_schedules(programs)
+    return channels, programs
+
+def publish_schedules(programs):
+    """保存本次節目表，讓 ofiii 與 Hami 的同一實體頻道直接沿用"""
+    try:
+        count = get_schedule_store().publish('4gtv', programs)
+        logger.info(f"已保存 {count} 個頻道的節目表供其他來源沿用")
+    except Exception as e:
+        logger.warning(f"保存共用節目表失敗: {e}")
+
+def get_4gtv_programs_serial(channels):
+    """以單一Cloudscraper實例逐一獲取節目表"""
+    programs = []
     
     # 建立Cloudscraper實例
-    scraper = create_cloudscraper()
+    scraper = load_clearance(create_cloudscraper())
     
     for channel in channels:
         channel_id = channel['channelId']
@@ -76,7 +173,7 @@ def get_4gtv_epg():
         except Exception as e:
             logger.error(f"獲取 {channel_name} 節目表失敗: {e}")
     
-    return channels, programs
+    return programs
 
 def get_4gtv_channels():
     local_file = os.path.join(OUTPUT_DIR, 'fourgtv.json')
@@ -99,12 +196,32 @@ def get_4gtv_channels():
         
         except Exception as e:
             logger.error(f"讀取本地頻道檔案失敗: {e}")
+    
+    # 本地檔案不可用時改用與 4g_m3u8 共用的頻道目錄
+    logger.warning(f"本地頻道檔案不可用，改用 4GTV 頻道目錄: {local_file}")
+    catalog = get_channel_catalog()
+    data = catalog.get_channels(fetch_catalog_channels)
+    return [
+        {
+            "channelName": item.get("fsNAME", ""),
+            "channelId": item.get("fs4GTV_ID", ""),
+            "logo": item.get("fsLOGO_MOBILE", ""),
+            "description": item.get("fsDESCRIPTION", "")
+        }
+        for item in data
+        if item.get("fs4GTV_ID")
+    ]
+
+def fetch_catalog_channels():
+    """下載 4GTV 頻道目錄"""
+    scraper = create_cloudscraper()
+    return fetch_channel_catalog(scraper, PROGLIST_USER_AGENT, log=logger.info)
 
 def get_4gtv_programs_scraper(channel_id, channel_name, scraper):
     """獲取節目表"""
     url = f"https://www.4gtv.tv/ProgList/{channel_id}.txt"
     headers = {
-        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/125.0.0.0 Safari/537.36",
+        "User-Agent": PROGLIST_USER_AGENT,
         "Referer": "https://www.4gtv.tv/",
         "Accept": "application/json, text/plain, */*",
         "Accept-Language": "zh-TW,zh;q=0.9,en-US;q=0.8,en;q=0.7",
@@ -123,26 +240,28 @@ def get_4gtv_programs_scraper(channel_id, channel_name, scraper):
         if not response.text.strip().startswith(('[', '{')):
             raise ValueError("返回內容不是有效的JSON")
         
-        data = response.json()
+        # 按 payload_schema 解碼，結構改變時整份節目表拋出一個 SchemaError
+        data = decode_fourgtv_programs(response.content)
+        save_clearance(scraper)
         
         programs = []
         tz = pytz.timezone('Asia/Taipei')
         
         for item in data:
             start_time = tz.localize(datetime.strptime(
-                f"{item['sdate']} {item['stime']}", 
+                f"{item.sdate} {item.stime}", 
                 "%Y-%m-%d %H:%M:%S"
             ))
             end_time = tz.localize(datetime.strptime(
-                f"{item['edate']} {item['etime']}", 
+                f"{item.edate} {item.etime}", 
                 "%Y-%m-%d %H:%M:%S"
             ))
             
             programs.append({
                 "channelId": channel_id,
                 "channelName": channel_name,
-                "programName": item["title"],
-                "description": item.get("content", ""),
+                "programName": item.title,
+                "description": item.content,
                 "start": start_time,
                 "end": end_time
             })
@@ -155,11 +274,14 @@ def get_4gtv_programs_scraper(channel_id, channel_name, scraper):
         logger.error(f"獲取 {channel_name} 節目表失敗. URL: {url} 狀態碼: {status_code} 錯誤: {e}")
         return None
 
-def generate_xml(channels, programs, filename):
+def generate_xml(channels, programs, filename, now_next_file=None, binary_file=None,
+                 shard_dir=None, shard_modes=SHARD_MODES, compressions=()):
     tv = ET.Element("tv", attrib={
         "info-name": "四季線上電子節目表單",
         "info-url": "https://www.4gtv.tv"
     })
+    # 指定分片目錄時，每個元素生成後同時寫入按頻道/日期的分片
+    shards = XmltvShardWriter(shard_dir, tv.attrib, shard_modes) if shard_dir else None
     
     # 按頻道名稱分組節目
     programs_by_channel = {}
@@ -186,6 +308,9 @@ def generate_xml(channels, programs, filename):
         if channel.get("logo"):
             icon = ET.SubElement(channel_elem, "icon", src=channel["logo"])
         
+        if shards:
+            shards.add_channel(channel_name, channel_elem)
+        
         # 添加該頻道的節目
         if channel_name in programs_by_channel:
             # 節目按開始時間排序
@@ -208,15 +333,100 @@ def generate_xml(channels, programs, filename):
                     if program.get("description"):
                         desc = ET.SubElement(programme, "desc", lang="zh")
                         desc.text = program["description"]
+                    
+                    if shards:
+                        shards.add_programme(channel_name, programme, program["start"])
                 except Exception as e:
                     logger.error(f"生成節目 {program.get('programName', '未知節目')} XML 失敗: {e}")
     
+    if shards:
+        manifest = shards.close()
+        logger.info(f"分片已生成: {shard_dir} ({', '.join(f'{mode} {len(manifest[mode])} 個' for mode in manifest['modes'])})")
+    
     # 生成XML檔案
     tree = ET.ElementTree(tv)
-    tree.write(filename, encoding="utf-8", xml_declaration=True)
-    logger.info(f"電子節目表單已生成: {filename}")
+    with CompressedOutput(filename, compressions) as f:
+        tree.write(f, encoding="utf-8", xml_declaration=True)
+    logger.info(f"電子節目表單已生成: {filename} ({f.describe()})")
+    
+    written_channels = {channel["channelName"]: programs_by_channel.get(channel["channelName"], []) for channel in channels}
+    if now_next_file:
+        write_now_next(written_channels, now_next_file)
+        logger.info(f"now/next 索引已生成: {now_next_file}")
+    
+    if binary_file:
+        write_epg_binary(written_channels, binary_file)
+        logger.info(f"二進位節目表已生成: {binary_file}")
+
+def run(workers=DEFAULT_WORKERS, rate=DEFAULT_RATE, db_path=None, shard_modes=None, compressions=(),
+        shard=None, merge=False, partial_directory=None, run_id=None):
+    """抓取並生成 4g.xml 及其衍生檔案，失敗時拋出異常 (供命令行與 epg.py 調度器共用)
+
+    shard=(i, N) 時只抓取該分片並寫出中間結果；merge=True 時合併所有分片的中間結果後生成完整輸出，成功後刪除已合併的分片；
+    run_id 為執行批次ID，分片結果記錄此ID，合併時只接受同一批次的分片。
+    """
+    logger.info("="*50)
+    logger.info("開始生成四季線上電子節目表單")
+    logger.info(f"開始時間: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+    logger.info(f"輸出目錄: {OUTPUT_DIR}")
+    partial_directory = partial_dir('4gtv', partial_directory)
+    partials = []
+
+    if merge:
+        partials = find_partials(partial_directory, run_id=run_id)
+        channels, programs, _ = load_partials(partials)
+        registry = [channel['channelId'] for channel in get_4gtv_channels()]
+        channels = order_by_registry(channels, registry, lambda channel: channel['channelId'])
+        programs = order_by_registry(programs, registry, lambda program: program['channelId'])
+        logger.info(f"已合併 {partial_directory} 的分片")
+        publish_schedules(programs)
+    elif shard:
+        channels, programs = get_4gtv_epg(workers, rate, shard)
+        path = write_partial(partial_directory, shard, channels, programs, run_id=run_id)
+        logger.success(f"分片結果已寫入: {path} ({len(channels)} 個頻道, {len(programs)} 個節目)")
+        return
+    else:
+        channels, programs = get_4gtv_epg(workers, rate)
+    logger.info(f"共獲取 {len(channels)} 個頻道, {len(programs)} 個節目")
+
+    # 設置XML輸出路徑
+    xml_file = os.path.join(OUTPUT_DIR, '4g.xml')
+    generate_xml(channels, programs, xml_file, os.path.join(OUTPUT_DIR, '4g.now.json'),
+                 os.path.join(OUTPUT_DIR, '4g.epgb'),
+                 os.path.join(OUTPUT_DIR, 'shards', '4g') if shard_modes else None,
+                 shard_modes or SHARD_MODES,
+                 compressions)
+    logger.success(f"EPG生成完成: {xml_file}")
+
+    if db_path:
+        write_epg_db(db_path, '4gtv', channels, programs, log=logger.info)
+
+    if partials:
+        remove_partials(partials)
+        logger.info(f"已刪除 {len(partials)} 個已合併的分片結果")
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='四季線上電子節目表')
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS,
+                        help=f'並發工作執行緒數，1 為逐一抓取 (默認: {DEFAULT_WORKERS})')
+    parser.add_argument('--rate', type=float, default=DEFAULT_RATE,
+                        help=f'所有工作執行緒共用的每秒請求數 (默認: {DEFAULT_RATE})')
+    parser.add_argument('--db', nargs='?', const=DEFAULT_DB_FILE, default=os.environ.get('EPG_DB'),
+                        help=f'同時寫入 SQLite 資料庫 (不帶路徑時為 {DEFAULT_DB_FILE}，也可用 EPG_DB 環境變量指定)')
+    parser.add_argument('--shard-by', type=parse_shard_modes, default=None,
+                        help='同時輸出分片 XMLTV 到 output/shards/4g，例如 channel、day 或 channel,day')
+    parser.add_argument('--compress', type=parse_compressions, default='',
+                        help='同時輸出壓縮檔，例如 gz 或 gz,zst (zst 需安裝 zstandard)')
+    parser.add_argument('--shard', type=parse_shard, default=None,
+                        help='只抓取第 i 個分片 (共 N 個，i 從 0 開始) 並寫出中間結果，例如 0/4')
+    parser.add_argument('--merge', action='store_true',
+                        help='合併所有分片的中間結果，生成完整的 XML 輸出')
+    parser.add_argument('--partial-dir', type=str, default=None,
+                        help=f"分片中間結果目錄 (默認: {partial_dir('4gtv')})")
+    parser.add_argument('--run-id', type=str, default=DEFAULT_RUN_ID,
+                        help='執行批次ID，寫入分片結果；合併時只接受同一批次的分片 (默認: GITHUB_RUN_ID 環境變量)')
+    args = parser.parse_args()
+    
     os.makedirs(OUTPUT_DIR, exist_ok=True)
     
     log_file = os.path.join(OUTPUT_DIR, 'epg_generator.log')
@@ -229,20 +439,9 @@ if __name__ == "__main__":
     )
     
     try:
-        logger.info("="*50)
-        logger.info("開始生成四季線上電子節目表單")
-        logger.info(f"開始時間: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
-        logger.info(f"輸出目錄: {OUTPUT_DIR}")
-        
-        channels, programs = get_4gtv_epg()
-        logger.info(f"共獲取 {len(channels)} 個頻道, {len(programs)} 個節目")
-        
-        # 設置XML輸出路徑
-        xml_file = os.path.join(OUTPUT_DIR, '4g.xml')
-        generate_xml(channels, programs, xml_file)
-        logger.success(f"EPG生成完成: {xml_file}")
+        run(args.workers, args.rate, args.db, args.shard_by, args.compress,
+            args.shard, args.merge, args.partial_dir, args.run_id)
     except Exception as e:
         logger.critical(f"EPG生成失敗: {str(e)}")
         logger.exception(e)
         exit(1)
-
@@ -38,6 +38,21 @@ import uuid
 from bs4 import BeautifulSoup
 import asyncio
 import aiohttp
+import shutil
+import tempfile
+import argparse
+from compress_sink import CompressedOutput, parse_compressions
+from ofiii_channels import channel_registry
+from crawl_shards import (parse_shard, select_shard, partial_dir, partial_path, find_partials, write_partial_meta,
+                          remove_partials, DEFAULT_RUN_ID)
+from payload_archive import DEFAULT_ARCHIVE, map_payloads
+from payload_schema import SchemaError, decode_ofiii_payload, ofiii_page_props
+from parse_pool import ParsePool, DEFAULT_CHUNKSIZE
+
+FALLBACK_BUILD_ID = "YOQn3leN1n6vChLX_aqzq"  # 無法取得時的備用默認值
+BUILD_ID_TTL = 3600  # 同一進程內沿用已取得 build_id 的秒數
+
+_build_id_cache = {'value': None, 'fetched_at': 0}
 
 async def get_build_id():
     """動態獲取 Next.js 構建版本號"""
@@ -50,7 +65,7 @@ async def get_build_id():
             async with session.get("https://www.ofiii.com/channel/watch/4gtv-4gtv040", 
                                  headers=headers, timeout=10) as resp:
                 if resp.status != 200:
-                    return "YOQn3leN1n6vChLX_aqzq"  # 備用默認值
+                    return FALLBACK_BUILD_ID
                 
                 html = await resp.text()
                 soup = BeautifulSoup(html, 'html.parser')
@@ -66,14 +81,14 @@ async def get_build_id():
                 if script and (build_id := re.search(r'"buildId":"([^"]+)"', script.text)):
                     return build_id.group(1)
                 
-                return "YOQn3leN1n6vChLX_aqzq"  # 最後備用默認值
+                return FALLBACK_BUILD_ID
                 
     except Exception as e:
         print(f"❌ 獲取 build_id 失敗: {str(e)}")
-        return "YOQn3leN1n6vChLX_aqzq"
+        return FALLBACK_BUILD_ID
 
 async def get_channel_data(asset_id, build_id):
-    """獲取頻道詳細數據"""
+    """獲取頻道詳細數據的原始位元組，JSON 解碼與解析交給解析進程池"""
     try:
         headers = {
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/134.0.0.0 Safari/537.36',
@@ -94,15 +109,15 @@ async def get_channel_data(asset_id, build_id):
                     # 嘗試備用方法獲取數據
                     return await get_channel_data_fallback(asset_id)
                 
-                data = await resp.json()
+                data = await resp.read()
                 
                 # 檢查返回的數據是否有效
-                if not data:
+                if not data.strip():
                     print(f"⚠️ 頻道 {asset_id} 返回的數據為空")
                     return await get_channel_data_fallback(asset_id)
                 
-                # 檢查數據結構是否完整
-                if 'pageProps' not in data:
+                # 檢查數據結構是否完整 (只檢查鍵名，完整解碼在解析進程中進行)
+                if b'"pageProps"' not in data:
                     print(f"⚠️ 頻道 {asset_id} 數據結構不完整，缺少 pageProps")
                     return await get_channel_data_fallback(asset_id)
                     
@@ -119,7 +134,7 @@ async def get_channel_data(asset_id, build_id):
         return await get_channel_data_fallback(asset_id)
 
 async def get_channel_data_fallback(asset_id):
-    """備用方法獲取頻道數據 - 通過直接訪問頁面"""
+    """備用方法獲取頻道數據 - 通過直接訪問頁面，返回 __NEXT_DATA__ 的原始位元組"""
     try:
         headers = {
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/134.0.0.0 Safari/537.36',
@@ -137,118 +152,91 @@ async def get_channel_data_fallback(asset_id):
                 
                 # 嘗試從 script 標籤中提取 JSON 數據
                 script_tag = soup.find('script', id='__NEXT_DATA__')
-                if script_tag:
-                    try:
-                        data = json.loads(script_tag.string)
-                        return data
-                    except json.JSONDecodeError:
-                        print(f"⚠️ 無法解析頻道 {asset_id} 的 JSON 數據")
+                if script_tag and script_tag.string:
+                    return script_tag.string.encode('utf-8')
                 
+                print(f"⚠️ 頁面中沒有頻道 {asset_id} 的 JSON 數據")
                 return None
                 
     except Exception as e:
         print(f"⚠️ 備用方法獲取頻道 {asset_id} 數據失敗: {str(e)}")
         return None
 
-def extract_channel_details(channel_data):
-    """從頻道數據中提取詳細信息"""
-    try:
-        # 檢查 channel_data 是否為 None 或空
-        if not channel_data:
-            print("❌ 頻道數據為空")
-            return None
-            
-        # 深度檢查數據結構
-        if not isinstance(channel_data, dict):
-            print(f"❌ 頻道數據類型錯誤: {type(channel_data)}")
-            return None
-            
-        # 檢查 pageProps 是否存在
-        page_props = channel_data.get('pageProps', {})
-        if not page_props:
-            print("❌ pageProps 為空")
-            return None
-            
-        channel = page_props.get('channel', {})
-        if not channel:
-            print("❌ channel 數據為空")
-            return None
-            
-        introduction = page_props.get('introduction', {})
-        
-        # 根據 content_type 判斷頻道類型
-        content_type = channel.get('content_type', '')
-        if content_type in ['vod-channel', 'playout-channel']:
-            channel_type = 'vod'
-        else:
-            channel_type = 'live'
-        
-        # 獲取頻道名稱
-        channel_name = channel.get('title', '未知頻道')
-        
-        # 獲取頻道分組
-        station_categories = channel.get('station_categories', [])
-        channel_group = station_categories[0].get('Name', '默認分組') if station_categories else '默認分組'
-        
-        # 獲取頻道圖片 - 從多個可能的位置查找
-        channel_picture = ''
-        
-        # 1. 首先嘗試從 introduction 中獲取
-        if introduction and isinstance(introduction, dict):
-            channel_picture = introduction.get('image', '')
-        
-        # 2. 如果沒有，嘗試從 channel 的 picture 字段獲取
-        if not channel_picture:
-            channel_picture = channel.get('picture', '')
-        
-        # 3. 如果圖片路徑是相對路徑，轉換為完整 URL
-        if channel_picture and not channel_picture.startswith(('http://', 'https://')):
-            if channel_picture.startswith('pics/'):
-                channel_picture = f"https://p-cdnstatic.svc.litv.tv/{channel_picture}"
-            elif channel_picture.startswith('/'):
-                channel_picture = f"https://p-cdnstatic.svc.litv.tv{channel_picture}"
-        
-        details = {
-            'type': channel_type,
-            'name': channel_name,
-            'group': channel_group,
-            'picture': channel_picture,
-            'raw_data': channel_data
-        }
-        
-        # 如果是點播類，獲取節目清單
-        if channel_type == 'vod':
-            vod_schedule = channel.get('vod_channel_schedule', {})
-            programs = vod_schedule.get('programs', []) if vod_schedule else []
-            details['programs'] = programs
-            
-        return details
-        
-    except Exception as e:
-        print(f"❌ 提取頻道詳細信息失敗: {str(e)}")
-        import traceback
-        print(f"❌ 詳細錯誤信息: {traceback.format_exc()}")
+def extract_channel_details(page_props):
+    """從已解碼的 pageProps 中提取生成播放清單用到的頻道詳細信息 (不保留原始資料)"""
+    if page_props is None:
+        print("❌ pageProps 為空")
         return None
+    
+    channel = page_props.channel
+    if channel is None:
+        print("❌ channel 數據為空")
+        return None
+    
+    # 根據 content_type 判斷頻道類型
+    if channel.content_type in ['vod-channel', 'playout-channel']:
+        channel_type = 'vod'
+    else:
+        channel_type = 'live'
+    
+    # 獲取頻道分組
+    station_categories = channel.station_categories
+    channel_group = '默認分組'
+    if station_categories and station_categories[0].Name is not None:
+        channel_group = station_categories[0].Name
+    
+    # 獲取頻道圖片 - 先從 introduction 中獲取，沒有再使用 channel 的 picture 字段
+    introduction = page_props.introduction
+    channel_picture = (introduction.image if introduction else None) or channel.picture or ''
+    
+    # 如果圖片路徑是相對路徑，轉換為完整 URL
+    if channel_picture and not channel_picture.startswith(('http://', 'https://')):
+        if channel_picture.startswith('pics/'):
+            channel_picture = f"https://p-cdnstatic.svc.litv.tv/{channel_picture}"
+        elif channel_picture.startswith('/'):
+            channel_picture = f"https://p-cdnstatic.svc.litv.tv{channel_picture}"
+    
+    details = {
+        'type': channel_type,
+        'name': channel.title if channel.title is not None else '未知頻道',
+        'group': channel_group,
+        'picture': channel_picture
+    }
+    
+    # 如果是點播類，獲取節目清單 (只保留生成播放清單用到的欄位)
+    if channel_type == 'vod':
+        vod_schedule = channel.vod_channel_schedule
+        details['programs'] = [
+            {'asset_id': program.asset_id, 'title': program.title,
+             'subtitle': program.subtitle, 'picture': program.picture}
+            for program in (vod_schedule.programs if vod_schedule else [])
+        ]
+    
+    return details
 
-def save_channel_json(channel_id, channel_data, json_dir):
-    """將頻道JSON資料儲存為檔案"""
+def save_channel_json(channel_id, raw, json_dir):
+    """將頻道的原始JSON資料原樣儲存為檔案"""
     try:
         json_file = json_dir / f"{channel_id}.json"
-        with open(json_file, 'w', encoding='utf-8') as f:
-            json.dump(channel_data, f, ensure_ascii=False, indent=2)
+        with open(json_file, 'wb') as f:
+            f.write(raw)
         return True
     except Exception as e:
         print(f"❌ 儲存頻道 {channel_id} JSON檔案失敗: {e}")
         return False
 
-def create_channel_zip(json_dir, output_dir):
-    """將所有頻道JSON檔案壓縮成ZIP"""
+def create_channel_zip(json_dir, output_dir, zip_path=None):
+    """將所有頻道JSON檔案壓縮成ZIP (默認為 output_dir/ofiii_channel.zip)"""
     try:
-        zip_path = output_dir / "ofiii_channel.zip"
+        zip_path = Path(zip_path) if zip_path else output_dir / "ofiii_channel.zip"
+        zip_path.parent.mkdir(parents=True, exist_ok=True)
         
-        with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as zipf:
+        # 先寫暫存檔再替換，讀取端不會讀到寫到一半的壓縮檔
+        tmp_path = zip_path.with_name(f"{zip_path.name}.tmp")
+        with zipfile.ZipFile(tmp_path, 'w', zipfile.ZIP_DEFLATED) as zipf:
             for json_file in json_dir.glob("*.json"):
                 zipf.write(json_file, json_file.name)
+        os.replace(tmp_path, zip_path)
         
         print(f"✅ 成功建立壓縮檔: {zip_path}")
         return True
@@ -287,205 +275,299 @@ def get_display_name(title, subtitle):
     else:
         return "未知節目"
 
-def generate_m3u_vod_content(channel_id, channel_details, group_name):
-    """生成 M3U 選集類內容"""
-    content = ""
-    programs = channel_details.get('programs', [])
+def parse_channel_payload(channel_id, raw):
+    """解析一份落地的原始頻道資料，返回 (頻道ID, 頻道詳細信息) (在解析進程池中執行)"""
+    try:
+        page_props = ofiii_page_props(decode_ofiii_payload(raw))
+    except ValueError as e:
+        print(f"⚠️ 無法解析頻道 {channel_id} 的資料: {e}")
+        return channel_id, None
+    return channel_id, extract_channel_details(page_props)
+
+def store_channel_payload(channel_id, raw, json_dir):
+    """解碼抓取到的頻道資料並落地為JSON，返回 (頻道ID, 是否已儲存, 頻道詳細信息) (在解析進程池中執行)"""
+    try:
+        payload = decode_ofiii_payload(raw)
+    except SchemaError as e:
+        # 結構改變時仍保存原始資料，更新結構後可用 --from-archive 離線重建
+        print(f"❌ 頻道 {channel_id}: {e}")
+        payload = None
+    except ValueError as e:
+        print(f"⚠️ 無法解析頻道 {channel_id} 的 JSON 數據: {e}")
+        return channel_id, False, None
+    
+    # 備用方法取得的 __NEXT_DATA__ 統一為 _next/data 的 {pageProps} 形狀再落地
+    if payload is not None and payload.pageProps is None:
+        raw = json.dumps(json.loads(raw).get('props', {}), ensure_ascii=False).encode('utf-8')
+    
+    # 儲存頻道JSON資料，供建立 ofiii_channel.zip 及離線重建使用
+    saved = save_channel_json(channel_id, raw, json_dir)
+    if not saved:
+        print(f"⚠️ 頻道 {channel_id} 無法寫入暫存檔，將不會出現在頻道壓縮檔中")
+    
+    return channel_id, saved, extract_channel_details(ofiii_page_props(payload)) if payload else None
+
+def parse_archive_channels(source, channel_ids, on_result, workers=None, chunksize=DEFAULT_CHUNKSIZE):
+    """從 ofiii_channel.zip 或頻道資料目錄並行解析頻道，按頻道清單順序逐一交給 on_result(頻道ID, 詳細信息)，
+    沒有資料的頻道交入 None，返回成功解析的頻道數"""
+    print(f"📦 從 {source} 讀取頻道資料 ({workers or os.cpu_count()} 個進程並行解析)")
+    successful = 0
+    remaining = iter(channel_ids)
+    for channel_id, channel_details in map_payloads(parse_channel_payload, source, channel_ids, workers, chunksize):
+        # 來源中缺少的頻道立即交入 None，後續頻道不必等待
+        for skipped in remaining:
+            if skipped == channel_id:
+                break
+            on_result(skipped, None)
+        if channel_details:
+            successful += 1
+        else:
+            print(f"⚠️  頻道 {channel_id} 沒有有效的頻道資訊")
+        on_result(channel_id, channel_details)
+    for skipped in remaining:
+        on_result(skipped, None)
+    return successful
+
+def claim_asset(asset_index, asset_id, channel_id, position):
+    """在全域asset索引中登記節目，已被其他條目佔用時返回False"""
+    if asset_id in asset_index:
+        return False
+    asset_index[asset_id] = (channel_id, position)
+    return True
+
+def iter_m3u_vod_entries(channel_id, channel_details, group_name, asset_index, stats):
+    """逐條產生 M3U 選集類條目"""
+    channel_picture = channel_details.get('picture', '')
     
-    for program in programs:
+    for position, program in enumerate(channel_details.get('programs', [])):
         asset_id = program.get('asset_id')
-        title = program.get('title', '')
-        subtitle = program.get('subtitle', '')
+        if not asset_id:
+            continue
         
-        # 合併標題和副標題
-        if title and subtitle:
-            program_name = f"{title}-{subtitle}"
-        else:
-            program_name = title or subtitle or '未知節目'
+        # 同一個asset_id只保留第一次出現的條目
+        if not claim_asset(asset_index, asset_id, channel_id, position):
+            stats['duplicate_assets'] += 1
+            continue
+        
+        program_name = get_display_name(program.get('title', ''), program.get('subtitle', ''))
         
         # 獲取節目圖片，如果沒有則使用頻道圖片
-        program_picture = program.get('picture', '') or channel_details.get('picture', '')
+        program_picture = program.get('picture', '') or channel_picture
         
-        content += (f'#EXTINF:-1 tvg-id="{program_name}" tvg-name="{program_name}" '
-                   f'tvg-logo="{program_picture}" group-title="{group_name}",{program_name}\n'
-                   f'http://localhost:5000/{channel_id}/index.m3u8?episode_id={asset_id}\n')
-    
-    return content
-
-def generate_txt_vod_by_name(channels_by_name):
-    """按頻道名稱生成 TXT 選集類內容"""
-    content = ""
-    
-    for channel_name, programs in sorted(channels_by_name.items()):
-        content += f"{channel_name},#genre#\n"
-        for program_info in programs:
-            program_name = program_info.get("program_name", "未知節目")
-            channel_id = program_info.get("channel_id")
-            asset_id = program_info.get("asset_id")
-            
-            if asset_id:  # 點播節目
-                content += f"{program_name},http://localhost:5000/{channel_id}/index.m3u8?episode_id={asset_id}\n"
-            else:  # 直播頻道
-                content += f"{program_name},http://localhost:5000/{channel_id}/index.m3u8\n"
-    
-    return content
+        yield (f'#EXTINF:-1 tvg-id="{program_name}" tvg-name="{program_name}" '
+               f'tvg-logo="{program_picture}" group-title="{group_name}",{program_name}')
+        yield f'http://localhost:5000/{channel_id}/index.m3u8?episode_id={asset_id}'
+        stats['programs'] += 1
 
-def generate_m3u_content(channel_data, channel_id, asset_seen):
-    """生成M3U內容"""
-    m3u_lines = []
-    added_programs = 0
-    duplicate_assets = 0
-    
-    try:
-        # 提取頻道詳細信息
-        channel_details = extract_channel_details(channel_data)
-        if not channel_details:
-            print(f"⚠️  頻道 {channel_id} 沒有有效的頻道資訊")
-            return m3u_lines, added_programs, duplicate_assets
-        
-        name = channel_details.get('name', 'Unknown')
-        picture = channel_details.get('picture', '')
-        channel_type = channel_details.get('type', 'live')
-        group = channel_details.get('group', '默認分組')
-        
-        print(f"📺 處理頻道: {name} ({channel_id}) - 類型: {channel_type} - 分組: {group}")
-        
-        # 根據頻道類型生成不同的內容
-        if channel_type == 'vod':
-            # 點播頻道：處理每個節目
-            programs = channel_details.get('programs', [])
-            
-            if not programs:
-                print(f"ℹ️  頻道 {name} 沒有節目列表，跳過")
-                return m3u_lines, added_programs, duplicate_assets
-            
-            # 使用與 app3.py 相同的生成邏輯
-            vod_content = generate_m3u_vod_content(channel_id, channel_details, group)
-            if vod_content:
-                # 將內容分割成行並添加到 m3u_lines
-                vod_lines = vod_content.strip().split('\n')
-                m3u_lines.extend(vod_lines)
-                added_programs = len([line for line in vod_lines if line.startswith('#EXTINF:')])
-                print(f"✅ 添加 {name} - {added_programs} 個節目")
-            else:
-                print(f"⚠️ 頻道 {name} 沒有可用的點播內容")
-            
-        else:
-            # 直播頻道：生成整個頻道的條目
-            display_name = name
-            
-            # 生成M3U條目
-            extinf_line = (f'#EXTINF:-1 tvg-id="{name}" tvg-name="{name}" '
-                          f'tvg-logo="{picture}" group-title="{group}",{display_name}')
-            url_line = f'http://localhost:5000/{channel_id}/index.m3u8'
-            
-            m3u_lines.append(extinf_line)
-            m3u_lines.append(url_line)
-            added_programs = 1
-            
-            print(f"✅ 添加直播頻道: {name}")
-            
-    except Exception as e:
-        print(f"❌ 處理頻道 {channel_id} 資料時發生錯誤: {e}")
-        import traceback
-        print(f"❌ 詳細錯誤信息: {traceback.format_exc()}")
-    
-    return m3u_lines, added_programs, duplicate_assets
+def iter_m3u_entries(channel_id, channel_details, asset_index, stats):
+    """逐條產生單一頻道的 M3U 條目"""
+    name = channel_details.get('name', 'Unknown')
+    picture = channel_details.get('picture', '')
+    channel_type = channel_details.get('type', 'live')
+    group = channel_details.get('group', '默認分組')
+    
+    print(f"📺 處理頻道: {name} ({channel_id}) - 類型: {channel_type} - 分組: {group}")
+    
+    if channel_type == 'vod':
+        # 點播頻道：處理每個節目
+        if not channel_details.get('programs'):
+            print(f"ℹ️  頻道 {name} 沒有節目列表，跳過")
+            return
+        
+        before = stats['programs']
+        yield from iter_m3u_vod_entries(channel_id, channel_details, group, asset_index, stats)
+        print(f"✅ 添加 {name} - {stats['programs'] - before} 個節目")
+    else:
+        # 直播頻道：生成整個頻道的條目
+        yield (f'#EXTINF:-1 tvg-id="{name}" tvg-name="{name}" '
+               f'tvg-logo="{picture}" group-title="{group}",{name}')
+        yield f'http://localhost:5000/{channel_id}/index.m3u8'
+        stats['programs'] += 1
+        print(f"✅ 添加直播頻道: {name}")
 
-def generate_txt_content(channel_data, channel_id, asset_seen, channels_by_name):
-    """生成TXT內容，按頻道名稱組織"""
-    added_programs = 0
-    duplicate_assets = 0
-    
-    try:
-        # 提取頻道詳細信息
-        channel_details = extract_channel_details(channel_data)
-        if not channel_details:
-            return added_programs, duplicate_assets
-        
+class PlaylistWriter:
+    """邊解析邊寫出 M3U：解析結果可按任意順序交入 add()，經小型重排緩衝後按頻道清單順序寫出，
+    寫出後即釋放該頻道的資料，記憶體只與尚在等待前序頻道的少數頻道成正比
+
+    每個頻道的 TXT 條目同時暫存到磁碟，之後由 iter_txt_lines 按頻道名稱順序逐頻道讀回；
+    提供 split_dir 時同一輪中寫出分拆播放清單。
+    """
+
+    def __init__(self, channel_ids, m3u_file, compressions=(), split_dir=None):
+        self.channel_ids = list(channel_ids)
+        self.asset_index = {}       # 全域asset索引：asset_id -> (頻道ID, 節目位置)，M3U 與 TXT 共用
+        self.channels_by_name = {}  # 頻道名稱 -> 該名稱下的頻道ID列表
+        self.channel_data = {}      # ofiii_channel.json 的內容 {頻道ID: [名稱, 圖片, 分組]}
+        self.stats = {'programs': 0, 'duplicate_assets': 0}
+        self.split_state = start_split_playlists(split_dir) if split_dir else None
+        self._next = 0
+        self._pending = {}
+        self._txt_spill = tempfile.TemporaryFile()
+        self._txt_offsets = {}
+        self._m3u = CompressedOutput(m3u_file, compressions)
+        self._m3u.write('#EXTM3U\n')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            self._m3u.close(abort=True)
+            self._txt_spill.close()
+
+    def add(self, channel_id, channel_details):
+        """交入一個頻道的解析結果 (沒有資料時為 None)，並寫出所有已按順序就緒的頻道"""
+        self._pending[channel_id] = channel_details
+        while self._next < len(self.channel_ids) and self.channel_ids[self._next] in self._pending:
+            self._release(self.channel_ids[self._next])
+
+    def _release(self, channel_id):
+        self._next += 1
+        channel_details = self._pending.pop(channel_id, None)
+        if channel_details:
+            self._write_channel(channel_id, channel_details)
+
+    def finish(self):
+        """寫出仍在等待缺漏頻道的結果並完成 M3U 與分拆播放清單，返回 M3U 的大小描述"""
+        while self._next < len(self.channel_ids):
+            self._release(self.channel_ids[self._next])
+        self._m3u.close()
+        if self.split_state:
+            split_index = finish_split_playlists(self.split_state)
+            print(f"🧩 分拆播放清單: {self.split_state['dir'] / 'index.m3u'} "
+                  f"({split_index['total_channels']} 個頻道, {split_index['total_entries']} 個條目)")
+        return self._m3u.describe()
+
+    def _write_channel(self, channel_id, channel_details):
         name = channel_details.get('name', 'Unknown')
-        channel_type = channel_details.get('type', 'live')
+        self.channels_by_name.setdefault(name, []).append(channel_id)
+        self.channel_data[channel_id] = [name, channel_details['picture'], channel_details['group']]
         
-        # 初始化頻道名稱的列表
-        if name not in channels_by_name:
-            channels_by_name[name] = []
-        
-        # 根據頻道類型生成不同的內容
-        if channel_type == 'vod':
-            # 點播頻道：處理每個節目
-            programs = channel_details.get('programs', [])
-            
-            for program in programs:
-                asset_id = program.get('asset_id', '')
-                title = program.get('title', '')
-                subtitle = program.get('subtitle', '')
-                
-                if not asset_id:
-                    continue
-                    
-                # 檢查asset_id是否已經存在
-                if asset_id in asset_seen:
-                    duplicate_assets += 1
-                    continue
-                    
-                # 標記asset_id為已使用
-                asset_seen.add(asset_id)
-                    
-                # 生成顯示名稱
-                program_name = get_display_name(title, subtitle)
-                
-                # 將節目信息添加到頻道名稱下
-                channels_by_name[name].append({
-                    "channel_id": channel_id,
-                    "program_name": program_name,
-                    "asset_id": asset_id
-                })
-                added_programs += 1
-                
-        else:
-            # 直播頻道：生成整個頻道的條目
-            display_name = name
-            
-            # 將直播頻道信息添加到頻道名稱下
-            channels_by_name[name].append({
-                "channel_id": channel_id,
-                "program_name": display_name,
-                "asset_id": None  # 直播頻道沒有asset_id
-            })
-            added_programs += 1
-            
-    except Exception as e:
-        print(f"❌ 處理頻道 {channel_id} TXT資料時發生錯誤: {e}")
-    
-    return added_programs, duplicate_assets
+        # 一次只保留單一頻道的條目
+        entries = []
+        try:
+            entries.extend(iter_m3u_entries(channel_id, channel_details, self.asset_index, self.stats))
+        except Exception as e:
+            print(f"❌ 處理頻道 {channel_id} 資料時發生錯誤: {e}")
+        
+        if self.split_state is not None and entries:
+            add_split_channel(self.split_state, channel_id, channel_details, entries)
+        for line in entries:
+            self._m3u.write(line)
+            self._m3u.write('\n')
+        
+        # 按頻道清單順序寫出時此頻道的asset歸屬已確定，TXT 條目先暫存到磁碟
+        data = ''.join(f"{line}\n" for line in iter_txt_entries(channel_id, channel_details, name, self.asset_index))
+        data = data.encode('utf-8')
+        self._txt_offsets[channel_id] = (self._txt_spill.tell(), len(data))
+        self._txt_spill.write(data)
 
-def get_channel_info(channel_data, channel_id):
-    """獲取頻道基本資訊"""
-    try:
-        channel_details = extract_channel_details(channel_data)
-        if not channel_details:
-            return None
+    def iter_txt_lines(self):
+        """按頻道名稱順序逐頻道產生 TXT 內容 (需在 finish 之後執行)"""
+        try:
+            for channel_name in sorted(self.channels_by_name):
+                yield f"{channel_name},#genre#"
+                for channel_id in self.channels_by_name[channel_name]:
+                    offset, length = self._txt_offsets[channel_id]
+                    self._txt_spill.seek(offset)
+                    yield from self._txt_spill.read(length).decode('utf-8').splitlines()
+        finally:
+            self._txt_spill.close()
+
+def start_split_playlists(split_dir):
+    """準備分拆播放清單的暫存目錄，完成後由 finish_split_playlists 整體替換"""
+    tmp_dir = split_dir.parent / f"{split_dir.name}.tmp"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    (tmp_dir / 'channels').mkdir(parents=True)
+    return {'dir': split_dir, 'tmp_dir': tmp_dir, 'top': ['#EXTM3U'], 'channels': {}, 'groups': {}}
+
+def add_split_channel(split_state, channel_id, channel_details, entries):
+    """直播頻道直接放入頂層清單；點播頻道的選集寫入獨立子清單，頂層只保留一個指向子清單的條目"""
+    name = channel_details.get('name', 'Unknown')
+    picture = channel_details.get('picture', '')
+    group = channel_details.get('group', '默認分組')
+    channel_type = channel_details.get('type', 'live')
+    entry_count = len(entries) // 2
+    
+    if channel_type == 'vod':
+        playlist = f"channels/{channel_id}.m3u"
+        write_lines(split_state['tmp_dir'] / playlist, ['#EXTM3U'] + entries)
+        split_state['top'].append(f'#EXTINF:-1 tvg-id="{name}" tvg-name="{name}" '
+                                  f'tvg-logo="{picture}" group-title="{group}",{name} ({entry_count})')
+        split_state['top'].append(playlist)
+    else:
+        playlist = None
+        split_state['top'].extend(entries)
+    
+    split_state['groups'].setdefault(group, []).append(channel_id)
+    split_state['channels'][channel_id] = {
+        'name': name,
+        'group': group,
+        'type': channel_type,
+        'picture': picture,
+        'entries': entry_count,
+        'playlist': playlist
+    }
+
+def finish_split_playlists(split_state):
+    """寫出頂層清單與索引，並替換舊的分拆目錄，返回索引"""
+    tmp_dir = split_state['tmp_dir']
+    write_lines(tmp_dir / 'index.m3u', split_state['top'])
+    
+    channels = split_state['channels']
+    index = {
+        'generated_at': int(time.time()),
+        'playlist': 'index.m3u',
+        'total_channels': len(channels),
+        'total_entries': sum(channel['entries'] for channel in channels.values()),
+        'groups': {
+            group: {'channels': channel_ids, 'entries': sum(channels[c]['entries'] for c in channel_ids)}
+            for group, channel_ids in split_state['groups'].items()
+        },
+        'channels': channels
+    }
+    with open(tmp_dir / 'index.json', 'w', encoding='utf-8') as f:
+        json.dump(index, f, ensure_ascii=False, indent=2)
+    
+    split_dir = split_state['dir']
+    old_dir = split_dir.parent / f"{split_dir.name}.old"
+    shutil.rmtree(old_dir, ignore_errors=True)
+    if split_dir.exists():
+        split_dir.rename(old_dir)
+    tmp_dir.rename(split_dir)
+    shutil.rmtree(old_dir, ignore_errors=True)
+    return index
+
+def iter_txt_entries(channel_id, channel_details, channel_name, asset_index):
+    """逐條產生單一頻道的 TXT 條目，沿用 M3U 建立的全域asset索引判斷條目歸屬"""
+    if channel_details.get('type', 'live') != 'vod':
+        # 直播頻道：生成整個頻道的條目
+        yield f"{channel_name},http://localhost:5000/{channel_id}/index.m3u8"
+        return
+    
+    for position, program in enumerate(channel_details.get('programs', [])):
+        asset_id = program.get('asset_id')
         
-        name = channel_details.get('name', 'Unknown')
-        picture = channel_details.get('picture', '')
-        group = channel_details.get('group', '默認分組')
-        channel_type = channel_details.get('type', 'live')
+        # 只輸出在索引中歸屬於此頻道此位置的條目
+        if not asset_id or asset_index.get(asset_id) != (channel_id, position):
+            continue
         
-        return {
-            'name': name,
-            'picture': picture,
-            'group_title': group,
-            'content_id': channel_id,
-            'category': group,
-            'type': channel_type
-        }
-    except Exception as e:
-        print(f"❌ 獲取頻道 {channel_id} 資訊時發生錯誤: {e}")
-        return None
+        program_name = get_display_name(program.get('title', ''), program.get('subtitle', ''))
+        yield f"{program_name},http://localhost:5000/{channel_id}/index.m3u8?episode_id={asset_id}"
+
+def write_lines(file_path, lines, compressions=()):
+    """將逐行產生的內容串流寫入檔案 (及指定的壓縮變體)，返回寫入行數"""
+    line_count = 0
+    with CompressedOutput(file_path, compressions) as f:
+        for line in lines:
+            f.write(line)
+            f.write('\n')
+            line_count += 1
+    return line_count
 
 def ensure_output_dir():
-    """確保輸出目錄存在"""
-    output_dir = Path('../output')
+    """確保輸出目錄存在 (專案根目錄下的 output，不依賴當前工作目錄)"""
+    output_dir = Path(__file__).resolve().parent.parent / 'output'
     output_dir.mkdir(exist_ok=True)
     return output_dir
 
@@ -529,211 +611,182 @@ def generate_playout_channel_json(channel_ids):
     
     return playout_data
 
-def generate_ofiii_channel_ids(start=13, end=255):
-    """動態生成ofiii頻道ID列表"""
-    return [f"ofiii{i}" for i in range(start, end + 1)]
+async def get_cached_build_id():
+    """取得 build_id，同一進程內 (例如常駐模式) 在有效期內沿用，備用默認值不快取"""
+    if _build_id_cache['value'] and time.time() - _build_id_cache['fetched_at'] < BUILD_ID_TTL:
+        return _build_id_cache['value']
+    build_id = await get_build_id()
+    if build_id and build_id != FALLBACK_BUILD_ID:
+        _build_id_cache.update(value=build_id, fetched_at=time.time())
+    return build_id
 
-async def process_channel(channel_id, json_dir, asset_seen, channels_by_name, m3u_content):
-    """處理單個頻道 - 異步版本"""
+async def process_channel(channel_id, json_dir, pool, build_id=None):
+    """處理單個頻道 - 異步版本，只負責獲取頻道資料並交給解析進程池，返回是否獲取成功"""
     print(f"📋 處理頻道: {channel_id}")
     
-    # 獲取 build_id
-    build_id = await get_build_id()
+    # 獲取 build_id (所有頻道共用同一次查詢的結果)
+    build_id = build_id or await get_cached_build_id()
     if not build_id:
         print(f"❌ 無法獲取 build_id，跳過頻道 {channel_id}")
-        return 0, 0, 0, 0, None
+        return False
     
-    # 獲取頻道資料
+    # 獲取頻道資料，解碼、落地與解析在解析進程中進行，事件循環可繼續處理其他請求
     channel_json = await get_channel_data(channel_id, build_id)
-    
-    saved_json = 0
-    added_programs = 0
-    duplicate_assets = 0
-    channel_info = None
-    
-    if channel_json:
-        # 儲存頻道JSON資料
-        if save_channel_json(channel_id, channel_json, json_dir):
-            saved_json = 1
-            print(f"💾 已儲存 {channel_id}.json")
-        
-        # 獲取頻道基本資訊
-        channel_info = get_channel_info(channel_json, channel_id)
-        
-        # 生成M3U內容
-        channel_lines, programs_added, assets_duplicated = generate_m3u_content(channel_json, channel_id, asset_seen)
-        added_programs = programs_added
-        duplicate_assets = assets_duplicated
-        
-        if channel_lines:
-            # 直接將內容添加到 m3u_content 中
-            m3u_content.extend(channel_lines)
-            print(f"✅ 成功添加頻道 {channel_id} ({added_programs} 個節目)")
-        else:
-            print(f"⚠️ 跳過頻道 {channel_id} (無有效節目)")
-            
-        # 生成TXT內容
-        txt_programs, txt_duplicates = generate_txt_content(channel_json, channel_id, asset_seen.copy(), channels_by_name)
-        
-    else:
+    if not channel_json:
         print(f"❌ 無法獲取頻道 {channel_id} 資料")
+        return False
+    
+    pool.submit(channel_id, channel_json, json_dir)
+    return True
+
+async def crawl_channels(channel_ids, json_dir, on_result, workers=None, chunksize=DEFAULT_CHUNKSIZE):
+    """並發抓取頻道資料，由解析進程池落地為JSON並解析；每個頻道解析完成即交給 on_result(頻道ID, 詳細信息)，
+    抓取失敗的頻道交入 None，返回 (成功數, 失敗數, 儲存數)"""
+    counts = {'successful': 0, 'failed': 0, 'saved': 0}
     
-    return saved_json, added_programs, duplicate_assets, 1 if channel_json else 0, channel_info
+    # 使用信號量控制並發數量
+    semaphore = asyncio.Semaphore(5)  # 同時處理5個頻道
+    build_id = await get_cached_build_id()
+    print(f"🔖 build_id: {build_id}")
+    
+    with ParsePool(store_channel_payload, workers, chunksize) as pool:
+        def collect(results):
+            # 按提交順序交出解析結果，由 on_result 按頻道清單順序寫出後釋放
+            for channel_id, saved, channel_details in results:
+                counts['saved'] += int(saved)
+                counts['successful' if channel_details else 'failed'] += 1
+                on_result(channel_id, channel_details)
+        
+        async def process_with_semaphore(channel_id):
+            ok = False
+            try:
+                async with semaphore:
+                    ok = await process_channel(channel_id, json_dir, pool, build_id)
+                return ok
+            finally:
+                if not ok:
+                    on_result(channel_id, None)
+                # 邊抓取邊取回已完成的解析批次，不等待仍在解析的批次
+                collect(pool.ready())
+        
+        # 創建所有任務
+        tasks = [process_with_semaphore(channel_id) for channel_id in channel_ids]
+        
+        # 直接執行所有任務，不再分批和延遲
+        print(f"\n🔄 開始處理所有頻道...")
+        
+        # 執行所有任務
+        results = await asyncio.gather(*tasks, return_exceptions=True)
+        for result in results:
+            if isinstance(result, Exception):
+                print(f"❌ 處理頻道時發生異常: {result}")
+            if result is not True:
+                counts['failed'] += 1
+        
+        collect(pool.results())
+    
+    return counts['successful'], counts['failed'], counts['saved']
 
-async def main():
-    # 確保輸出目錄存在
+async def main(split=False, compressions=(), shard=None, merge=False, partial_directory=None,
+               from_archive=None, workers=None, chunksize=DEFAULT_CHUNKSIZE, run_id=None):
+    # 確保輸出目錄存在 (離線重建時直接使用已解析的結果，不需要暫存目錄)
     output_dir = ensure_output_dir()
-    json_dir = ensure_json_dir(output_dir)
+    json_dir = None if from_archive else ensure_json_dir(output_dir)
     m3u_file = output_dir / 'ofiii.m3u.txt'
     txt_file = output_dir / 'ofiii.txt.txt'
     channel_json_file = output_dir / 'ofiii_channel.json'
     playout_channel_json_file = output_dir / 'ofiii_playout-channel.json'
     
-    # 動態生成ofiii頻道ID列表（13-255）
-    ofiii_channels = generate_ofiii_channel_ids(13, 255)
-    
-    # 頻道ID列表（包含動態生成的ofiii頻道和其他頻道）
-    channel_ids = ofiii_channels + [
-        "nnews-zh",
-        "4gtv-4gtv009",
-        "4gtv-4gtv066",
-        "4gtv-4gtv040",
-        "4gtv-4gtv041",
-        "4gtv-4gtv051",
-        "4gtv-4gtv052",
-        "4gtv-4gtv074",
-        "4gtv-4gtv084",
-        "4gtv-4gtv085",
-        "4gtv-4gtv076",
-        "4gtv-4gtv102",
-        "4gtv-4gtv103",
-        "4gtv-4gtv104",
-        "4gtv-4gtv156",
-        "4gtv-4gtv158",
-        "litv-ftv16",
-        "litv-ftv17",
-        "litv-longturn01",
-        "litv-longturn02",
-        "litv-longturn03",
-        "litv-longturn11",
-        "litv-longturn12",
-        "litv-longturn14",
-        "litv-longturn18",
-        "litv-longturn19",
-        "litv-longturn20",
-        "litv-longturn21",
-        "litv-longturn22",
-        "iNEWS",
-        "daystar"
-    ]
-    
-    # M3U文件頭
-    m3u_content = ['#EXTM3U']
-    
-    # TXT文件內容 - 按頻道名稱組織
-    channels_by_name = {}  # 用於按頻道名稱組織頻道
-    
-    channel_data = {}
-    
-    # 用於追蹤已使用的asset_id
-    asset_seen = set()
-    
-    print("🚀 開始獲取頻道資料...")
-    print(f"📊 總共 {len(channel_ids)} 個頻道需要處理")
-    
-    successful_channels = 0
-    failed_channels = 0
-    skipped_channels = 0
-    total_programs = 0
-    total_duplicate_assets = 0
-    saved_json_files = 0
-    
-    # 使用信號量控制並發數量
-    semaphore = asyncio.Semaphore(5)  # 同時處理5個頻道
-    
-    async def process_with_semaphore(channel_id):
-        async with semaphore:
-            return await process_channel(channel_id, json_dir, asset_seen, channels_by_name, m3u_content)
-    
-    # 創建所有任務
-    tasks = [process_with_semaphore(channel_id) for channel_id in channel_ids]
-    
-    # 直接執行所有任務，不再分批和延遲
-    print(f"\n🔄 開始處理所有頻道...")
-    
-    # 執行所有任務
-    results = await asyncio.gather(*tasks, return_exceptions=True)
-    
-    # 處理結果
-    for result in results:
-        if isinstance(result, Exception):
-            failed_channels += 1
-            print(f"❌ 處理頻道時發生異常: {result}")
-            continue
-            
-        saved_json, added_programs, duplicate_assets, success, channel_info = result
-        
-        saved_json_files += saved_json
-        total_programs += added_programs
-        total_duplicate_assets += duplicate_assets
-        
-        if success:
-            successful_channels += 1
+    # 頻道ID列表（與 ofiii_epg.py 共用 ofiii_channels 登記表，ofiii 頻道在前）
+    channel_ids = channel_registry(ofiii_first=True)
+    partial_directory = partial_dir('ofiii_m3u', partial_directory)
+    partials = []
+    
+    if shard and not (from_archive or merge):
+        # 分片模式只輸出本分片的頻道JSON，由 --merge 統一生成播放清單
+        fetch_ids = select_shard(channel_ids, shard)
+        print("🚀 開始獲取頻道資料...")
+        print(f"📊 總共 {len(fetch_ids)} 個頻道需要處理 (分片 {shard[0]}/{shard[1]})")
+        _, _, saved_json_files = await crawl_channels(fetch_ids, json_dir, lambda *result: None, workers, chunksize)
+        zip_path = partial_path(partial_directory, shard, 'zip')
+        if create_channel_zip(json_dir, output_dir, zip_path):
+            write_partial_meta(zip_path, shard, run_id)
+            print(f"🧩 分片結果已寫入: {zip_path} ({saved_json_files} 個頻道JSON)")
+        cleanup_json_files(json_dir)
+        return
+    
+    # 各模式都在解析進程池中解析頻道，解析完成即按頻道清單順序串流寫入M3U，同時建立全域asset索引
+    print("\n🔄 生成 M3U 檔案內容...")
+    with PlaylistWriter(channel_ids, m3u_file, compressions, output_dir / 'ofiii_split' if split else None) as writer:
+        if from_archive:
+            # 離線重建：不連網，從落地的原始頻道資料並行解析後生成全部輸出
+            successful_channels = parse_archive_channels(from_archive, channel_ids, writer.add, workers, chunksize)
+            saved_json_files = 0
+            failed_channels = len(channel_ids) - successful_channels
+            print(f"✅ 離線解析 {successful_channels} 個頻道")
+        elif merge:
+            # 合併各分片落地的頻道JSON，之後按完整頻道清單生成輸出
+            partials = find_partials(partial_directory, 'zip', run_id)
+            for path in partials:
+                with zipfile.ZipFile(path) as zipf:
+                    zipf.extractall(json_dir)
+            successful_channels = parse_archive_channels(json_dir, channel_ids, writer.add, workers, chunksize)
+            saved_json_files = len(list(json_dir.glob("*.json")))
+            failed_channels = len(channel_ids) - successful_channels
+            print(f"🧩 已合併 {len(partials)} 個分片: {successful_channels} 個頻道")
         else:
-            failed_channels += 1
-        
-        # 保存頻道信息
-        if channel_info:
-            channel_data[channel_info['content_id']] = [
-                channel_info['name'],
-                channel_info['picture'],
-                channel_info['group_title']
-            ]
-    
-    # 生成TXT文件內容
+            print("🚀 開始獲取頻道資料...")
+            print(f"📊 總共 {len(channel_ids)} 個頻道需要處理")
+            successful_channels, failed_channels, saved_json_files = await crawl_channels(
+                channel_ids, json_dir, writer.add, workers, chunksize)
+        print(f"✅ M3U 檔案: {m3u_file} ({writer.finish()})")
+    stats = writer.stats
+    
+    # 按頻道名稱順序串流寫入TXT文件，逐頻道從暫存檔讀回
     print("\n🔄 生成 TXT 檔案內容...")
-    txt_content = generate_txt_vod_by_name(channels_by_name)
+    write_lines(txt_file, writer.iter_txt_lines(), compressions)
     
     # 去除重複的頻道資料
     print("\n🔄 檢查並移除重複頻道...")
-    unique_channel_data = remove_duplicate_channels(channel_data)
+    unique_channel_data = remove_duplicate_channels(writer.channel_data)
     
     # 生成ofiii_playout-channel.json
     print("\n🔄 生成ofiii_playout-channel.json...")
     playout_channel_data = generate_playout_channel_json(channel_ids)
     
-    # 寫入M3U文件
-    with open(m3u_file, 'w', encoding='utf-8') as f:
-        f.write('\n'.join(m3u_content))
-    
-    # 寫入TXT文件
-    with open(txt_file, 'w', encoding='utf-8') as f:
-        f.write(txt_content)
-    
     # 寫入channel.json文件
-    with open(channel_json_file, 'w', encoding='utf-8') as f:
+    with CompressedOutput(channel_json_file) as f:
         json.dump(unique_channel_data, f, ensure_ascii=False, indent=2)
     
     # 寫入ofiii_playout-channel.json文件
-    with open(playout_channel_json_file, 'w', encoding='utf-8') as f:
+    with CompressedOutput(playout_channel_json_file) as f:
         json.dump(playout_channel_data, f, ensure_ascii=False, indent=2)
     
-    # 建立頻道JSON壓縮檔
-    print(f"\n🗜️ 建立頻道JSON壓縮檔...")
-    if create_channel_zip(json_dir, output_dir):
-        print(f"✅ 成功建立 ofiii_channel.zip，包含 {saved_json_files} 個頻道JSON檔案")
+    cleaned_files = 0
+    if from_archive:
+        print(f"\n📦 離線重建，保留原始資料來源不變: {from_archive}")
+    else:
+        # 建立頻道JSON壓縮檔
+        print(f"\n🗜️ 建立頻道JSON壓縮檔...")
+        if create_channel_zip(json_dir, output_dir):
+            print(f"✅ 成功建立 ofiii_channel.zip，包含 {saved_json_files} 個頻道JSON檔案")
+        
+        # 清理暫存JSON檔案
+        print(f"\n🧹 清理暫存檔案...")
+        cleaned_files = cleanup_json_files(json_dir)
     
-    # 清理暫存JSON檔案
-    print(f"\n🧹 清理暫存檔案...")
-    cleaned_files = cleanup_json_files(json_dir)
+    if partials:
+        # 已合併的分片結果刪除，避免下一輪誤用
+        remove_partials(partials)
+        print(f"🧹 已刪除 {len(partials)} 個已合併的分片結果")
     
     print(f"\n🎉 檔案生成完成！")
     print(f"📊 統計資訊:")
     print(f"   ✅ 成功處理: {successful_channels} 個頻道")
     print(f"   ❌ 處理失敗: {failed_channels} 個頻道")
-    print(f"   📺 總節目數: {total_programs} 個節目")
+    print(f"   📺 總節目數: {stats['programs']} 個節目")
     print(f"   🔄 唯一頻道數: {len(unique_channel_data)} 個頻道")
-    print(f"   🔄 跳過重複asset_id: {total_duplicate_assets} 個")
+    print(f"   🔄 跳過重複asset_id: {stats['duplicate_assets']} 個")
     print(f"   💾 儲存JSON檔案: {saved_json_files} 個")
     print(f"   🧹 清理暫存檔案: {cleaned_files} 個")
     print(f"   📁 輸出檔案:")
@@ -744,4 +797,25 @@ async def main():
     print(f"      - {output_dir / 'ofiii_channel.zip'}")
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    parser = argparse.ArgumentParser(description='ofiii M3U 播放清單與頻道資料生成')
+    parser.add_argument('--split', action='store_true',
+                        help='同時輸出分拆播放清單：頂層清單 + 每個點播頻道一個子清單 + 索引 (output/ofiii_split)')
+    parser.add_argument('--compress', type=parse_compressions, default='',
+                        help='同時輸出壓縮檔，例如 gz 或 gz,zst (zst 需安裝 zstandard)')
+    parser.add_argument('--shard', type=parse_shard, default=None,
+                        help='只抓取第 i 個分片 (共 N 個，i 從 0 開始) 並寫出頻道JSON壓縮檔，例如 0/4')
+    parser.add_argument('--merge', action='store_true',
+                        help='合併所有分片的頻道JSON，生成完整的 M3U/TXT/JSON/ZIP 輸出')
+    parser.add_argument('--partial-dir', type=str, default=None,
+                        help=f"分片中間結果目錄 (默認: {partial_dir('ofiii_m3u')})")
+    parser.add_argument('--run-id', type=str, default=DEFAULT_RUN_ID,
+                        help='執行批次ID，寫入分片結果；合併時只接受同一批次的分片 (默認: GITHUB_RUN_ID 環境變量)')
+    parser.add_argument('--from-archive', nargs='?', const=DEFAULT_ARCHIVE, default=None,
+                        help=f'不連網，從落地的原始頻道資料 (ZIP 或目錄) 重建輸出 (不帶路徑時為 {DEFAULT_ARCHIVE})')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='解析頻道資料的進程數，1 表示在抓取進程中直接解析 (默認: CPU 核心數)')
+    parser.add_argument('--chunksize', type=int, default=DEFAULT_CHUNKSIZE,
+                        help=f'每批送到解析進程的頻道數 (默認: {DEFAULT_CHUNKSIZE})')
+    args = parser.parse_args()
+    asyncio.run(main(args.split, args.compress, args.shard, args.merge, args.partial_dir,
+                     args.from_archive, args.workers, args.chunksize, args.run_id))
@@ -0,0 +1,360 @@
+import os
+import re
+import sys
+import time
+import asyncio
+import hashlib
+import argparse
+import importlib
+from urllib.parse import urljoin, urlparse
+from collections import OrderedDict
+
+import aiohttp
+from aiohttp import web
+
+from channel_catalog import get_channel_catalog
+from segment_cache import SegmentCache, SEGMENT_CACHE_DIR, DEFAULT_MAX_BYTES
+
+# 4g_m3u8.py 檔名以數字開頭，只能透過 importlib 匯入
+fourgtv = importlib.import_module('4g_m3u8')
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 5000
+
+RESOLVE_TTL = 600        # 已解析的播放地址有效期 (秒)
+MASTER_TTL = 60          # 主播放清單快取有效期 (秒)
+MIN_MEDIA_TTL = 1        # 媒體播放清單快取最短有效期 (秒)
+MAX_VARIANTS = 4096      # 最多記錄的變體播放清單代號數
+MAX_SEGMENTS = 16384     # 最多記錄的分片代號數
+DEFAULT_PREFETCH = 3     # 每次分片請求後預取的後續分片數
+PREFETCH_CONCURRENCY = 8 # 同時進行的預取下載數
+UPSTREAM_TIMEOUT = 15
+UPSTREAM_CONNECTIONS = 64
+UPSTREAM_CONNECTIONS_PER_HOST = 16
+
+USER_AGENT = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/134.0.0.0 Safari/537.36'
+M3U8_CONTENT_TYPE = 'application/vnd.apple.mpegurl'
+SEGMENT_CONTENT_TYPES = {
+    '.ts': 'video/mp2t',
+    '.m4s': 'video/iso.segment',
+    '.mp4': 'video/mp4',
+    '.aac': 'audio/aac'
+}
+
+# ofiii 播放地址查詢接口
+OFIII_URLS_API = 'https://cdi.ofiii.com/ofiii_cdi/video/urls'
+OFIII_PROJECT_NUM = 'OFWEB00'
+
+_URI_ATTR_RE = re.compile(r'URI="([^"]+)"')
+_TARGET_DURATION_RE = re.compile(r'#EXT-X-TARGETDURATION:(\d+)')
+
+
+class TTLCache:
+    """帶有效期的非同步快取，同一個鍵的並發請求只會觸發一次上游抓取"""
+
+    def __init__(self, max_entries=4096):
+        self.max_entries = max_entries
+        self._entries = {}   # 鍵 -> (過期時間, 值)
+        self._inflight = {}  # 鍵 -> 進行中的抓取任務
+
+    def invalidate(self, key):
+        self._entries.pop(key, None)
+
+    def _purge(self, now):
+        if len(self._entries) < self.max_entries:
+            return
+        for key in [k for k, (expires, _) in self._entries.items() if expires <= now]:
+            del self._entries[key]
+
+    async def _fetch_and_store(self, key, ttl, fetch):
+        try:
+            value = await fetch()
+            if value is not None:
+                now = time.monotonic()
+                self._purge(now)
+                self._entries[key] = (now + (ttl(value) if callable(ttl) else ttl), value)
+            return value
+        finally:
+            self._inflight.pop(key, None)
+
+    async def get(self, key, ttl, fetch):
+        """返回快取值；過期或不存在時呼叫 fetch，ttl 可為秒數或依值計算秒數的函數"""
+        entry = self._entries.get(key)
+        if entry and entry[0] > time.monotonic():
+            return entry[1]
+
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._fetch_and_store(key, ttl, fetch))
+            self._inflight[key] = task
+        # shield：單一觀眾斷線不會取消其他觀眾共用的抓取
+        return await asyncio.shield(task)
+
+
+def playlist_ttl(text):
+    """媒體播放清單的快取時間取目標分片時長的一半"""
+    match = _TARGET_DURATION_RE.search(text)
+    target = int(match.group(1)) if match else 2
+    return max(MIN_MEDIA_TTL, target / 2)
+
+
+def is_master_playlist(text):
+    return '#EXT-X-STREAM-INF' in text
+
+
+def rewrite_playlist(text, base_url, rewrite_uri):
+    """將播放清單中的每個 URI (包含標籤中的 URI 屬性) 以 rewrite_uri(絕對地址) 取代"""
+    lines = []
+    for line in text.splitlines():
+        stripped = line.strip()
+        if not stripped:
+            continue
+        if stripped.startswith('#'):
+            lines.append(_URI_ATTR_RE.sub(
+                lambda m: f'URI="{rewrite_uri(urljoin(base_url, m.group(1)), tag=True)}"', stripped
+            ))
+        else:
+            lines.append(rewrite_uri(urljoin(base_url, stripped), tag=False))
+    return '\n'.join(lines) + '\n'
+
+
+class PinnedFileResponse(web.FileResponse):
+    """送完檔案後 (不論成功與否) 才釋放分片快取釘住的 FileResponse"""
+
+    def __init__(self, path, release, **kwargs):
+        super().__init__(path, **kwargs)
+        self._release = release
+
+    async def prepare(self, request):
+        try:
+            return await super().prepare(request)
+        finally:
+            if self._release:
+                release, self._release = self._release, None
+                release()
+
+
+class HlsRelay:
+    """按需解析 ofiii/4gtv 頻道並共用上游連線與播放清單快取的 HLS 中繼"""
+
+    def __init__(self, segment_cache=None, prefetch=DEFAULT_PREFETCH):
+        self.session = None
+        self.catalog = get_channel_catalog()
+        self.resolved = TTLCache()
+        self.playlists = TTLCache()
+        self.variants = OrderedDict()  # 代號 -> 上游變體播放清單地址
+        self.segments = OrderedDict()  # 代號 -> (上游分片地址, 媒體播放清單中緊接其後的分片地址)
+        self.segment_cache = segment_cache
+        self.prefetch = prefetch
+        self.prefetch_limiter = None
+        self.device_id = fourgtv.generate_random_device_id()
+        self.fsenc_key = fourgtv.generate_random_device_id()
+
+    async def start(self, app):
+        connector = aiohttp.TCPConnector(limit=UPSTREAM_CONNECTIONS, limit_per_host=UPSTREAM_CONNECTIONS_PER_HOST)
+        self.session = aiohttp.ClientSession(
+            connector=connector,
+            timeout=aiohttp.ClientTimeout(total=UPSTREAM_TIMEOUT),
+            headers={'User-Agent': USER_AGENT}
+        )
+        self.prefetch_limiter = asyncio.Semaphore(PREFETCH_CONCURRENCY)
+
+    async def close(self, app):
+        if self.session:
+            await self.session.close()
+
+    async def resolve_4gtv(self, channel):
+        """透過 4GTV App 接口取得播放地址 (同步請求，放在執行緒中執行)"""
+        return await asyncio.to_thread(
+            fourgtv.get_4gtv_channel_url_with_retry,
+            channel['fs4GTV_ID'],
+            channel.get('fnID', ''),
+            self.device_id,
+            self.fsenc_key,
+            fourgtv.generate_4gtv_auth(),
+            fourgtv.DEFAULT_USER_AGENT,
+            UPSTREAM_TIMEOUT
+        )
+
+    async def resolve_ofiii(self, channel_id, episode_id=None):
+        """透過 ofiii 播放地址接口取得直播頻道或選集的主播放清單"""
+        params = {
+            'device_id': self.device_id,
+            'media_type': 'vod' if episode_id else 'channel',
+            'asset_id': episode_id or channel_id,
+            'project_num': OFIII_PROJECT_NUM,
+            'puid': self.fsenc_key
+        }
+        async with self.session.get(OFIII_URLS_API, params=params,
+                                    headers={'Referer': 'https://www.ofiii.com/'}) as resp:
+            if resp.status != 200:
+                print(f"⚠️ ofiii 播放地址查詢失敗 {channel_id}: {resp.status}")
+                return None
+            data = await resp.json(content_type=None)
+        urls = data.get('AssetURLs') or []
+        return urls[0] if urls else None
+
+    async def resolve(self, channel_id, episode_id=None):
+        """解析頻道的主播放清單地址：選集與非 4GTV 目錄頻道走 ofiii，其餘走 4GTV"""
+        async def fetch():
+            channel = None if episode_id else self.catalog.get(channel_id)
+            url = await (self.resolve_4gtv(channel) if channel else self.resolve_ofiii(channel_id, episode_id))
+            if url:
+                print(f"🔗 已解析 {channel_id}{f' ({episode_id})' if episode_id else ''}")
+            return url
+
+        return await self.resolved.get(('resolve', channel_id, episode_id), RESOLVE_TTL, fetch)
+
+    def invalidate(self, channel_id, episode_id=None):
+        """捨棄已解析的播放地址 (包含 4g_m3u8 內部的播放地址快取)，下次請求重新解析"""
+        self.resolved.invalidate(('resolve', channel_id, episode_id))
+        channel = self.catalog.get(channel_id)
+        if channel:
+            fourgtv.cache_play_urls.pop(f"{channel_id}_{channel.get('fnID', '')}", None)
+
+    async def fetch_playlist(self, url, ttl):
+        """抓取上游播放清單，同一地址的並發請求合併為一次"""
+        async def fetch():
+            async with self.session.get(url) as resp:
+                if resp.status != 200:
+                    print(f"⚠️ 上游播放清單請求失敗 {resp.status}: {url}")
+                    return None
+                return str(resp.url), await resp.text()
+
+        # ttl 為函數時按播放清單文字計算有效期
+        entry_ttl = (lambda value: ttl(value[1])) if callable(ttl) else ttl
+        return await self.playlists.get(('playlist', url), entry_ttl, fetch)
+
+    def variant_uri(self, channel_id, url):
+        token = hashlib.sha1(url.encode('utf-8')).hexdigest()[:16]
+        self.variants[token] = url
+        self.variants.move_to_end(token)
+        while len(self.variants) > MAX_VARIANTS:
+            self.variants.popitem(last=False)
+        return f"/{channel_id}/v/{token}.m3u8"
+
+    def rewrite_master(self, channel_id, text, base_url):
+        """主播放清單中的變體指向中繼，其餘資源 (音軌/字幕/密鑰) 維持上游絕對地址"""
+        def rewrite_uri(url, tag):
+            if not tag or url.split('?')[0].endswith('.m3u8'):
+                return self.variant_uri(channel_id, url)
+            return url
+        return rewrite_playlist(text, base_url, rewrite_uri)
+
+    def segment_uri(self, channel_id, url, following=()):
+        # 保留副檔名，讓 FileResponse 能推斷內容類型
+        ext = os.path.splitext(urlparse(url).path)[1][:8]
+        token = hashlib.sha1(url.encode('utf-8')).hexdigest()[:16] + ext
+        self.segments[token] = (url, tuple(following))
+        self.segments.move_to_end(token)
+        while len(self.segments) > MAX_SEGMENTS:
+            self.segments.popitem(last=False)
+        return f"/{channel_id}/s/{token}"
+
+    def rewrite_media(self, channel_id, text, base_url):
+        """媒體播放清單中的資源改為上游絕對地址；啟用分片快取時改為指向中繼的分片代號"""
+        if self.segment_cache is None:
+            return rewrite_playlist(text, base_url, lambda url, tag: url)
+
+        # 先收集分片順序，讓每個分片代號記住其後 N 個分片以便預取
+        ordered = [
+            urljoin(base_url, line.strip()) for line in text.splitlines()
+            if line.strip() and not line.strip().startswith('#')
+        ]
+        following = {url: ordered[i + 1:i + 1 + self.prefetch] for i, url in enumerate(ordered)}
+
+        def rewrite_uri(url, tag):
+            return self.segment_uri(channel_id, url, following.get(url, ()) if not tag else ())
+        return rewrite_playlist(text, base_url, rewrite_uri)
+
+    async def handle_index(self, request):
+        channel_id = request.match_info['channel_id']
+        episode_id = request.query.get('episode_id') or None
+
+        master_url = await self.resolve(channel_id, episode_id)
+        if not master_url:
+            raise web.HTTPNotFound(text=f"無法解析頻道 {channel_id}")
+
+        result = await self.fetch_playlist(master_url, MASTER_TTL)
+        if result is None:
+            # 播放地址可能已失效，下次請求重新解析
+            self.invalidate(channel_id, episode_id)
+            raise web.HTTPBadGateway(text=f"無法獲取頻道 {channel_id} 的播放清單")
+
+        base_url, text = result
+        if is_master_playlist(text):
+            body = self.rewrite_master(channel_id, text, base_url)
+        else:
+            body = self.rewrite_media(channel_id, text, base_url)
+        return web.Response(text=body, content_type=M3U8_CONTENT_TYPE)
+
+    async def handle_variant(self, request):
+        channel_id = request.match_info['channel_id']
+        url = self.variants.get(request.match_info['token'])
+        if not url:
+            raise web.HTTPNotFound(text="未知的播放清單")
+
+        result = await self.fetch_playlist(url, playlist_ttl)
+        if result is None:
+            raise web.HTTPBadGateway(text=f"無法獲取頻道 {channel_id} 的媒體播放清單")
+
+        base_url, text = result
+        return web.Response(text=self.rewrite_media(channel_id, text, base_url), content_type=M3U8_CONTENT_TYPE)
+
+    async def handle_segment(self, request):
+        channel_id = request.match_info['channel_id']
+        entry = self.segments.get(request.match_info['token'])
+        if not entry:
+            raise web.HTTPNotFound(text="未知的分片")
+
+        url, following = entry
+        # 從下載前到檔案送完都釘住分片，避免其他請求觸發的淘汰刪除正要送出的檔案
+        key = self.segment_cache.pin(url)
+        try:
+            path = await self.segment_cache.fetch(self.session, url)
+            if path is None:
+                raise web.HTTPBadGateway(text=f"無法獲取頻道 {channel_id} 的分片")
+
+            if following:
+                self.segment_cache.prefetch(self.session, following, self.prefetch_limiter)
+            # FileResponse 在支援的平台上以 sendfile 直接從磁碟送出
+            content_type = SEGMENT_CONTENT_TYPES.get(os.path.splitext(path)[1], 'application/octet-stream')
+            return PinnedFileResponse(path, lambda: self.segment_cache.unpin(key),
+                                      headers={'Content-Type': content_type})
+        except BaseException:
+            self.segment_cache.unpin(key)
+            raise
+
+    def create_app(self):
+        app = web.Application()
+        app.on_startup.append(self.start)
+        app.on_cleanup.append(self.close)
+        app.router.add_get('/{channel_id}/index.m3u8', self.handle_index)
+        app.router.add_get('/{channel_id}/v/{token}.m3u8', self.handle_variant)
+        if self.segment_cache is not None:
+            app.router.add_get('/{channel_id}/s/{token}', self.handle_segment)
+        return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description='ofiii / 4GTV 本地 HLS 中繼')
+    parser.add_argument('--host', type=str, default=DEFAULT_HOST, help=f'監聽地址 (默認: {DEFAULT_HOST})')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT, help=f'監聽端口 (默認: {DEFAULT_PORT})')
+    parser.add_argument('--cache-dir', type=str, default=SEGMENT_CACHE_DIR, help=f'分片快取目錄 (默認: {SEGMENT_CACHE_DIR})')
+    parser.add_argument('--cache-size', type=int, default=DEFAULT_MAX_BYTES // (1024 * 1024),
+                        help=f'分片快取大小上限 MB，0 表示不快取分片 (默認: {DEFAULT_MAX_BYTES // (1024 * 1024)})')
+    parser.add_argument('--prefetch', type=int, default=DEFAULT_PREFETCH, help=f'每次分片請求後預取的後續分片數 (默認: {DEFAULT_PREFETCH})')
+    args = parser.parse_args()
+
+    segment_cache = None
+    if args.cache_size > 0:
+        segment_cache = SegmentCache(args.cache_dir, args.cache_size * 1024 * 1024)
+        print(f"💾 分片快取: {args.cache_dir} (上限 {args.cache_size} MB，已有 {segment_cache.total_bytes // (1024 * 1024)} MB)")
+
+    print(f"🚀 HLS 中繼啟動: http://{args.host}:{args.port}/{{channel_id}}/index.m3u8")
+    web.run_app(HlsRelay(segment_cache, max(0, args.prefetch)).create_app(), host=args.host, port=args.port, print=None)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
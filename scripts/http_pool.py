@@ -0,0 +1,22 @@
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+
+DEFAULT_POOL_SIZE = 32
+
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+
+def get_session(name='default', pool_size=DEFAULT_POOL_SIZE):
+    """取得進程內共用的 requests 會話，同一進程內的腳本共用連接池與 Keep-Alive 連接"""
+    with _sessions_lock:
+        session = _sessions.get(name)
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            _sessions[name] = session
+        return session
@@ -0,0 +1,42 @@
+import os
+import json
+import time
+
+NOW_NEXT_COUNT = 3           # 目前節目之後至少保留的節目數
+NOW_NEXT_WINDOW = 26 * 3600  # 索引的有效時段 (秒)：節目表每天產生一次，多留兩小時餘量
+
+
+def build_now_next(programs_by_channel, now=None, count=NOW_NEXT_COUNT, window=NOW_NEXT_WINDOW):
+    """為每個頻道保留目前節目、之後的 count 個節目及有效時段內開始的節目，記錄為 [開始, 結束, 節目名稱]"""
+    now = time.time() if now is None else now
+    valid_until = now + window
+
+    channels = {}
+    for channel, programs in programs_by_channel.items():
+        entries = []
+        for program in sorted(programs, key=lambda p: p['start']):
+            start = program['start'].timestamp()
+            end = program['end'].timestamp()
+            if end <= now:
+                continue
+            if start >= valid_until and len(entries) > count:
+                break
+            entries.append([int(start), int(end), program.get('programName', '')])
+        if entries:
+            channels[channel] = entries
+
+    return {
+        'generated_at': int(now),
+        'valid_until': int(valid_until),
+        'channels': channels
+    }
+
+
+def write_now_next(programs_by_channel, output_file, now=None, count=NOW_NEXT_COUNT, window=NOW_NEXT_WINDOW):
+    """寫出精簡的 now/next 索引 (頻道ID -> 節目陣列)，返回索引"""
+    index = build_now_next(programs_by_channel, now, count, window)
+    tmp_file = f"{output_file}.tmp"
+    with open(tmp_file, 'w', encoding='utf-8') as f:
+        json.dump(index, f, ensure_ascii=False, separators=(',', ':'))
+    os.replace(tmp_file, output_file)
+    return index
@@ -0,0 +1,52 @@
+# ofiii 節目表 (ofiii_epg.py) 與播放清單 (generate_ofiii_m3u.py) 共用的頻道登記表
+
+# 非ofiii頻道
+OTHER_CHANNELS = [
+    "nnews-zh",
+    "4gtv-4gtv009",
+    "4gtv-4gtv066",
+    "4gtv-4gtv040",
+    "4gtv-4gtv041",
+    "4gtv-4gtv051",
+    "4gtv-4gtv052",
+    "4gtv-4gtv074",
+    "4gtv-4gtv084",
+    "4gtv-4gtv085",
+    "4gtv-4gtv076",
+    "4gtv-4gtv102",
+    "4gtv-4gtv103",
+    "4gtv-4gtv104",
+    "4gtv-4gtv156",
+    "4gtv-4gtv158",
+    "litv-ftv16",
+    "litv-ftv17",
+    "litv-longturn01",
+    "litv-longturn02",
+    "litv-longturn03",
+    "litv-longturn11",
+    "litv-longturn12",
+    "litv-longturn14",
+    "litv-longturn18",
+    "litv-longturn19",
+    "litv-longturn20",
+    "litv-longturn21",
+    "litv-longturn22",
+    "iNEWS",
+    "daystar"
+]
+
+# ofiii 自有頻道的連續編號範圍 (含兩端)
+OFIII_CHANNEL_START = 13
+OFIII_CHANNEL_END = 255
+
+
+def ofiii_channel_ids(start=OFIII_CHANNEL_START, end=OFIII_CHANNEL_END):
+    """動態生成ofiii頻道ID列表"""
+    return [f"ofiii{i}" for i in range(start, end + 1)]
+
+
+def channel_registry(ofiii_first=False):
+    """完整頻道清單；節目表先列非ofiii頻道，播放清單先列ofiii頻道"""
+    if ofiii_first:
+        return ofiii_channel_ids() + OTHER_CHANNELS
+    return OTHER_CHANNELS + ofiii_channel_ids()
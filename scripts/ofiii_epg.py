@@ -11,9 +11,28 @@ import pytz
 from bs4 import BeautifulSoup
 from xml.etree import ElementTree as ET
 from xml.dom import minidom
+from channel_identity import ChannelIdentityMap, OUTPUT_DIR
+from now_next import write_now_next
+from epg_binary import write_epg_binary
+from compress_sink import CompressedOutput, parse_compressions
+from xmltv_shards import XmltvShardWriter, SHARD_MODES, parse_shard_modes
+from epg_db import DEFAULT_DB_FILE, write_epg_db
+from schedule_store import get_schedule_store
+from http_pool import get_session
+from ofiii_channels import OTHER_CHANNELS, OFIII_CHANNEL_START, OFIII_CHANNEL_END, channel_registry
+from crawl_shards import (parse_shard, select_shard, partial_dir, write_partial, find_partials, load_partials,
+                          remove_partials, order_by_registry, DEFAULT_RUN_ID)
+from payload_archive import DEFAULT_ARCHIVE, map_payloads
+from payload_schema import SchemaError, OfiiiProgramInfo, decode_ofiii_payload, ofiii_page_props
+from parse_pool import ParsePool, DEFAULT_CHUNKSIZE
 
 # 全局時區設置
 TAIPEI_TZ = pytz.timezone('Asia/Taipei')
+# LiTV 同樣播出的頻道：ofiii 清單中的 4gtv-*/litv-* 頻道與下列頻道
+LITV_CHANNEL_PREFIXES = ('4gtv-', 'litv-')
+LITV_EXTRA_CHANNELS = {'iNEWS'}
+LITV_LOGO_URL = "https://fino.svc.litv.tv/frontpage/channel/image/{channel_id}_cover.jpg"
+
 HEADERS = {
     'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
 }
@@ -32,56 +51,17 @@ def human_like_typing_effect(text, delay=0.03):
     print()
 
 def parse_channel_list():
-    """解析頻道清單檔案內容"""
-    # 非ofiii頻道
-    other_channels = [
-        "nnews-zh",
-        "4gtv-4gtv009",
-        "4gtv-4gtv066",
-        "4gtv-4gtv040",
-        "4gtv-4gtv041",
-        "4gtv-4gtv051",
-        "4gtv-4gtv052",
-        "4gtv-4gtv074",
-        "4gtv-4gtv084",
-        "4gtv-4gtv085",
-        "4gtv-4gtv076",
-        "4gtv-4gtv102",
-        "4gtv-4gtv103",
-        "4gtv-4gtv104",
-        "4gtv-4gtv156",
-        "4gtv-4gtv158",
-        "litv-ftv16",
-        "litv-ftv17",
-        "litv-longturn01",
-        "litv-longturn02",
-        "litv-longturn03",
-        "litv-longturn11",
-        "litv-longturn12",
-        "litv-longturn14",
-        "litv-longturn18",
-        "litv-longturn19",
-        "litv-longturn20",
-        "litv-longturn21",
-        "litv-longturn22",
-        "iNEWS",
-        "daystar"
-    ]
-    
-    # 生成ofiii13到ofiii255的連續頻道
-    ofiii_channels = [f"ofiii{i}" for i in range(13, 256)]
-    
-    # 合併所有頻道
-    channel_list = other_channels + ofiii_channels
+    """取得頻道清單 (與 generate_ofiii_m3u.py 共用 ofiii_channels 登記表)"""
+    channel_list = channel_registry()
     
     print(f"📡 總共 {len(channel_list)} 個頻道")
-    print(f"   - 非ofiii頻道: {len(other_channels)} 個")
-    print(f"   - ofiii頻道: {len(ofiii_channels)} 個 (ofiii13~ofiii255)")
+    print(f"   - 非ofiii頻道: {len(OTHER_CHANNELS)} 個")
+    print(f"   - ofiii頻道: {len(channel_list) - len(OTHER_CHANNELS)} 個 (ofiii{OFIII_CHANNEL_START}~ofiii{OFIII_CHANNEL_END})")
     
     return channel_list
 
-def fetch_epg_data(channel_id, max_retries=1):
-    """獲取指定頻道的電視節目表數據"""
+def fetch_epg_page(channel_id, max_retries=1):
+    """獲取指定頻道的頁面 HTML，解析交給 extract_next_data (可在解析進程池中執行)"""
     url = f"https://www.ofiii.com/channel/watch/{channel_id}"
     
     for attempt in range(max_retries):
@@ -91,27 +71,13 @@ def fetch_epg_data(channel_id, max_retries=1):
                 human_like_delay(0.5, 1.5)
             
             print(f"   🔍 嘗試 {attempt+1}/{max_retries}: 獲取 {channel_id}")
-            response = requests.get(url, headers=HEADERS, timeout=30)
+            response = get_session().get(url, headers=HEADERS, timeout=30)
             response.raise_for_status()
             
             if not response.text.strip():
                 print(f"   ⚠️ 響應內容為空: {channel_id}")
                 return None
-                
-            soup = BeautifulSoup(response.text, 'html.parser')
-            script_tag = soup.find('script', id='__NEXT_DATA__')
-            
-            if script_tag and script_tag.string:
-                try:
-                    data = json.loads(script_tag.string)
-                    print(f"   ✅ 成功獲取 {channel_id} 的數據")
-                    return data
-                except json.JSONDecodeError as e:
-                    print(f"   ⚠️ JSON解析失敗: {channel_id}, {str(e)}")
-                    return None
-            else:
-                print(f"   ⚠️ 未找到__NEXT_DATA__標簽: {channel_id}")
-                return None
+            return response.text
                 
         except requests.RequestException as e:
             wait_time = random.uniform(1, 3) * (attempt + 1)
@@ -121,156 +87,159 @@ def fetch_epg_data(channel_id, max_retries=1):
     print(f"   ❌ 無法獲取 電視節目表 數據: {channel_id}")
     return None
 
-def parse_live_epg_data(json_data, channel_id):
-    """解析直播頻道的電視節目表 JSON數據"""
-    if not json_data:
-        return []
-    
-    programs = []
+def extract_next_data(html, channel_id):
+    """從頻道頁面中取出 __NEXT_DATA__ 的 JSON 原文，解碼交給 decode_channel_page"""
+    soup = BeautifulSoup(html, 'html.parser')
+    script_tag = soup.find('script', id='__NEXT_DATA__')
+    
+    if script_tag and script_tag.string:
+        print(f"   ✅ 成功獲取 {channel_id} 的數據")
+        return script_tag.string.encode('utf-8')
+    else:
+        print(f"   ⚠️ 未找到__NEXT_DATA__標簽: {channel_id}")
+        return None
+
+def decode_channel_page(raw, channel_id):
+    """按 payload_schema 解碼頻道資料並取出 pageProps；結構改變時整份資料只提示一次"""
     try:
-        if not json_data.get('props') or not json_data['props'].get('pageProps') or not json_data['props']['pageProps'].get('channel'):
-            print(f"   ❌ JSON結構無效: {channel_id}")
-            return []
+        return ofiii_page_props(decode_ofiii_payload(raw))
+    except SchemaError as e:
+        print(f"   ❌ {channel_id}: {str(e)}")
+    except ValueError as e:
+        print(f"   ⚠️ JSON解析失敗: {channel_id}, {str(e)}")
+    return None
+
+def fetch_epg_data(channel_id, max_retries=1):
+    """獲取指定頻道的電視節目表數據 (已解碼的 pageProps)"""
+    html = fetch_epg_page(channel_id, max_retries)
+    raw = extract_next_data(html, channel_id) if html else None
+    return decode_channel_page(raw, channel_id) if raw else None
+
+def parse_live_epg_data(channel, channel_id):
+    """解析直播頻道的電視節目表"""
+    channel_name = channel.title if channel.title is not None else channel_id
+    programs = []
+    
+    for item in channel.Schedule:
+        try:
+            start_utc = datetime.datetime.strptime(
+                item.AirDateTime, "%Y-%m-%dT%H:%M:%SZ"
+            ).replace(tzinfo=pytz.utc)
+        except ValueError as e:
+            print(f"   ⚠️ 跳過無效的節目數據: {channel_id}, {str(e)}")
+            continue
         
-        schedule = json_data['props']['pageProps']['channel'].get('Schedule', [])
+        start_taipei = start_utc.astimezone(TAIPEI_TZ)
+        end_taipei = start_taipei + datetime.timedelta(seconds=item.Duration)
+        program_info = item.program or OfiiiProgramInfo()
         
-        for item in schedule:
-            try:
-                start_utc = datetime.datetime.strptime(
-                    item['AirDateTime'], "%Y-%m-%dT%H:%M:%SZ"
-                ).replace(tzinfo=pytz.utc)
-                start_taipei = start_utc.astimezone(TAIPEI_TZ)
-                
-                duration = datetime.timedelta(seconds=item.get('Duration', 0))
-                end_taipei = start_taipei + duration
-                
-                program_info = item.get('program', {})
-                
-                programs.append({
-                    "channelId": channel_id,
-                    "channelName": json_data['props']['pageProps']['channel'].get('title', channel_id),
-                    "programName": program_info.get('Title', '未知節目'),
-                    "description": program_info.get('Description', ''),
-                    "subtitle": program_info.get('SubTitle', ''),
-                    "start": start_taipei,
-                    "end": end_taipei
-                })
-                
-            except (KeyError, ValueError, TypeError) as e:
-                print(f"   ⚠️ 跳過無效的節目數據: {channel_id}, {str(e)}")
-                continue
-                
-    except (KeyError, TypeError, ValueError) as e:
-        print(f"   ❌ 解析直播電視節目表數據失敗: {str(e)}")
+        programs.append({
+            "channelId": channel_id,
+            "channelName": channel_name,
+            "programName": program_info.Title if program_info.Title is not None else '未知節目',
+            "description": program_info.Description,
+            "subtitle": program_info.SubTitle,
+            "start": start_taipei,
+            "end": end_taipei
+        })
     
     return programs
 
-def parse_vod_epg_data(json_data, channel_id):
-    """解析點播頻道的電視節目表 JSON數據"""
-    if not json_data:
+def parse_vod_epg_data(channel, channel_id):
+    """解析點播頻道的電視節目表"""
+    vod_schedule = channel.vod_channel_schedule
+    if vod_schedule is None:
+        print(f"   ⚠️ 點播頻道 {channel_id} 沒有節目表數據")
         return []
     
+    channel_name = channel.title if channel.title is not None else channel_id
     programs = []
-    try:
-        if not json_data.get('props') or not json_data['props'].get('pageProps') or not json_data['props']['pageProps'].get('channel'):
-            print(f"   ❌ JSON結構無效: {channel_id}")
-            return []
-        
-        channel_data = json_data['props']['pageProps']['channel']
-        vod_schedule = channel_data.get('vod_channel_schedule', {})
+    
+    for item in vod_schedule.programs:
+        if item.p_start == 0:
+            continue
         
-        if not vod_schedule:
-            print(f"   ⚠️ 點播頻道 {channel_id} 沒有節目表數據")
-            return []
+        try:
+            start_taipei = datetime.datetime.fromtimestamp(item.p_start / 1000, TAIPEI_TZ)
+        except (ValueError, OverflowError, OSError) as e:
+            print(f"   ⚠️ 跳過無效的時間格式: {channel_id}, {str(e)}")
+            continue
         
-        vod_programs = vod_schedule.get('programs', [])
+        end_taipei = start_taipei + datetime.timedelta(milliseconds=item.length)
         
-        for item in vod_programs:
-            try:
-                start_timestamp = item.get('p_start', 0)
-                if start_timestamp == 0:
-                    continue
-                    
-                start_taipei = datetime.datetime.fromtimestamp(start_timestamp / 1000, TAIPEI_TZ)
-                
-                duration_ms = item.get('length', 0)
-                duration = datetime.timedelta(milliseconds=duration_ms)
-                end_taipei = start_taipei + duration
-                
-                programs.append({
-                    "channelId": channel_id,
-                    "channelName": channel_data.get('title', channel_id),
-                    "programName": item.get('title', '未知節目'),
-                    "description": item.get('vod_channel_description', ''),
-                    "subtitle": item.get('subtitle', ''),
-                    "start": start_taipei,
-                    "end": end_taipei
-                })
-                
-            except (KeyError, ValueError, TypeError) as e:
-                print(f"   ⚠️ 跳過無效的時間格式: {channel_id}, {str(e)}")
-                continue
-            
-    except (KeyError, TypeError, ValueError) as e:
-        print(f"   ❌ 解析點播電視節目表數據失敗: {str(e)}")
+        programs.append({
+            "channelId": channel_id,
+            "channelName": channel_name,
+            "programName": item.title if item.title is not None else '未知節目',
+            "description": item.vod_channel_description,
+            "subtitle": item.subtitle,
+            "start": start_taipei,
+            "end": end_taipei
+        })
     
     return programs
 
-def parse_epg_data(json_data, channel_id):
-    """解析電視節目表 JSON數據，自動判斷直播或點播"""
-    if not json_data:
-        return []
-    
+def parse_epg_data(channel, channel_id):
+    """解析電視節目表，自動判斷直播或點播"""
+    if channel.content_type == 'vod-channel' or channel.vod_channel_schedule is not None:
+        print(f"   📹 檢測到點播頻道: {channel_id}")
+        return parse_vod_epg_data(channel, channel_id)
+    else:
+        print(f"   📺 檢測到直播頻道: {channel_id}")
+        return parse_live_epg_data(channel, channel_id)
+
+def get_channel_info(channel, channel_id):
+    """從頻道數據中提取頻道信息"""
+    # 獲取頻道logo
+    logo = channel.picture or ''
+    if logo and not logo.startswith("http"):
+        logo = f"https://p-cdnstatic.svc.litv.tv/{logo}"
+        # 將logo路徑中的_tv替換為_mobile以獲取移動版logo
+        if '_tv' in logo:
+            logo = logo.replace('_tv', '_mobile')
+    
+    return {
+        "channelName": channel.title if channel.title is not None else channel_id,
+        "id": channel_id,
+        "logo": logo,
+        "description": channel.description
+    }
+
+def load_previous_channel_info(json_file=os.path.join(OUTPUT_DIR, "ofiii.json")):
+    """讀取上次生成的頻道信息，沿用其他來源節目表時用於補齊頻道名稱與logo"""
     try:
-        channel_data = json_data['props']['pageProps']['channel']
-        content_type = channel_data.get('content_type', '')
-        
-        if content_type == 'vod-channel' or channel_data.get('vod_channel_schedule'):
-            print(f"   📹 檢測到點播頻道: {channel_id}")
-            return parse_vod_epg_data(json_data, channel_id)
-        else:
-            print(f"   📺 檢測到直播頻道: {channel_id}")
-            return parse_live_epg_data(json_data, channel_id)
-            
-    except (KeyError, TypeError, ValueError) as e:
-        print(f"   ❌ 判斷頻道類型失敗: {str(e)}")
-        return parse_live_epg_data(json_data, channel_id)
+        with open(json_file, 'r', encoding='utf-8') as f:
+            return {info['id']: info for info in json.load(f) if info.get('id')}
+    except (OSError, ValueError, TypeError, KeyError):
+        return {}
 
-def get_channel_info(json_data, channel_id):
-    """從JSON數據中提取頻道信息"""
-    if not json_data:
-        return None
-    
+def plan_reused_channels(channels):
+    """找出可以直接沿用 4gtv 等成本更低來源節目表的頻道"""
+    previous_info = load_previous_channel_info()
+    if not previous_info:
+        return {}, {}
+    
+    identity_map = ChannelIdentityMap.from_known_sources()
+    candidates = [
+        (channel_id, previous_info[channel_id]['channelName'])
+        for channel_id in channels
+        if channel_id in previous_info
+    ]
+    _, reused = get_schedule_store().plan_fetches(identity_map, 'ofiii', candidates)
+    return reused, previous_info
+
+def publish_schedules(programs):
+    """保存本次從 ofiii 抓取的節目表，供 Hami 等來源沿用"""
     try:
-        page_props = json_data.get('props', {}).get('pageProps', {})
-        channel_data = page_props.get('channel', {})
-        
-        # 獲取頻道名稱
-        channel_name = channel_data.get('title', channel_id)
-        
-        # 獲取頻道logo
-        logo = channel_data.get('picture', '')
-        if logo and not logo.startswith("http"):
-            logo = f"https://p-cdnstatic.svc.litv.tv/{logo}"
-            # 將logo路徑中的_tv替換為_mobile以獲取移動版logo
-            if '_tv' in logo:
-                logo = logo.replace('_tv', '_mobile')
-        
-        # 獲取頻道描述
-        description = channel_data.get('description', '')
-        
-        return {
-            "channelName": channel_name,
-            "id": channel_id,
-            "logo": logo,
-            "description": description
-        }
+        get_schedule_store().publish('ofiii', programs)
     except Exception as e:
-        print(f"   ❌ 提取頻道信息失敗: {channel_id}, {str(e)}")
-        return None
+        print(f"⚠️ 保存共用節目表失敗: {str(e)}")
+
+def get_ofiii_epg(reuse_schedules=True, shard=None, publish=publish_schedules, workers=None, chunksize=DEFAULT_CHUNKSIZE):
+    """獲取歐飛電視節目表；指定 shard=(i, N) 時只抓取屬於該分片的頻道
 
-def get_ofiii_epg():
-    """獲取歐飛電視節目表"""
+    本執行緒只負責抓取頁面，頁面解析按 chunksize 成批送到 workers 個進程中執行，與後續請求重疊。
+    """
     print("="*50)
     human_like_typing_effect("開始獲取歐飛電視節目表")
     print("="*50)
@@ -280,37 +249,70 @@ def get_ofiii_epg():
     if not channels:
         print("❌ 無法解析頻道清單")
         return [], []
+    if shard:
+        channels = select_shard(channels, shard)
+        print(f"🧩 分片 {shard[0]}/{shard[1]}: 負責 {len(channels)} 個頻道")
     
     all_channels_info = []
     all_programs = []
+    fetched_programs = []
     failed_channels = []
     
-    # 遍歷所有頻道
-    for idx, channel_id in enumerate(channels):
-        print(f"\n📡 處理頻道 [{idx+1}/{len(channels)}]: {channel_id}")
-        
-        # 獲取EPG數據
-        json_data = fetch_epg_data(channel_id)
-        if not json_data:
-            failed_channels.append(channel_id)
-            continue
+    # 與其他來源共享的實體頻道直接沿用已抓取的節目表
+    reused, previous_info = plan_reused_channels(channels) if reuse_schedules else ({}, {})
+    if reused:
+        print(f"♻️ {len(reused)} 個頻道將沿用其他來源的節目表")
+    
+    # 按頻道順序記錄結果：沿用的頻道直接填入 (頻道信息, 節目)，抓取的頻道留空待解析結果
+    slots = []
+    with ParsePool(parse_channel_page, workers, chunksize) as pool:
+        # 遍歷所有頻道
+        for idx, channel_id in enumerate(channels):
+            print(f"\n📡 處理頻道 [{idx+1}/{len(channels)}]: {channel_id}")
             
-        # 提取頻道信息
-        channel_info = get_channel_info(json_data, channel_id)
-        if channel_info:
-            all_channels_info.append(channel_info)
-            print(f"   ✅ 成功提取頻道信息: {channel_info['channelName']}")
-        else:
-            print(f"   ⚠️ 無法提取頻道信息: {channel_id}")
+            if channel_id in reused:
+                source, programs = reused[channel_id]
+                slots.append((previous_info[channel_id], programs))
+                print(f"   ♻️ 沿用 {source} 節目表: {len(programs)} 個節目")
+                continue
+            
+            # 獲取頁面，交給解析進程池
+            html = fetch_epg_page(channel_id)
+            if not html:
+                failed_channels.append(channel_id)
+                continue
+            pool.submit(channel_id, html)
+            slots.append(None)
+                
+            # 人類仿真: 隨機延遲
+            if idx < len(channels) - 1:
+                human_like_delay(1, 3)
         
-        # 解析節目數據
-        programs = parse_epg_data(json_data, channel_id)
-        all_programs.extend(programs)
-        print(f"   📺 解析到 {len(programs)} 個節目")
+        parsed = pool.results()
+        for slot in slots:
+            if slot is not None:
+                all_channels_info.append(slot[0])
+                all_programs.extend(slot[1])
+                continue
             
-        # 人類仿真: 隨機延遲
-        if idx < len(channels) - 1:
-            human_like_delay(1, 3)
+            channel_id, channel_info, programs = next(parsed)
+            if programs is None:
+                failed_channels.append(channel_id)
+                continue
+            
+            # 提取頻道信息
+            if channel_info:
+                all_channels_info.append(channel_info)
+                print(f"   ✅ 成功提取頻道信息: {channel_info['channelName']}")
+            else:
+                print(f"   ⚠️ 無法提取頻道信息: {channel_id}")
+            
+            # 解析節目數據
+            all_programs.extend(programs)
+            fetched_programs.extend(programs)
+            print(f"   📺 {channel_id} 解析到 {len(programs)} 個節目")
+    
+    publish(fetched_programs)
     
     # 統計結果
     print("\n" + "="*50)
@@ -337,12 +339,145 @@ def get_ofiii_epg():
     print("="*50)
     return all_channels_info, all_programs
 
-def generate_xmltv(channels_info, programs, output_file="ofiii.xml"):
-    """生成XMLTV格式的EPG數據，按照頻道一→頻道一節目→頻道二→頻道二節目的順序排列"""
+def parse_channel_data(page_props, channel_id):
+    """由已解碼的 pageProps 取得 (頻道ID, 頻道信息, 節目)；沒有數據時節目為 None"""
+    channel = page_props.channel if page_props else None
+    if channel is None:
+        if page_props:
+            print(f"   ❌ JSON結構無效，缺少 channel: {channel_id}")
+        return channel_id, None, None
+    return channel_id, get_channel_info(channel, channel_id), parse_epg_data(channel, channel_id)
+
+def parse_channel_page(channel_id, html):
+    """解析抓取到的頻道頁面 (在解析進程池中執行)"""
+    raw = extract_next_data(html, channel_id)
+    return parse_channel_data(decode_channel_page(raw, channel_id) if raw else None, channel_id)
+
+def parse_channel_payload(channel_id, raw):
+    """解析一份落地的原始頻道資料 (在解析進程池中執行)"""
+    return parse_channel_data(decode_channel_page(raw, channel_id), channel_id)
+
+def get_ofiii_epg_from_archive(source=DEFAULT_ARCHIVE, workers=None, chunksize=DEFAULT_CHUNKSIZE):
+    """從 ofiii_channel.zip 或頻道資料目錄離線重建節目表，不發出任何網路請求"""
+    channels = parse_channel_list()
+    print(f"📦 從 {source} 讀取頻道資料 ({workers or os.cpu_count()} 個進程並行解析)")
+    
+    all_channels_info = []
+    all_programs = []
+    for channel_id, channel_info, programs in map_payloads(parse_channel_payload, source, channels, workers, chunksize):
+        if channel_info:
+            all_channels_info.append(channel_info)
+        all_programs.extend(programs or [])
+    
+    missing = len(channels) - len(all_channels_info)
+    print(f"✅ 離線解析 {len(all_channels_info)} 個頻道, {len(all_programs)} 個節目"
+          + (f" (來源中缺少 {missing} 個頻道)" if missing else ""))
+    return all_channels_info, all_programs
+
+def is_litv_channel(channel_id):
+    """判斷頻道是否同時在 LiTV 播出"""
+    return channel_id.startswith(LITV_CHANNEL_PREFIXES) or channel_id in LITV_EXTRA_CHANNELS
+
+def extract_litv_epg(channels_info, programs):
+    """從本次已抓取的 ofiii 數據中挑出 LiTV 頻道，不需額外請求"""
+    litv_channels = [
+        dict(info, logo=LITV_LOGO_URL.format(channel_id=info['id']))
+        for info in channels_info
+        if is_litv_channel(info['id'])
+    ]
+    litv_ids = {info['id'] for info in litv_channels}
+    litv_programs = [program for program in programs if program['channelId'] in litv_ids]
+    
+    print(f"\n📺 LiTV 頻道: {len(litv_channels)} 個, 節目: {len(litv_programs)} 個")
+    return litv_channels, litv_programs
+
+def load_previous_litv(output_dir):
+    """讀取上次發布的 litv.json 與 litv.xml，返回 (頻道信息, 節目)；檔案不存在或無法解析時為空"""
+    try:
+        with open(os.path.join(output_dir, "litv.json"), 'r', encoding='utf-8') as f:
+            channels_info = [info for info in json.load(f) if info.get('id') and info.get('channelName')]
+    except (OSError, ValueError, TypeError, AttributeError):
+        return [], []
+    
+    ids_by_name = {info['channelName']: info['id'] for info in channels_info}
+    programs = []
+    try:
+        root = ET.parse(os.path.join(output_dir, "litv.xml")).getroot()
+    except (OSError, ET.ParseError):
+        return channels_info, []
+    
+    for elem in root.iter('programme'):
+        channel_name = elem.get('channel')
+        if channel_name not in ids_by_name:
+            continue
+        try:
+            start = datetime.datetime.strptime(elem.get('start', ''), '%Y%m%d%H%M%S %z')
+            end = datetime.datetime.strptime(elem.get('stop', ''), '%Y%m%d%H%M%S %z')
+        except ValueError:
+            continue
+        programs.append({
+            "channelId": ids_by_name[channel_name],
+            "channelName": channel_name,
+            "programName": elem.findtext('title', '未知節目'),
+            "description": elem.findtext('desc', ''),
+            "subtitle": elem.findtext('sub-title', ''),
+            "start": start.astimezone(TAIPEI_TZ),
+            "end": end.astimezone(TAIPEI_TZ)
+        })
+    return channels_info, programs
+
+# ofiii 頻道名稱中的宣傳註記，例如「台視《11/26即將下架》」
+_NAME_NOTE_RE = re.compile(r'[《【(（\[].*?[》】)）\]]')
+
+def merge_litv_channel(previous, fresh):
+    """逐欄位合併同一頻道的上次發布信息與本次抓取信息：
+    保留上次非空的描述；頻道名稱只在去除宣傳註記後仍不同時 (真正改名) 才採用新名稱"""
+    merged = dict(previous)
+    for field, value in fresh.items():
+        if value and field not in ('channelName', 'description'):
+            merged[field] = value
+    if not merged.get('description'):
+        merged['description'] = fresh.get('description', '')
+    fresh_name = _NAME_NOTE_RE.sub('', fresh.get('channelName') or '').strip()
+    if fresh_name and fresh_name != previous['channelName']:
+        merged['channelName'] = fresh_name
+    return merged
+
+def merge_litv_epg(litv_channels, litv_programs, output_dir):
+    """與上次發布的 LiTV 數據合併：本次抓取到的頻道逐欄位更新 (見 merge_litv_channel)，
+    不在 ofiii 清單中的頻道保留頻道信息與尚未結束的節目，避免以子集覆蓋已發布的檔案"""
+    previous_channels, previous_programs = load_previous_litv(output_dir)
+    fresh = {info['id']: info for info in litv_channels}
+    known = {info['id'] for info in previous_channels}
+    
+    channels = [merge_litv_channel(info, fresh[info['id']]) if info['id'] in fresh else info
+                for info in previous_channels]
+    channels.extend(info for info in litv_channels if info['id'] not in known)
+    
+    # 本次抓取的節目改用合併後的頻道名稱 (XMLTV 以頻道名稱關聯節目)
+    names = {info['id']: info['channelName'] for info in channels}
+    programs = [dict(program, channelName=names[program['channelId']]) for program in litv_programs]
+    
+    now = datetime.datetime.now(TAIPEI_TZ)
+    kept = [program for program in previous_programs if program['channelId'] not in fresh and program['end'] > now]
+    carried = len(channels) - len(fresh)
+    if carried:
+        print(f"📼 LiTV: {carried} 個頻道不在 ofiii 清單中，沿用上次發布的頻道信息與 {len(kept)} 個未結束的節目")
+    return channels, programs + kept
+
+def generate_xmltv(channels_info, programs, output_file="ofiii.xml",
+                   generator="OFIII-EPG-Generator", source="www.ofiii.com", now_next_file=None, binary_file=None,
+                   shard_dir=None, shard_modes=SHARD_MODES, compressions=(), keep_channel_order=False, channel_desc=True):
+    """生成XMLTV格式的EPG數據，按照頻道一→頻道一節目→頻道二→頻道二節目的順序排列；
+    指定 now_next_file / binary_file 時同時寫出 now/next 索引與二進位節目表，
+    指定 shard_dir 時在同一輪中寫出按頻道/日期的分片，compressions 指定同時輸出的壓縮變體；
+    keep_channel_order 為真時按 channels_info 的順序輸出並保留沒有節目的頻道 (litv.xml 的格式)，
+    channel_desc 為假時不寫出頻道描述"""
     print(f"\n📄 生成XMLTV檔案: {output_file}")
     human_like_typing_effect("正在生成XML格式的節目表數據...")
     
-    root = ET.Element("tv", generator="OFIII-EPG-Generator", source="www.ofiii.com")
+    root = ET.Element("tv", generator=generator, source=source)
+    shards = XmltvShardWriter(shard_dir, root.attrib, shard_modes) if shard_dir else None
     
     # 按照頻道名稱排序
     channels_info_sorted = sorted(channels_info, key=lambda x: x['channelName'])
@@ -356,11 +491,15 @@ def generate_xmltv(channels_info, programs, output_file="ofiii.xml"):
         programs_by_channel[channel_name].append(program)
     
     # 按照頻道名稱排序節目組
-    sorted_channel_names = sorted(programs_by_channel.keys())
+    if keep_channel_order:
+        sorted_channel_names = list(dict.fromkeys(info['channelName'] for info in channels_info))
+    else:
+        sorted_channel_names = sorted(programs_by_channel.keys())
     
     # 按照頻道一→頻道一節目→頻道二→頻道二節目的順序生成XML
     program_count = 0
     channel_count = 0
+    written_channels = {}
     
     for channel_name in sorted_channel_names:
         # 找到對應的頻道信息
@@ -383,13 +522,16 @@ def generate_xmltv(channels_info, programs, output_file="ofiii.xml"):
             ET.SubElement(channel_elem, "icon", src=channel_info['logo'])
         
         # 添加頻道描述到XMLTV
-        if channel_info.get('description'):
+        if channel_desc and channel_info.get('description'):
             ET.SubElement(channel_elem, "desc", lang="zh").text = channel_info['description']
         
         channel_count += 1
+        if shards:
+            shards.add_channel(channel_name, channel_elem)
+        written_channels[channel_name] = programs_by_channel.get(channel_name, [])
         
         # 添加該頻道的所有節目
-        channel_programs = programs_by_channel[channel_name]
+        channel_programs = written_channels[channel_name]
         # 按照開始時間排序節目
         channel_programs_sorted = sorted(channel_programs, key=lambda x: x['start'])
         
@@ -416,10 +558,16 @@ def generate_xmltv(channels_info, programs, output_file="ofiii.xml"):
                     ET.SubElement(program_elem, "desc", lang="zh").text = program['description']
                 
                 program_count += 1
+                if shards:
+                    shards.add_programme(channel_name, program_elem, program['start'])
             except Exception as e:
                 print(f"⚠️ 跳過無效的節目數據: {str(e)}")
                 continue
     
+    if shards:
+        manifest = shards.close()
+        print(f"🧩 分片已生成: {shard_dir} ({', '.join(f'{mode} {len(manifest[mode])} 個' for mode in manifest['modes'])})")
+    
     # 生成XML
     xml_str = ET.tostring(root, encoding='utf-8').decode('utf-8')
     
@@ -431,14 +579,22 @@ def generate_xmltv(channels_info, programs, output_file="ofiii.xml"):
         pretty_xml = xml_str.encode('utf-8')
     
     try:
-        with open(output_file, 'wb') as f:
+        with CompressedOutput(output_file, compressions) as f:
             f.write(pretty_xml)
         
         print(f"✅ XMLTV檔案已生成: {output_file}")
         print(f"📺 頻道數: {channel_count}")
         print(f"📺 節目數: {program_count}")
         print(f"📋 排列順序: 頻道一 → 頻道一節目 → 頻道二 → 頻道二節目 → ...")
-        print(f"💾 檔案大小: {os.path.getsize(output_file) / 1024:.2f} KB")
+        print(f"💾 檔案大小: {f.describe()}")
+        
+        if now_next_file:
+            write_now_next(written_channels, now_next_file)
+            print(f"⏱️ now/next 索引已生成: {now_next_file} ({os.path.getsize(now_next_file) / 1024:.2f} KB)")
+        
+        if binary_file:
+            write_epg_binary(written_channels, binary_file)
+            print(f"🧱 二進位節目表已生成: {binary_file} ({os.path.getsize(binary_file) / 1024:.2f} KB)")
         
         # 顯示XML結構示例
         print(f"\n📝 XML結構示例:")
@@ -462,7 +618,8 @@ def generate_json_file(channels_info, output_file="ofiii.json"):
     human_like_typing_effect("正在生成JSON格式的頻道數據...")
     
     try:
-        with open(output_file, 'w', encoding='utf-8') as f:
+        # 先寫暫存檔再替換，常駐模式刷新時讀取端不會讀到寫到一半的檔案
+        with CompressedOutput(output_file) as f:
             json.dump(channels_info, f, ensure_ascii=False, indent=2)
         
         print(f"✅ JSON檔案已生成: {output_file}")
@@ -479,40 +636,122 @@ def generate_json_file(channels_info, output_file="ofiii.json"):
         print(f"❌ 儲存JSON檔案失敗: {str(e)}")
         return False
 
+def run(output='output/ofiii.xml', reuse_schedules=True, db_path=None, shard_modes=None, compressions=(),
+        shard=None, merge=False, partial_directory=None, from_archive=None, workers=None, chunksize=DEFAULT_CHUNKSIZE,
+        run_id=None):
+    """抓取並生成 ofiii 與 LiTV 的節目表檔案，返回是否成功 (供命令行與 epg.py 調度器共用)
+
+    shard=(i, N) 時只抓取該分片並寫出中間結果；merge=True 時合併所有分片的中間結果後生成完整輸出，成功後刪除已合併的分片；
+    run_id 為執行批次ID，分片結果記錄此ID，合併時只接受同一批次的分片；
+    from_archive 指定落地的原始頻道資料 (ZIP 或目錄) 時離線重建全部輸出；
+    workers / chunksize 為解析進程數與每批送出的頁面數。
+    """
+    # 確保輸出目錄存在
+    output_dir = os.path.dirname(output)
+    if output_dir and not os.path.exists(output_dir):
+        os.makedirs(output_dir, exist_ok=True)
+        print(f"📁 建立輸出目錄: {output_dir}")
+    partial_directory = partial_dir('ofiii', partial_directory)
+    partials = []
+    
+    if from_archive:
+        # 離線重建：資料可能是舊的，不發布到共用節目表
+        channels_info, programs = get_ofiii_epg_from_archive(from_archive, workers, chunksize)
+    elif merge:
+        partials = find_partials(partial_directory, run_id=run_id)
+        channels_info, programs, fetched = load_partials(partials)
+        registry = channel_registry()
+        channels_info = order_by_registry(channels_info, registry, lambda info: info['id'])
+        programs = order_by_registry(programs, registry, lambda program: program['channelId'])
+        print(f"🧩 已合併 {partial_directory} 的分片: {len(channels_info)} 個頻道, {len(programs)} 個節目")
+        publish_schedules([program for program in programs if program['channelId'] in fetched])
+    elif shard:
+        fetched_programs = []
+        channels_info, programs = get_ofiii_epg(reuse_schedules, shard, fetched_programs.extend, workers, chunksize)
+        path = write_partial(partial_directory, shard, channels_info, programs,
+                             {program['channelId'] for program in fetched_programs}, run_id)
+        print(f"🧩 分片結果已寫入: {path}")
+        return True
+    else:
+        # 獲取EPG數據
+        channels_info, programs = get_ofiii_epg(reuse_schedules, workers=workers, chunksize=chunksize)
+    
+    if not channels_info:
+        print("❌ 未獲取到有效頻道信息，無法生成檔案")
+        return False
+        
+    # 生成XMLTV檔案
+    now_next_output = os.path.join(output_dir, "ofiii.now.json")
+    if not generate_xmltv(channels_info, programs, output, now_next_file=now_next_output,
+                          binary_file=os.path.splitext(output)[0] + ".epgb",
+                          shard_dir=os.path.join(output_dir, "shards", "ofiii") if shard_modes else None,
+                          shard_modes=shard_modes or SHARD_MODES, compressions=compressions):
+        return False
+        
+    # 生成JSON檔案
+    json_output = os.path.join(output_dir, "ofiii.json")
+    if not generate_json_file(channels_info, json_output):
+        print("⚠️ JSON檔案生成失敗，但XML已成功生成")
+    
+    if db_path:
+        write_epg_db(db_path, 'ofiii', channels_info, programs)
+    
+    # 由同一批數據生成 LiTV 節目表，並與上次發布的 LiTV 數據合併
+    litv_channels, litv_programs = extract_litv_epg(channels_info, programs)
+    if litv_channels:
+        litv_channels, litv_programs = merge_litv_epg(litv_channels, litv_programs, output_dir)
+        litv_xml = os.path.join(output_dir, "litv.xml")
+        if not generate_xmltv(litv_channels, litv_programs, litv_xml,
+                              generator="LITV-EPG-Generator", source="www.litv.tv",
+                              now_next_file=os.path.join(output_dir, "litv.now.json"),
+                              binary_file=os.path.join(output_dir, "litv.epgb"),
+                              compressions=compressions, keep_channel_order=True, channel_desc=False):
+            print("⚠️ LiTV XML檔案生成失敗")
+        if not generate_json_file(litv_channels, os.path.join(output_dir, "litv.json")):
+            print("⚠️ LiTV JSON檔案生成失敗")
+    
+    if partials:
+        remove_partials(partials)
+        print(f"🧹 已刪除 {len(partials)} 個已合併的分片結果")
+        
+    print("\n🎉 所有操作完成！")
+    return True
+
 def main():
     """主函數，處理命令行參數"""
     parser = argparse.ArgumentParser(description='歐飛電視節目表')
     parser.add_argument('--output', type=str, default='output/ofiii.xml', 
                        help='輸出XML檔案路徑 (默認: output/ofiii.xml)')
+    parser.add_argument('--no-reuse', action='store_true',
+                       help='不沿用其他來源已抓取的節目表，全部頻道都從 ofiii 抓取')
+    parser.add_argument('--db', nargs='?', const=DEFAULT_DB_FILE, default=os.environ.get('EPG_DB'),
+                       help=f'同時寫入 SQLite 資料庫 (不帶路徑時為 {DEFAULT_DB_FILE}，也可用 EPG_DB 環境變量指定)')
+    parser.add_argument('--shard-by', type=parse_shard_modes, default=None,
+                       help='同時輸出分片 XMLTV 到 output/shards/ofiii，例如 channel、day 或 channel,day')
+    parser.add_argument('--compress', type=parse_compressions, default='',
+                       help='同時輸出壓縮檔，例如 gz 或 gz,zst (zst 需安裝 zstandard)')
+    parser.add_argument('--shard', type=parse_shard, default=None,
+                       help='只抓取第 i 個分片 (共 N 個，i 從 0 開始) 並寫出中間結果，例如 0/4')
+    parser.add_argument('--merge', action='store_true',
+                       help='合併所有分片的中間結果，生成完整的 XML/JSON 輸出')
+    parser.add_argument('--partial-dir', type=str, default=None,
+                       help=f"分片中間結果目錄 (默認: {partial_dir('ofiii')})")
+    parser.add_argument('--run-id', type=str, default=DEFAULT_RUN_ID,
+                       help='執行批次ID，寫入分片結果；合併時只接受同一批次的分片 (默認: GITHUB_RUN_ID 環境變量)')
+    parser.add_argument('--from-archive', nargs='?', const=DEFAULT_ARCHIVE, default=None,
+                       help=f'不連網，從落地的原始頻道資料 (ZIP 或目錄) 重建輸出 (不帶路徑時為 {DEFAULT_ARCHIVE})')
+    parser.add_argument('--workers', type=int, default=None,
+                       help='解析頁面的進程數，1 表示在抓取進程中直接解析 (默認: CPU 核心數)')
+    parser.add_argument('--chunksize', type=int, default=DEFAULT_CHUNKSIZE,
+                       help=f'每批送到解析進程的頁面數 (默認: {DEFAULT_CHUNKSIZE})')
     
     args = parser.parse_args()
     
-    # 確保輸出目錄存在
-    output_dir = os.path.dirname(args.output)
-    if output_dir and not os.path.exists(output_dir):
-        os.makedirs(output_dir, exist_ok=True)
-        print(f"📁 建立輸出目錄: {output_dir}")
-    
     try:
-        # 獲取EPG數據
-        channels_info, programs = get_ofiii_epg()
-        
-        if not channels_info:
-            print("❌ 未獲取到有效頻道信息，無法生成檔案")
-            sys.exit(1)
-            
-        # 生成XMLTV檔案
-        xml_output = args.output
-        if not generate_xmltv(channels_info, programs, xml_output):
+        if not run(args.output, not args.no_reuse, args.db, args.shard_by, args.compress,
+                   args.shard, args.merge, args.partial_dir, args.from_archive, args.workers, args.chunksize,
+                   args.run_id):
             sys.exit(1)
-            
-        # 生成JSON檔案
-        json_output = os.path.join(output_dir, "ofiii.json")
-        if not generate_json_file(channels_info, json_output):
-            print("⚠️ JSON檔案生成失敗，但XML已成功生成")
-            
-        print("\n🎉 所有操作完成！")
-            
     except Exception as e:
         print(f"❌ 主程序錯誤: {str(e)}")
         import traceback
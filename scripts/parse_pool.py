@@ -0,0 +1,78 @@
+# CPU 密集的解析工作 (HTML/JSON 解碼、走訪節目表、建立字典、轉換日期) 交給進程池執行，
+# 抓取的執行緒或事件循環只負責網路，解析與後續請求得以重疊，並能用上多個核心
+
+import os
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+DEFAULT_CHUNKSIZE = 8
+
+
+def default_workers():
+    return os.cpu_count() or 1
+
+
+def _run_chunk(func, chunk):
+    return [func(*args) for args in chunk]
+
+
+class ParsePool:
+    """解析階段：每累積 chunksize 份資料送出一批到進程池，按提交順序返回精簡結果
+
+    func 需為模組層級函數 (可被 pickle)，返回值應只包含後續需要的欄位以減少進程間傳輸；
+    workers 為 1 時在本進程中直接執行。進程以 spawn 方式啟動，在 epg.py 等多執行緒的進程中也能安全使用。
+    """
+
+    def __init__(self, func, workers=None, chunksize=DEFAULT_CHUNKSIZE):
+        self.func = func
+        self.workers = max(1, workers or default_workers())
+        self.chunksize = max(1, chunksize)
+        self._executor = None
+        self._pending = []
+        self._batches = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def submit(self, *args):
+        """加入一份待解析的資料 (以 func 的參數傳入)"""
+        self._pending.append(args)
+        if len(self._pending) >= self.chunksize:
+            self._flush()
+
+    def _flush(self):
+        if not self._pending:
+            return
+        chunk, self._pending = self._pending, []
+        if self.workers == 1:
+            self._batches.append(_run_chunk(self.func, chunk))
+            return
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.workers,
+                                                 mp_context=multiprocessing.get_context('spawn'))
+        self._batches.append(self._executor.submit(_run_chunk, self.func, chunk))
+
+    def ready(self, backlog=None):
+        """按提交順序產生已完成批次的結果，不等待未完成的批次，讓呼叫端邊提交邊取回結果；
+        指定 backlog 時先等待最早的批次，直到未取回的批次不超過 backlog 個 (限制佔用的記憶體)"""
+        while self._batches:
+            batch = self._batches[0]
+            if not (isinstance(batch, list) or batch.done() or (backlog is not None and len(self._batches) > backlog)):
+                return
+            self._batches.pop(0)
+            yield from batch if isinstance(batch, list) else batch.result()
+
+    def results(self):
+        """送出剩餘資料，按提交順序逐一產生結果"""
+        self._flush()
+        batches, self._batches = self._batches, []
+        for batch in batches:
+            yield from batch if isinstance(batch, list) else batch.result()
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
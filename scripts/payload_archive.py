@@ -0,0 +1,52 @@
+# ofiii 原始頻道資料的離線讀取 (ofiii_epg.py 與 generate_ofiii_m3u.py 共用)
+# 來源可以是 generate_ofiii_m3u.py 落地的 output/ofiii_channel.zip，或任何存放 <頻道ID>.json 的目錄；
+# 讀取在本進程中逐份串流進行，解碼 (payload_schema) 與解析交給進程池並行執行
+
+import os
+import zipfile
+
+from cookie_store import BASE_DIR
+from parse_pool import ParsePool, DEFAULT_CHUNKSIZE
+
+DEFAULT_ARCHIVE = os.path.join(BASE_DIR, 'output', 'ofiii_channel.zip')
+
+
+def _payload_names(names):
+    """{頻道ID: 檔名}，只收錄 .json 檔案"""
+    return {
+        os.path.splitext(os.path.basename(name))[0]: name
+        for name in names
+        if name.endswith('.json') and not name.endswith('/')
+    }
+
+
+def iter_payloads(source, channel_ids=None):
+    """逐份產生 (頻道ID, 原始位元組)；指定 channel_ids 時只讀取其中的頻道並按其順序，缺少的頻道略過"""
+    if os.path.isdir(source):
+        names = _payload_names(os.listdir(source))
+        for channel_id in channel_ids if channel_ids is not None else sorted(names):
+            if channel_id in names:
+                with open(os.path.join(source, names[channel_id]), 'rb') as f:
+                    yield channel_id, f.read()
+        return
+
+    if not zipfile.is_zipfile(source):
+        raise ValueError(f"找不到頻道資料來源或不是 ZIP 檔/目錄: {source}")
+    with zipfile.ZipFile(source) as archive:
+        names = _payload_names(archive.namelist())
+        for channel_id in channel_ids if channel_ids is not None else sorted(names):
+            if channel_id in names:
+                yield channel_id, archive.read(names[channel_id])
+
+
+def map_payloads(func, source, channel_ids=None, workers=None, chunksize=DEFAULT_CHUNKSIZE):
+    """在解析進程池中對每份資料執行 func(頻道ID, 原始位元組)，按讀取順序產生結果
+
+    func 需為模組層級函數 (可被 pickle)；workers 默認為 CPU 核心數，為 1 時直接在本進程執行。
+    """
+    with ParsePool(func, workers, chunksize) as pool:
+        for channel_id, raw in iter_payloads(source, channel_ids):
+            pool.submit(channel_id, raw)
+            # 邊讀取邊交出已完成的結果，未取回的批次最多約為進程數的兩倍
+            yield from pool.ready(backlog=pool.workers * 2)
+        yield from pool.results()
@@ -0,0 +1,154 @@
+# 各來源回應的型別化結構 (ofiii 頻道資料、4GTV 節目表與頻道目錄、Hami UIInfo)
+# 以 msgspec 直接把 JSON 解碼為結構體：只建立結構中列出的欄位，其餘內容在解碼時略過，型別檢查也在解碼中一併完成；
+# 結構不符時整份回應拋出一個 SchemaError，而不是在走訪節目時逐個出錯
+
+from typing import List, Optional, Union
+
+import msgspec
+
+
+class SchemaError(ValueError):
+    """回應的結構與預期不符 (通常是來源改版)，訊息中帶有出錯欄位的路徑"""
+
+    def __init__(self, source, detail):
+        super().__init__(f"{source} 回應結構已改變: {detail}")
+        self.source = source
+        self.detail = detail
+
+
+def struct(name, fields):
+    """定義結構：fields 為 [(欄位, 型別)] 或 [(欄位, 型別, 默認值)]，沒有默認值的欄位為必要欄位"""
+    return msgspec.defstruct(name, fields, module=__name__)
+
+
+def decode(raw, schema, source):
+    """把原始位元組/字串解碼為 schema；不是有效 JSON 時拋出 ValueError，結構不符時拋出 SchemaError"""
+    try:
+        return msgspec.json.decode(raw, type=schema)
+    except msgspec.ValidationError as e:
+        raise SchemaError(source, str(e)) from None
+    except msgspec.DecodeError as e:
+        raise ValueError(f"{source} 回應不是有效的 JSON: {e}") from None
+
+
+def to_dict(obj):
+    """把結構體轉回字典 (淺層)，略過值為 None 的欄位，讓讀取端的 dict.get 默認值照常生效"""
+    return {field: getattr(obj, field) for field in obj.__struct_fields__ if getattr(obj, field) is not None}
+
+
+# ofiii 頻道資料：_next/data 返回 {pageProps}，頁面中的 __NEXT_DATA__ 為 {props: {pageProps}}
+OfiiiProgramInfo = struct('OfiiiProgramInfo', [
+    ('Title', Optional[str], None),
+    ('Description', Optional[str], ''),
+    ('SubTitle', Optional[str], ''),
+])
+OfiiiScheduleItem = struct('OfiiiScheduleItem', [
+    ('AirDateTime', str),
+    ('Duration', int, 0),
+    ('program', Optional[OfiiiProgramInfo], None),
+])
+OfiiiVodProgram = struct('OfiiiVodProgram', [
+    ('p_start', int, 0),
+    ('length', int, 0),
+    ('asset_id', Optional[str], None),
+    ('title', Optional[str], None),
+    ('subtitle', Optional[str], ''),
+    ('vod_channel_description', Optional[str], ''),
+    ('picture', Optional[str], ''),
+])
+OfiiiVodSchedule = struct('OfiiiVodSchedule', [
+    ('programs', List[OfiiiVodProgram], []),
+])
+OfiiiStationCategory = struct('OfiiiStationCategory', [
+    ('Name', Optional[str], None),
+])
+OfiiiChannel = struct('OfiiiChannel', [
+    ('title', Optional[str], None),
+    ('picture', Optional[str], ''),
+    ('description', Optional[str], ''),
+    ('content_type', Optional[str], ''),
+    ('station_categories', List[OfiiiStationCategory], []),
+    ('Schedule', List[OfiiiScheduleItem], []),
+    ('vod_channel_schedule', Optional[OfiiiVodSchedule], None),
+])
+OfiiiIntroduction = struct('OfiiiIntroduction', [
+    ('image', Optional[str], ''),
+])
+OfiiiPageProps = struct('OfiiiPageProps', [
+    ('channel', Optional[OfiiiChannel], None),
+    ('introduction', Optional[OfiiiIntroduction], None),
+])
+OfiiiNextProps = struct('OfiiiNextProps', [
+    ('pageProps', Optional[OfiiiPageProps], None),
+])
+OfiiiPayload = struct('OfiiiPayload', [
+    ('pageProps', Optional[OfiiiPageProps], None),
+    ('props', Optional[OfiiiNextProps], None),
+])
+
+# 4GTV 節目表 ProgList/<頻道ID>.txt：節目陣列
+FourgtvProgram = struct('FourgtvProgram', [
+    ('sdate', str),
+    ('stime', str),
+    ('edate', str),
+    ('etime', str),
+    ('title', str),
+    ('content', Optional[str], ''),
+])
+
+# 4GTV 頻道目錄 GetChannelBySetId：只保留各腳本用到的欄位
+FourgtvChannel = struct('FourgtvChannel', [
+    ('fs4GTV_ID', str),
+    ('fsNAME', Optional[str], None),
+    ('fnID', Union[int, str, None], None),
+    ('fsTYPE_NAME', Optional[str], None),
+    ('fsLOGO_MOBILE', Optional[str], None),
+    ('fsDESCRIPTION', Optional[str], None),
+])
+FourgtvChannelSet = struct('FourgtvChannelSet', [
+    ('Success', Optional[bool], False),
+    ('Data', Optional[List[FourgtvChannel]], None),
+])
+
+# Hami getUILayoutById (頻道一覽) 與 getEpgByContentIdAndDate 共用的 UIInfo 結構
+HamiProgramInfo = struct('HamiProgramInfo', [
+    ('hintSE', str),
+    ('programName', Optional[str], ''),
+    ('description', Optional[str], ''),
+])
+HamiElement = struct('HamiElement', [
+    ('contentPk', Optional[str], ''),
+    ('title', Optional[str], ''),
+    ('programInfo', List[HamiProgramInfo], []),
+])
+HamiUIBlock = struct('HamiUIBlock', [
+    ('title', Optional[str], None),
+    ('elements', List[HamiElement], []),
+])
+HamiLayout = struct('HamiLayout', [
+    ('UIInfo', List[HamiUIBlock], []),
+])
+
+
+def decode_ofiii_payload(raw):
+    """解碼 ofiii 頻道資料 (兩種形狀皆可)，用 ofiii_page_props 取出 pageProps"""
+    return decode(raw, OfiiiPayload, 'ofiii 頻道資料')
+
+
+def ofiii_page_props(payload):
+    """取出 pageProps，兩種形狀都沒有時返回 None"""
+    if payload.pageProps is not None:
+        return payload.pageProps
+    return payload.props.pageProps if payload.props is not None else None
+
+
+def decode_fourgtv_programs(raw):
+    return decode(raw, List[FourgtvProgram], '4GTV 節目表')
+
+
+def decode_fourgtv_channel_set(raw):
+    return decode(raw, FourgtvChannelSet, '4GTV 頻道目錄')
+
+
+def decode_hami_layout(raw):
+    return decode(raw, HamiLayout, 'Hami UIInfo')
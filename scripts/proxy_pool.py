@@ -0,0 +1,319 @@
+import os
+import sys
+import time
+import random
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from rate_limiter import RateLimiter
+from cookie_store import proxy_fingerprint
+
+PROXY_PROBE_URL = os.environ.get('PROXY_PROBE_URL', 'https://httpbin.org/ip')
+PROBE_TIMEOUT = 10
+HEALTH_INTERVAL = 300        # 健康檢查的間隔 (秒)
+MAX_CONSECUTIVE_FAILURES = 3  # 連續失敗多少次後暫停使用
+COOLDOWN = 120               # 暫停使用的秒數，之後由健康檢查決定是否恢復
+LATENCY_ALPHA = 0.3          # 延遲指數移動平均的權重
+DEFAULT_LATENCY = 1.0
+
+
+def parse_proxy_line(line):
+    """解析一行代理設定 '地址 [權重]'，空行與 # 註解返回 None"""
+    line = line.split('#', 1)[0].strip()
+    if not line:
+        return None
+    parts = line.split()
+    weight = float(parts[1]) if len(parts) > 1 else 1.0
+    return parts[0], weight
+
+
+def load_proxies(path=None, env=None):
+    """讀取代理清單：檔案 (每行一個) 或 PROXY_POOL 環境變量 (以逗號或空白分隔)，返回 [(地址, 權重)]"""
+    env = os.environ if env is None else env
+    lines = []
+    path = path or env.get('PROXY_FILE')
+    if path:
+        with open(path, 'r', encoding='utf-8') as f:
+            lines.extend(f)
+    lines.extend(env.get('PROXY_POOL', '').replace(',', '\n').splitlines())
+
+    proxies = {}
+    for line in lines:
+        parsed = parse_proxy_line(line)
+        if parsed:
+            proxies[parsed[0]] = parsed[1]
+    return list(proxies.items())
+
+
+class ProxyState:
+    """單一代理的健康狀態、延遲與專屬速率限制"""
+
+    def __init__(self, url, weight=1.0, rate=0):
+        self.url = url
+        self.weight = weight
+        self.limiter = RateLimiter(rate)
+        self.latency = None
+        self.successes = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.healthy = True
+        self.cooldown_until = 0
+        self.checked_at = 0
+
+    @property
+    def name(self):
+        """不含帳號密碼的代理名稱，用於日誌"""
+        return 'direct' if not self.url else f"proxy-{proxy_fingerprint(self.url)[:8]}"
+
+    def proxies(self):
+        return {'http': self.url, 'https': self.url} if self.url else {}
+
+    def score(self, now):
+        """權重 × 成功率 / 延遲；不健康或暫停中的代理為 0"""
+        if not self.healthy or now < self.cooldown_until:
+            return 0.0
+        success_ratio = (self.successes + 1) / (self.successes + self.failures + 2)
+        return self.weight * success_ratio / max(0.05, self.latency or DEFAULT_LATENCY)
+
+    def snapshot(self, now):
+        return {
+            'name': self.name,
+            'healthy': self.healthy,
+            'cooling_down': now < self.cooldown_until,
+            'latency_ms': round(self.latency * 1000) if self.latency is not None else None,
+            'successes': self.successes,
+            'failures': self.failures,
+            'score': round(self.score(now), 3)
+        }
+
+
+class ProxyPool:
+    """代理池：定期探測健康與延遲，按分數加權輪換，並對每個代理單獨限速
+
+    所有代理都不可用時，allow_direct 為真則退回直接連接並提示，否則繼續使用最早恢復的代理。
+    probe_url 為 None 時不做健康探測，代理只按請求結果暫停與恢復。
+    """
+
+    def __init__(self, proxies, rate=0, probe_url=PROXY_PROBE_URL, health_interval=HEALTH_INTERVAL,
+                 allow_direct=False, log=print):
+        self.members = [ProxyState(url, weight, rate) for url, weight in proxies]
+        self.direct = ProxyState('', 1.0, rate)
+        self.allow_direct = allow_direct
+        self.probe_url = probe_url
+        self.health_interval = health_interval
+        self.log = log
+        self._lock = threading.Lock()
+        self._checking = None
+        self._checked_at = 0
+        self._on_direct = False
+
+    def __len__(self):
+        return len(self.members)
+
+    def _probe(self, state):
+        started = time.perf_counter()
+        try:
+            resp = requests.get(self.probe_url, proxies=state.proxies(), timeout=PROBE_TIMEOUT)
+            ok = resp.status_code == 200
+        except requests.RequestException:
+            ok = False
+        latency = time.perf_counter() - started
+        with self._lock:
+            state.checked_at = time.time()
+            state.healthy = ok
+            if ok:
+                state.consecutive_failures = 0
+                state.cooldown_until = 0
+                state.latency = latency if state.latency is None else (
+                    LATENCY_ALPHA * latency + (1 - LATENCY_ALPHA) * state.latency)
+        return ok
+
+    def check_health(self):
+        """並發探測所有代理，返回健康的代理數"""
+        if not self.members:
+            return 0
+        if not self.probe_url:
+            return sum(state.healthy for state in self.members)
+        with ThreadPoolExecutor(max_workers=min(16, len(self.members))) as executor:
+            results = list(executor.map(self._probe, self.members))
+        self._checked_at = time.time()
+        healthy = sum(results)
+        self.log(f"🔌 代理健康檢查: {healthy}/{len(self.members)} 個可用")
+        return healthy
+
+    def _maybe_recheck(self):
+        """超過檢查間隔時在背景重新探測，不阻塞取用代理的工作執行緒"""
+        if not self.probe_url or time.time() - self._checked_at < self.health_interval:
+            return
+        with self._lock:
+            if self._checking and self._checking.is_alive():
+                return
+            self._checked_at = time.time()
+            self._checking = threading.Thread(target=self.check_health, name='proxy-health', daemon=True)
+            self._checking.start()
+
+    def choose(self):
+        """按分數加權隨機選出一個代理"""
+        if not self.members:
+            return self.direct
+        self._maybe_recheck()
+        now = time.time()
+        with self._lock:
+            scored = [(state, state.score(now)) for state in self.members]
+        candidates = [(state, score) for state, score in scored if score > 0]
+        if not candidates:
+            if not self.allow_direct:
+                return min(self.members, key=lambda state: (not state.healthy, state.cooldown_until))
+            if not self._on_direct:
+                self._on_direct = True
+                self.log(f"⚠️ 代理池中沒有可用的代理 ({len(self.members)} 個)，暫時使用直接連接")
+            return self.direct
+        if self._on_direct:
+            self._on_direct = False
+            self.log("🔌 代理已恢復，停止使用直接連接")
+        pick = random.uniform(0, sum(score for _, score in candidates))
+        for state, score in candidates:
+            pick -= score
+            if pick <= 0:
+                return state
+        return candidates[-1][0]
+
+    def acquire(self):
+        """選出代理並等待它的速率限制，返回 ProxyState"""
+        state = self.choose()
+        state.limiter.acquire()
+        return state
+
+    def report(self, state, ok, latency=None):
+        """回報一次請求的結果，連續失敗的代理會暫停使用一段時間"""
+        with self._lock:
+            if ok:
+                state.successes += 1
+                state.consecutive_failures = 0
+                if latency is not None:
+                    state.latency = latency if state.latency is None else (
+                        LATENCY_ALPHA * latency + (1 - LATENCY_ALPHA) * state.latency)
+                return
+            state.failures += 1
+            state.consecutive_failures += 1
+            if state is not self.direct and state.consecutive_failures >= MAX_CONSECUTIVE_FAILURES:
+                state.cooldown_until = time.time() + COOLDOWN
+                state.consecutive_failures = 0
+                self.log(f"⚠️ {state.name} 連續失敗，暫停使用 {COOLDOWN} 秒")
+
+    def snapshot(self):
+        now = time.time()
+        return [state.snapshot(now) for state in self.members + [self.direct]]
+
+
+class _StandInProxy(BaseHTTPRequestHandler):
+    """自我檢查用的本地代理：直接以 200 回應所有經由它轉發的請求並計數"""
+
+    def do_GET(self):
+        self.server.hits += 1
+        body = b'{"origin": "127.0.0.1"}'
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def _start_stand_in_proxy():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), _StandInProxy)
+    server.hits = 0
+    threading.Thread(target=server.serve_forever, name='stand-in-proxy', daemon=True).start()
+    return server
+
+
+def _closed_port_url():
+    """返回一個沒有服務在監聽的本地地址，作為不可用的代理"""
+    server = ThreadingHTTPServer(('127.0.0.1', 0), _StandInProxy)
+    port = server.server_address[1]
+    server.server_close()
+    return f"http://127.0.0.1:{port}"
+
+
+def self_check(rounds=4000):
+    """以本地替身代理檢查健康探測、加權輪換、連續失敗暫停與直接連接退回，返回是否全部通過"""
+    servers = [_start_stand_in_proxy(), _start_stand_in_proxy()]
+    heavy, light = (f"http://127.0.0.1:{server.server_address[1]}" for server in servers)
+    dead = _closed_port_url()
+    # 探測目標不需要存在：請求只會送到替身代理
+    probe_url = 'http://proxy-check.invalid/ip'
+    quiet = lambda message: None
+    results = []
+
+    def check(name, ok, detail=''):
+        results.append(ok)
+        print(f"{'✅' if ok else '❌'} {name}" + (f": {detail}" if detail else ''))
+
+    pool = ProxyPool([(heavy, 3.0), (light, 1.0), (dead, 1.0)], probe_url=probe_url, log=quiet)
+    healthy = pool.check_health()
+    check("健康探測", healthy == 2 and not pool.members[2].healthy, f"{healthy}/3 個可用")
+    check("探測經由替身代理", all(server.hits == 1 for server in servers),
+          f"{[server.hits for server in servers]} 次")
+
+    # 延遲相同時選中比例應接近權重比例 3:1，不可用的代理不會被選中
+    for state in pool.members[:2]:
+        state.latency = 0.1
+    picks = [pool.choose() for _ in range(rounds)]
+    heavy_ratio = sum(1 for state in picks if state is pool.members[0]) / rounds
+    check("加權輪換", abs(heavy_ratio - 0.75) < 0.05 and pool.members[2] not in picks,
+          f"權重 3:1 的選中比例 {heavy_ratio:.2f}")
+
+    for _ in range(MAX_CONSECUTIVE_FAILURES):
+        pool.report(pool.members[0], False)
+    cooling = all(pool.choose() is pool.members[1] for _ in range(200))
+    check("連續失敗後暫停", cooling and pool.members[0].cooldown_until > time.time())
+
+    for _ in range(MAX_CONSECUTIVE_FAILURES):
+        pool.report(pool.members[1], False)
+    fallback = pool.choose()
+    check("全部不可用時沿用最早恢復的代理", fallback is pool.members[0], fallback.name)
+
+    pool.allow_direct = True
+    check("允許時退回直接連接", pool.choose() is pool.direct)
+
+    pool.members[0].cooldown_until = 0
+    check("暫停結束後恢復使用", pool.choose() is pool.members[0])
+
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+    print(f"📊 {sum(results)}/{len(results)} 項通過")
+    return all(results)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='探測代理池中各代理的健康狀態與延遲')
+    parser.add_argument('--proxy-file', type=str, default=None, help='代理清單檔案 (默認: PROXY_FILE 環境變量)')
+    parser.add_argument('--probe-url', type=str, default=PROXY_PROBE_URL, help=f'探測地址 (默認: {PROXY_PROBE_URL})')
+    parser.add_argument('--self-check', action='store_true',
+                        help='不連外網，以本地替身代理檢查加權輪換、暫停與直接連接退回')
+    args = parser.parse_args()
+
+    if args.self_check:
+        return 0 if self_check() else 1
+
+    proxies = load_proxies(args.proxy_file)
+    if not proxies:
+        print("❌ 沒有設置代理 (PROXY_FILE / PROXY_POOL)")
+        return 1
+    pool = ProxyPool(proxies, probe_url=args.probe_url)
+    pool.check_health()
+    for state in pool.snapshot()[:-1]:
+        latency = f"{state['latency_ms']} ms" if state['latency_ms'] is not None else '-'
+        print(f"   {'✅' if state['healthy'] else '❌'} {state['name']}: {latency}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,201 @@
+import os
+import sys
+import json
+import time
+import hashlib
+import zipfile
+import argparse
+import subprocess
+from io import BytesIO
+from xml.etree import ElementTree as ET
+
+from cookie_store import BASE_DIR
+
+DELTA_DIR = os.path.join(BASE_DIR, 'output', 'deltas')
+COMPRESSED_SUFFIXES = ('.gz', '.zst')
+# 每次生成都會變動、不代表內容改變的欄位 (時間戳與 stream_check 健康報告中每次探測的延遲)
+VOLATILE_JSON_KEYS = ('generated_at', 'checked_at', 'latency_ms', 'playlist_ms', 'segment_ms',
+                      'median_latency_ms', 'min_latency_ms')
+
+
+def read_previous(path, ref='HEAD'):
+    """從 git 讀取檔案在 ref 的內容，不在版本庫中時返回 None"""
+    directory, name = os.path.split(os.path.abspath(path))
+    try:
+        result = subprocess.run(['git', 'show', f'{ref}:./{name}'], cwd=directory,
+                                stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, check=True)
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return result.stdout
+
+
+def _strip_volatile(value):
+    if isinstance(value, dict):
+        return {key: _strip_volatile(item) for key, item in value.items() if key not in VOLATILE_JSON_KEYS}
+    if isinstance(value, list):
+        return [_strip_volatile(item) for item in value]
+    return value
+
+
+def _canonical_xml(data):
+    """XMLTV 的標準形式：忽略縮排空白，頂層元素排序後逐一序列化"""
+    root = ET.fromstring(data)
+    for elem in root.iter():
+        elem.text = elem.text.strip() if elem.text else None
+        elem.tail = None
+    head = ET.tostring(ET.Element(root.tag, dict(sorted(root.attrib.items()))), encoding='utf-8')
+    return head + b'\n'.join(sorted(ET.tostring(child, encoding='utf-8') for child in root))
+
+
+def _canonical_zip(data):
+    """ZIP 只比較成員名稱與內容，忽略壓縮時間戳"""
+    with zipfile.ZipFile(BytesIO(data)) as archive:
+        return b'\n'.join(
+            name.encode('utf-8') + b'\0' + hashlib.sha256(archive.read(name)).digest()
+            for name in sorted(archive.namelist())
+        )
+
+
+def canonical_digest(path, data):
+    """按副檔名計算內容的標準雜湊；無法解析時退回原始位元組"""
+    extension = os.path.splitext(path)[1].lower()
+    try:
+        if extension == '.xml':
+            data = _canonical_xml(data)
+        elif extension == '.json':
+            data = json.dumps(_strip_volatile(json.loads(data)), ensure_ascii=False, sort_keys=True,
+                              separators=(',', ':')).encode('utf-8')
+        elif extension == '.zip':
+            data = _canonical_zip(data)
+    except Exception:
+        pass
+    return hashlib.sha256(data).hexdigest()
+
+
+def programme_index(data):
+    """由 XMLTV 建立 {頻道ID: {開始時間: 節目}}"""
+    index = {}
+    for elem in ET.fromstring(data).iter('programme'):
+        index.setdefault(elem.get('channel', ''), {})[elem.get('start', '')] = {
+            'start': elem.get('start', ''),
+            'stop': elem.get('stop', ''),
+            'title': (elem.findtext('title') or '').strip(),
+            'sub_title': (elem.findtext('sub-title') or '').strip(),
+            'desc': (elem.findtext('desc') or '').strip()
+        }
+    return index
+
+
+def diff_programmes(previous, current):
+    """比較兩份節目索引，返回 {頻道ID: {added, removed, changed}}，只包含有異動的頻道"""
+    channels = {}
+    for channel in sorted(set(previous) | set(current)):
+        old = previous.get(channel, {})
+        new = current.get(channel, {})
+        delta = {
+            'added': [new[start] for start in sorted(new.keys() - old.keys())],
+            'removed': [{'start': start} for start in sorted(old.keys() - new.keys())],
+            'changed': [new[start] for start in sorted(new.keys() & old.keys()) if new[start] != old[start]]
+        }
+        if any(delta.values()):
+            channels[channel] = delta
+    return channels
+
+
+def write_delta(path, previous, current, base, target, delta_dir=DELTA_DIR):
+    """寫出相對上一版的節目異動檔，返回 (新增, 刪除, 修改) 數量"""
+    channels = diff_programmes(programme_index(previous), programme_index(current))
+    counts = tuple(sum(len(delta[kind]) for delta in channels.values()) for kind in ('added', 'removed', 'changed'))
+    os.makedirs(delta_dir, exist_ok=True)
+    delta_file = os.path.join(delta_dir, f"{os.path.splitext(os.path.basename(path))[0]}.delta.json")
+    tmp_file = f"{delta_file}.tmp"
+    with open(tmp_file, 'w', encoding='utf-8') as f:
+        json.dump({
+            'file': os.path.basename(path),
+            'generated_at': int(time.time()),
+            'base': base,
+            'target': target,
+            'summary': dict(zip(('added', 'removed', 'changed'), counts)),
+            'channels': channels
+        }, f, ensure_ascii=False, separators=(',', ':'))
+    os.replace(tmp_file, delta_file)
+    return counts
+
+
+def _restore(path, data):
+    tmp_file = f"{path}.tmp"
+    with open(tmp_file, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_file, path)
+
+
+def publish_file(path, ref='HEAD', delta_dir=None):
+    """內容未變時把檔案 (及其壓縮變體) 還原為上一版的位元組，返回 'new'/'unchanged'/'changed'"""
+    with open(path, 'rb') as f:
+        current = f.read()
+    previous = read_previous(path, ref)
+    if previous is None:
+        return 'new'
+
+    base = canonical_digest(path, previous)
+    target = canonical_digest(path, current)
+    if base == target:
+        if previous != current:
+            _restore(path, previous)
+        for suffix in COMPRESSED_SUFFIXES:
+            variant = path + suffix
+            if os.path.exists(variant):
+                previous_variant = read_previous(variant, ref)
+                if previous_variant is not None:
+                    _restore(variant, previous_variant)
+        return 'unchanged'
+
+    if delta_dir and path.endswith('.xml'):
+        try:
+            added, removed, changed = write_delta(path, previous, current, base, target, delta_dir)
+            print(f"   📝 {os.path.basename(path)}: 新增 {added}、刪除 {removed}、修改 {changed} 個節目")
+        except ET.ParseError as e:
+            print(f"⚠️ 無法比較 {path} 的節目異動: {e}")
+    return 'changed'
+
+
+def iter_outputs(paths):
+    """展開目錄，略過壓縮變體 (與原始檔一起處理)"""
+    for path in paths:
+        if os.path.isdir(path):
+            for directory, _, files in sorted(os.walk(path)):
+                for name in sorted(files):
+                    if not name.endswith(COMPRESSED_SUFFIXES):
+                        yield os.path.join(directory, name)
+        elif os.path.exists(path) and not path.endswith(COMPRESSED_SUFFIXES):
+            yield path
+
+
+def publish(paths, ref='HEAD', delta_dir=None):
+    """逐一檢查輸出檔案，返回 {狀態: [檔案]}"""
+    results = {'new': [], 'changed': [], 'unchanged': []}
+    if delta_dir:
+        os.makedirs(delta_dir, exist_ok=True)
+    for path in iter_outputs(paths):
+        # 分片目錄中的檔案只做內容比較，節目異動檔只為直接指定的 XML 生成
+        results[publish_file(path, ref, delta_dir if path in paths else None)].append(path)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='發布前比較輸出內容：內容未變的檔案還原為上一版，並生成節目異動檔')
+    parser.add_argument('paths', nargs='+', help='輸出檔案或目錄，例如 output/4g.xml output/shards/4g')
+    parser.add_argument('--ref', default='HEAD', help='比較的 git 版本 (默認: HEAD)')
+    parser.add_argument('--delta-dir', nargs='?', const=DELTA_DIR, default=None,
+                        help=f'為 XML 輸出生成節目異動檔的目錄 (默認: {DELTA_DIR})')
+    args = parser.parse_args()
+
+    results = publish(args.paths, args.ref, args.delta_dir)
+    print(f"📦 新增 {len(results['new'])} 個、變更 {len(results['changed'])} 個、未變 {len(results['unchanged'])} 個檔案")
+    for path in results['changed']:
+        print(f"   ✏️ {path}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,49 @@
+import threading
+import time
+
+
+class RateLimiter:
+    """執行緒安全的令牌桶速率限制器，多個工作執行緒共用同一個全域速率"""
+
+    def __init__(self, rate, burst=1):
+        """rate 為每秒允許的請求數 (<= 0 表示不限制)，burst 為可累積的最大令牌數"""
+        self.rate = float(rate)
+        self.capacity = max(1, int(burst))
+        self._tokens = float(self.capacity)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _try_acquire(self):
+        """嘗試取得一個令牌，成功返回0，否則返回需要等待的秒數"""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return 0
+            return (1 - self._tokens) / self.rate
+
+    def acquire(self):
+        """阻塞直到取得一個令牌"""
+        if self.rate <= 0:
+            return
+        while True:
+            wait = self._try_acquire()
+            if not wait:
+                return
+            time.sleep(wait)
+
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def get_rate_limiter(host, rate, burst=1):
+    """取得按主機共用的速率限制器；同一進程內多個腳本請求同一主機時共用令牌桶，以第一次建立時的速率為準"""
+    with _limiters_lock:
+        limiter = _limiters.get(host)
+        if limiter is None:
+            limiter = _limiters[host] = RateLimiter(rate, burst)
+        return limiter
@@ -0,0 +1,195 @@
+import os
+import json
+import time
+import threading
+from datetime import datetime, timedelta, timezone
+
+from cookie_store import CACHE_DIR
+from channel_identity import PROVIDER_COST
+
+SCHEDULE_DIR = os.path.join(CACHE_DIR, 'schedules')
+SCHEDULE_MAX_AGE = 24 * 3600  # 沿用其他來源節目表的最長資料年齡 (秒)
+MIN_COVERAGE = 24 * 3600      # 沿用的節目表至少需涵蓋到未來多少秒 (未列於 FETCH_DAYS 的來源)
+COVERAGE_SLACK = 3600         # 節目表結束時間與抓取範圍結尾之間容許的差距 (秒)
+TAIPEI_TZ = timezone(timedelta(hours=8))
+
+# 各來源自己抓取時涵蓋的天數 (從今天起，按台北時間整日計算)；
+# 沿用其他來源的節目表需涵蓋到相同的範圍，否則仍由該來源自己抓取
+FETCH_DAYS = {
+    'hami': 7,
+}
+
+# 其他來源只公佈較少天數時 (例如 4gtv 約 3 天，Hami 抓取 7 天)，仍沿用其涵蓋的部分、
+# 只自行抓取缺少的尾段日期的來源
+PARTIAL_REUSE = {'hami'}
+
+
+class ScheduleStore:
+    """按來源保存已抓取的頻道節目表，讓其他來源的輸出沿用而不重複抓取"""
+
+    def __init__(self, directory=SCHEDULE_DIR, max_age=SCHEDULE_MAX_AGE, min_coverage=MIN_COVERAGE):
+        self.directory = directory
+        self.max_age = max_age
+        self.min_coverage = min_coverage
+        self._providers = {}  # 來源 -> (抓取時間, {頻道ID: [節目]})
+        self._mtimes = {}     # 來源 -> 載入時檔案的修改時間，其他進程寫入後重新載入
+        self._lock = threading.Lock()
+
+    def _path(self, provider):
+        return os.path.join(self.directory, f"{provider}.json")
+
+    def _load(self, provider):
+        try:
+            mtime = os.path.getmtime(self._path(provider))
+        except OSError:
+            mtime = None
+        with self._lock:
+            if provider in self._providers and self._mtimes.get(provider) == mtime:
+                return self._providers[provider]
+
+            entry = (0, {})
+            try:
+                with open(self._path(provider), 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+                channels = {
+                    channel_id: [
+                        dict(item, start=datetime.fromisoformat(item['start']), end=datetime.fromisoformat(item['end']))
+                        for item in items
+                    ]
+                    for channel_id, items in data.get('channels', {}).items()
+                }
+                entry = (data.get('fetched_at', 0), channels)
+            except (OSError, ValueError, KeyError, TypeError):
+                pass
+
+            self._providers[provider] = entry
+            self._mtimes[provider] = mtime
+            return entry
+
+    def publish(self, provider, programs):
+        """按頻道分組保存某來源本次抓取的節目，返回頻道數"""
+        channels = {}
+        for program in programs:
+            channels.setdefault(program['channelId'], []).append({
+                'programName': program.get('programName', ''),
+                'description': program.get('description', ''),
+                'subtitle': program.get('subtitle', ''),
+                'start': program['start'],
+                'end': program['end']
+            })
+
+        fetched_at = time.time()
+        serialized = {
+            channel_id: [dict(item, start=item['start'].isoformat(), end=item['end'].isoformat()) for item in items]
+            for channel_id, items in channels.items()
+        }
+
+        os.makedirs(self.directory, exist_ok=True)
+        path = self._path(provider)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'fetched_at': fetched_at, 'channels': serialized}, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+        with self._lock:
+            self._providers[provider] = (fetched_at, channels)
+            self._mtimes[provider] = os.path.getmtime(path)
+        return len(channels)
+
+    def required_until(self, provider, now=None):
+        """目標來源沿用節目表時需涵蓋到的時間戳：有 FETCH_DAYS 時為其抓取範圍的結尾，否則為 min_coverage 秒後"""
+        now = time.time() if now is None else now
+        days = FETCH_DAYS.get(provider)
+        if not days:
+            return now + self.min_coverage
+        today = datetime.fromtimestamp(now, TAIPEI_TZ).replace(hour=0, minute=0, second=0, microsecond=0)
+        return (today + timedelta(days=days)).timestamp() - COVERAGE_SLACK
+
+    def get(self, provider, channel_id, until=None):
+        """取得某來源頻道仍可沿用的節目表：資料需夠新且涵蓋到 until (默認為 min_coverage 秒後)"""
+        fetched_at, channels = self._load(provider)
+        if time.time() - fetched_at > self.max_age:
+            return None
+
+        programs = channels.get(channel_id)
+        if not programs:
+            return None
+
+        until = time.time() + self.min_coverage if until is None else until
+        if max(program['end'] for program in programs).timestamp() < until:
+            return None
+        return programs
+
+    def find_reusable(self, identity_map, provider, channel_id, channel_name):
+        """從成本更低的來源尋找同一實體頻道的節目表，返回 (來源, 改標為目標頻道的節目)
+
+        PARTIAL_REUSE 中的來源在沒有完整涵蓋時，改用涵蓋最久 (至少 min_coverage 秒) 的節目表，
+        缺少的尾段由呼叫端從 fetch_start_day 起自行抓取。
+        """
+        key = identity_map.key_for(provider, channel_id)
+        if not key:
+            return None, None
+
+        members = identity_map.members(key)
+        until = self.required_until(provider)
+        own_cost = PROVIDER_COST.get(provider, len(PROVIDER_COST) + 1)
+        partial_source, partial = None, None
+        for source in identity_map.providers_by_cost(key):
+            if source == provider or PROVIDER_COST.get(source, own_cost) >= own_cost:
+                continue
+            programs = self.get(source, members[source], until)
+            if programs:
+                partial_source, partial = source, programs
+                break
+            if provider in PARTIAL_REUSE:
+                programs = self.get(source, members[source])
+                if programs and (not partial or coverage_end(programs) > coverage_end(partial)):
+                    partial_source, partial = source, programs
+        if not partial:
+            return None, None
+        return partial_source, [
+            dict(program, channelId=channel_id, channelName=channel_name)
+            for program in partial
+        ]
+
+    def fetch_start_day(self, provider, programs, now=None):
+        """沿用的節目表之後需自行抓取的第一天 (從今天起的天數)，已涵蓋完整範圍時返回 None"""
+        now = time.time() if now is None else now
+        end = coverage_end(programs)
+        if end.timestamp() >= self.required_until(provider, now):
+            return None
+        today = datetime.fromtimestamp(now, TAIPEI_TZ).date()
+        return max(0, (end.astimezone(TAIPEI_TZ).date() - today).days)
+
+    def plan_fetches(self, identity_map, provider, channels):
+        """將 (頻道ID, 頻道名稱) 清單分為需要抓取的頻道與可沿用其他來源的頻道
+
+        部分沿用的頻道同時出現在兩者中，只需從 fetch_start_day 起抓取缺少的尾段。
+        """
+        to_fetch = []
+        reused = {}
+        for channel_id, channel_name in channels:
+            source, programs = self.find_reusable(identity_map, provider, channel_id, channel_name)
+            if programs:
+                reused[channel_id] = (source, programs)
+            if not programs or self.fetch_start_day(provider, programs) is not None:
+                to_fetch.append(channel_id)
+        return to_fetch, reused
+
+
+def coverage_end(programs):
+    """節目表涵蓋到的最晚結束時間"""
+    return max(program['end'] for program in programs)
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_schedule_store():
+    """取得行程內共用的節目表存儲"""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = ScheduleStore()
+        return _store
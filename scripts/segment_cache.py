@@ -0,0 +1,142 @@
+import os
+import asyncio
+import hashlib
+from collections import OrderedDict
+
+from cookie_store import CACHE_DIR
+
+SEGMENT_CACHE_DIR = os.path.join(CACHE_DIR, 'segments')
+DEFAULT_MAX_BYTES = 1024 * 1024 * 1024  # 1 GiB
+CHUNK_SIZE = 64 * 1024
+
+
+class SegmentCache:
+    """以總位元組數為上限、按最近使用淘汰的磁碟分片快取，同一分片的並發下載只進行一次；
+    正在送出的分片以引用計數釘住，淘汰時略過"""
+
+    def __init__(self, directory=SEGMENT_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._index = OrderedDict()  # 檔名 -> 位元組數，越後面越近使用
+        self._inflight = {}          # 檔名 -> 進行中的下載任務
+        self._pins = {}              # 檔名 -> 使用中的請求數
+        self._prefetching = set()    # 背景預取任務 (保留強引用，避免執行中被回收)
+        os.makedirs(directory, exist_ok=True)
+        self._load_index()
+
+    def _load_index(self):
+        """按修改時間重建已存在分片的索引，並清除上次中斷留下的暫存檔"""
+        entries = []
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            if name.endswith('.part'):
+                os.remove(path)
+                continue
+            stat = os.stat(path)
+            entries.append((stat.st_mtime, name, stat.st_size))
+
+        for _, name, size in sorted(entries):
+            self._index[name] = size
+            self.total_bytes += size
+        self._evict()
+
+    @staticmethod
+    def key_for(url):
+        path = url.split('?')[0]
+        ext = os.path.splitext(path)[1][:8]
+        return hashlib.sha1(url.encode('utf-8')).hexdigest() + ext
+
+    def path_for(self, key):
+        return os.path.join(self.directory, key)
+
+    def _touch(self, key):
+        self._index.move_to_end(key)
+
+    def _evict(self, keep=None):
+        """淘汰最久未使用的分片直到總大小低於上限；keep 與使用中的分片不淘汰，全部使用中時暫時超出上限"""
+        for key in list(self._index):
+            if self.total_bytes <= self.max_bytes:
+                break
+            if key == keep or self._pins.get(key):
+                continue
+            self.total_bytes -= self._index.pop(key)
+            try:
+                os.remove(self.path_for(key))
+            except FileNotFoundError:
+                pass
+
+    def contains(self, url):
+        return self.key_for(url) in self._index
+
+    async def _download(self, session, url, key):
+        path = self.path_for(key)
+        tmp_path = f"{path}.part"
+        size = 0
+        try:
+            async with session.get(url) as resp:
+                if resp.status != 200:
+                    print(f"⚠️ 分片下載失敗 {resp.status}: {url}")
+                    return None
+                with open(tmp_path, 'wb') as f:
+                    async for chunk in resp.content.iter_chunked(CHUNK_SIZE):
+                        f.write(chunk)
+                        size += len(chunk)
+            os.replace(tmp_path, path)
+        except Exception as e:
+            print(f"⚠️ 分片下載失敗: {url}: {e}")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return None
+        finally:
+            self._inflight.pop(key, None)
+
+        self._index[key] = size
+        self.total_bytes += size
+        self._evict(keep=key)
+        return path
+
+    async def fetch(self, session, url):
+        """返回分片在磁碟上的路徑；未快取時下載，失敗返回 None"""
+        key = self.key_for(url)
+        if key in self._index and os.path.exists(self.path_for(key)):
+            self.hits += 1
+            self._touch(key)
+            return self.path_for(key)
+
+        if key in self._index:
+            # 檔案已被外部刪除，修正索引後重新下載
+            self.total_bytes -= self._index.pop(key)
+
+        task = self._inflight.get(key)
+        if task is None:
+            self.misses += 1
+            task = asyncio.ensure_future(self._download(session, url, key))
+            self._inflight[key] = task
+        return await asyncio.shield(task)
+
+    def pin(self, url):
+        """釘住分片直到 unpin，期間不會被淘汰 (可在下載前呼叫)，返回分片鍵"""
+        key = self.key_for(url)
+        self._pins[key] = self._pins.get(key, 0) + 1
+        return key
+
+    def unpin(self, key):
+        self._pins[key] -= 1
+        if not self._pins[key]:
+            del self._pins[key]
+
+    def prefetch(self, session, urls, limiter):
+        """在背景預先下載尚未快取的分片，limiter 限制同時進行的預取數"""
+        async def run(url):
+            async with limiter:
+                await self.fetch(session, url)
+
+        for url in urls:
+            key = self.key_for(url)
+            if key not in self._index and key not in self._inflight:
+                task = asyncio.ensure_future(run(url))
+                self._prefetching.add(task)
+                task.add_done_callback(self._prefetching.discard)
@@ -0,0 +1,242 @@
+import os
+import sys
+import json
+import time
+import argparse
+from datetime import datetime
+from urllib.parse import urljoin, urlparse
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from variant_selector import parse_master_playlist, pick_variant
+from compress_sink import CompressedOutput, parse_compressions
+
+DEFAULT_WORKERS = 16
+DEFAULT_TIMEOUT = 10
+USER_AGENT = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/134.0.0.0 Safari/537.36'
+LOCAL_HOSTS = ('localhost', '127.0.0.1')
+
+
+def parse_m3u(path):
+    """解析 M3U，返回 (檔頭行, [條目])；條目包含 EXTINF 行、其他屬性行與播放地址"""
+    with open(path, 'r', encoding='utf-8') as f:
+        lines = [line.rstrip('\r\n') for line in f]
+
+    header = []
+    entries = []
+    pending = []
+    for line in lines:
+        if not line.strip():
+            continue
+        if line.startswith('#EXTM3U'):
+            header.append(line)
+        elif line.startswith('#'):
+            pending.append(line)
+        else:
+            extinf = next((item for item in pending if item.startswith('#EXTINF')), '')
+            entries.append({
+                'lines': pending,
+                'url': line.strip(),
+                'name': extinf.rsplit(',', 1)[-1] if extinf else line.strip(),
+                'channel': _attribute(extinf, 'tvg-id') or _attribute(extinf, 'tvg-name')
+            })
+            pending = []
+    return header or ['#EXTM3U'], entries
+
+
+def _attribute(extinf, name):
+    marker = f'{name}="'
+    start = extinf.find(marker)
+    if start < 0:
+        return ''
+    start += len(marker)
+    return extinf[start:extinf.find('"', start)]
+
+
+def probe_url(url, relay=None):
+    """本地中繼地址改為指向 relay (例如 http://127.0.0.1:5000)，其餘原樣"""
+    if not relay:
+        return url
+    parsed = urlparse(url)
+    if parsed.hostname not in LOCAL_HOSTS:
+        return url
+    return relay.rstrip('/') + parsed.path + (f"?{parsed.query}" if parsed.query else '')
+
+
+def probe_segment(session, url, timeout):
+    """以 HEAD 探測分片，伺服器不支援 HEAD 時改用只取前 1KB 的 GET，返回 HTTP 狀態碼"""
+    resp = session.head(url, timeout=timeout, allow_redirects=True)
+    if resp.status_code < 400:
+        return resp.status_code
+    with session.get(url, timeout=timeout, headers={'Range': 'bytes=0-1023'}, stream=True) as resp:
+        return resp.status_code
+
+
+def check_stream(session, url, timeout):
+    """探測單一播放地址：主播放清單 -> 媒體播放清單 -> 第一個分片，返回探測結果"""
+    result = {'ok': False, 'status': None, 'playlist_ms': None, 'segment_ms': None, 'latency_ms': None, 'error': ''}
+    started = time.perf_counter()
+    try:
+        resp = session.get(url, timeout=timeout)
+        result['status'] = resp.status_code
+        if resp.status_code != 200:
+            result['error'] = f"播放清單 HTTP {resp.status_code}"
+            return result
+
+        text, base_url = resp.text, resp.url
+        variant = pick_variant(parse_master_playlist(text, base_url))
+        if variant:
+            resp = session.get(variant['url'], timeout=timeout)
+            result['status'] = resp.status_code
+            if resp.status_code != 200:
+                result['error'] = f"媒體播放清單 HTTP {resp.status_code}"
+                return result
+            text, base_url = resp.text, resp.url
+        result['playlist_ms'] = round((time.perf_counter() - started) * 1000)
+
+        segment = next((line.strip() for line in text.splitlines()
+                        if line.strip() and not line.startswith('#')), None)
+        if not segment:
+            result['error'] = "媒體播放清單沒有分片"
+            return result
+
+        segment_started = time.perf_counter()
+        status = probe_segment(session, urljoin(base_url, segment), timeout)
+        result['status'] = status
+        result['segment_ms'] = round((time.perf_counter() - segment_started) * 1000)
+        if status not in (200, 206):
+            result['error'] = f"分片 HTTP {status}"
+            return result
+
+        result['ok'] = True
+        return result
+    except Exception as e:
+        result['error'] = str(e)
+        return result
+    finally:
+        result['latency_ms'] = round((time.perf_counter() - started) * 1000)
+
+
+def check_entries(entries, workers=DEFAULT_WORKERS, timeout=DEFAULT_TIMEOUT, relay=None):
+    """在並發上限內探測所有條目，按輸入順序返回結果"""
+    session = requests.Session()
+    session.headers.update({'User-Agent': USER_AGENT})
+    adapter = requests.adapters.HTTPAdapter(pool_connections=workers, pool_maxsize=workers)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+
+    def run(entry):
+        return check_stream(session, probe_url(entry['url'], relay), timeout)
+
+    # 進度在主執行緒中按輸入順序計數，工作執行緒之間不共用計數器
+    total = len(entries)
+    results = []
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        for result in executor.map(run, entries):
+            results.append(result)
+            if len(results) % 50 == 0 or len(results) == total:
+                print(f"   🔍 已探測 {len(results)}/{total}")
+    return results
+
+
+def build_report(playlist_path, entries, results):
+    """整理成按頻道彙總的延遲報告"""
+    channels = {}
+    for entry, result in zip(entries, results):
+        channel = channels.setdefault(entry['channel'] or entry['name'], {'entries': 0, 'ok': 0, 'latencies': []})
+        channel['entries'] += 1
+        if result['ok']:
+            channel['ok'] += 1
+            channel['latencies'].append(result['latency_ms'])
+
+    summary = {}
+    for name, channel in channels.items():
+        latencies = sorted(channel.pop('latencies'))
+        channel['median_latency_ms'] = latencies[len(latencies) // 2] if latencies else None
+        channel['min_latency_ms'] = latencies[0] if latencies else None
+        summary[name] = channel
+
+    return {
+        'playlist': os.path.basename(playlist_path),
+        'checked_at': datetime.now().astimezone().isoformat(timespec='seconds'),
+        'total': len(results),
+        'ok': sum(1 for result in results if result['ok']),
+        'channels': summary,
+        'entries': [
+            dict(result, name=entry['name'], channel=entry['channel'], url=entry['url'])
+            for entry, result in zip(entries, results)
+        ]
+    }
+
+
+def write_playlist(path, header, entries, results, on_fail, compressions=()):
+    """按探測結果寫回播放清單：drop 刪除失敗條目，demote 將失敗條目移到最後，keep 原樣保留"""
+    healthy = [entry for entry, result in zip(entries, results) if result['ok']]
+    failing = [entry for entry, result in zip(entries, results) if not result['ok']]
+    if on_fail == 'drop':
+        ordered = healthy
+    elif on_fail == 'demote':
+        ordered = healthy + failing
+    else:
+        ordered = entries
+
+    with CompressedOutput(path, compressions) as f:
+        f.write('\n'.join(header) + '\n')
+        for entry in ordered:
+            for line in entry['lines']:
+                f.write(f"{line}\n")
+            f.write(f"{entry['url']}\n")
+
+
+def check_playlist(path, workers=DEFAULT_WORKERS, timeout=DEFAULT_TIMEOUT, on_fail='demote', relay=None, report_path=None,
+                   compressions=()):
+    """探測播放清單並寫出延遲報告，返回 (成功數, 總數)"""
+    header, entries = parse_m3u(path)
+    if not entries:
+        print(f"⚠️ {path} 沒有任何條目")
+        return 0, 0
+
+    print(f"🔍 正在探測 {path} 的 {len(entries)} 個條目 ({workers} 個並發)...")
+    started = time.time()
+    results = check_entries(entries, workers, timeout, relay)
+    ok = sum(1 for result in results if result['ok'])
+    print(f"✅ 可播放 {ok}/{len(entries)}，耗時 {time.time() - started:.1f} 秒")
+
+    report_path = report_path or f"{os.path.splitext(path)[0]}.health.json"
+    with CompressedOutput(report_path) as f:
+        f.write(json.dumps(build_report(path, entries, results), ensure_ascii=False, indent=2))
+    print(f"📊 延遲報告: {report_path}")
+
+    if ok == 0:
+        # 全部失敗多半是探測端網路問題 (例如不在台灣的執行環境)，不改動播放清單
+        print("⚠️ 所有條目都探測失敗，保留原播放清單不變")
+    elif on_fail != 'keep' and ok < len(entries):
+        write_playlist(path, header, entries, results, on_fail, compressions)
+        action = '刪除' if on_fail == 'drop' else '移到最後'
+        print(f"🧹 已將 {len(entries) - ok} 個失敗條目{action}: {path}")
+    return ok, len(entries)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='並發探測 M3U 播放清單中的串流是否可播放')
+    parser.add_argument('playlists', nargs='+', help='要探測的播放清單，例如 playlist/4gtv.m3u output/ofiii.m3u')
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS, help=f'同時探測的條目數 (默認: {DEFAULT_WORKERS})')
+    parser.add_argument('--timeout', type=int, default=DEFAULT_TIMEOUT, help=f'單次請求超時時間(秒) (默認: {DEFAULT_TIMEOUT})')
+    parser.add_argument('--on-fail', choices=['demote', 'drop', 'keep'], default='demote',
+                        help='失敗條目的處理方式：移到最後、刪除或保留 (默認: demote)')
+    parser.add_argument('--relay', type=str, help='本地中繼地址，localhost 條目改向此地址探測，例如 http://127.0.0.1:5000')
+    parser.add_argument('--compress', type=parse_compressions, default='',
+                        help='改寫播放清單時同時更新壓縮檔，例如 gz 或 gz,zst')
+    args = parser.parse_args()
+
+    for path in args.playlists:
+        if not os.path.exists(path):
+            print(f"❌ 找不到播放清單: {path}")
+            return 1
+        check_playlist(path, args.workers, args.timeout, args.on_fail, args.relay, compressions=args.compress)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
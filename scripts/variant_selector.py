@@ -0,0 +1,153 @@
+import os
+import re
+import json
+import time
+import threading
+from urllib.parse import urljoin, urlparse
+from concurrent.futures import ThreadPoolExecutor
+
+from cookie_store import CACHE_DIR
+
+VARIANT_CACHE_FILE = os.path.join(CACHE_DIR, 'variants.json')
+VARIANT_CACHE_TTL = 24 * 3600  # 頻道變體選擇的有效期 (秒)
+DEFAULT_VARIANT_WORKERS = 8
+
+_ATTR_RE = re.compile(r'([A-Z0-9-]+)=("[^"]*"|[^,]*)')
+# 主播放清單路徑中每個會話都不同的令牌段 (長編碼字串或長十六進位字串)
+_TOKEN_SEGMENT_RE = re.compile(r'^(?:[A-Za-z0-9_.~%=+-]{20,}|[0-9a-fA-F]{16,})$')
+
+
+def parse_attributes(line):
+    """解析 #EXT-X-STREAM-INF 之類標籤的屬性清單"""
+    _, _, attrs = line.partition(':')
+    return {key: value.strip('"') for key, value in _ATTR_RE.findall(attrs)}
+
+
+def parse_master_playlist(text, base_url):
+    """從主播放清單解析所有變體，返回 [{'uri', 'url', 'bandwidth', 'width', 'height'}]；非主播放清單返回空清單"""
+    variants = []
+    pending = None
+    for line in text.splitlines():
+        line = line.strip()
+        if line.startswith('#EXT-X-STREAM-INF'):
+            pending = parse_attributes(line)
+        elif line and not line.startswith('#') and pending is not None:
+            width, _, height = pending.get('RESOLUTION', '').partition('x')
+            variants.append({
+                'uri': line,
+                'url': urljoin(base_url, line),
+                'bandwidth': int(pending.get('BANDWIDTH') or pending.get('AVERAGE-BANDWIDTH') or 0),
+                'width': int(width) if width.isdigit() else 0,
+                'height': int(height) if height.isdigit() else 0
+            })
+            pending = None
+    return variants
+
+
+def pick_variant(variants, max_height=None):
+    """選出解析度與碼率最高的變體，max_height 限制最高解析度；全部超出上限時取最低的一個"""
+    if not variants:
+        return None
+    allowed = [v for v in variants if not max_height or not v['height'] or v['height'] <= max_height]
+    if not allowed:
+        return min(variants, key=lambda v: (v['height'], v['bandwidth']))
+    return max(allowed, key=lambda v: (v['height'], v['bandwidth']))
+
+
+def stable_location(url):
+    """主播放清單地址中跨執行不變的部分：主機名與目錄中不像令牌的路徑段"""
+    parsed = urlparse(url)
+    segments = [
+        segment for segment in os.path.dirname(parsed.path).split('/')
+        if segment and not _TOKEN_SEGMENT_RE.match(segment)
+    ]
+    return f"{parsed.netloc}/{'/'.join(segments)}"
+
+
+class VariantCache:
+    """按頻道記錄上次選出的變體，跨執行沿用以省去主播放清單請求"""
+
+    def __init__(self, path=VARIANT_CACHE_FILE, ttl=VARIANT_CACHE_TTL):
+        self.path = path
+        self.ttl = ttl
+        self.entries = {}
+        self._lock = threading.Lock()
+        self._dirty = False
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                self.entries = json.load(f)
+        except (OSError, ValueError):
+            pass
+
+    def get(self, channel_id, master_url, max_height=None):
+        """返回可直接套用到本次主播放清單地址的變體地址，沒有可用記錄時返回 None"""
+        entry = self.entries.get(channel_id)
+        if not entry or time.time() - entry.get('chosen_at', 0) > self.ttl:
+            return None
+        if entry.get('max_height') != max_height:
+            return None
+        # 變體地址帶查詢參數 (通常是令牌) 或是絕對地址時每次都不同，不能沿用；
+        # 相對地址按本次主播放清單 (含本次的令牌目錄) 解析
+        uri = urlparse(entry['uri'])
+        if uri.query or uri.scheme:
+            return None
+        # 主機或令牌以外的路徑變了 (例如換了 CDN 節點) 需重新選擇
+        if entry.get('master_location') != stable_location(master_url):
+            return None
+        return urljoin(master_url, entry['uri'])
+
+    def set(self, channel_id, master_url, variant, max_height=None):
+        with self._lock:
+            self.entries[channel_id] = {
+                'uri': variant['uri'],
+                'bandwidth': variant['bandwidth'],
+                'height': variant['height'],
+                'max_height': max_height,
+                'master_location': stable_location(master_url),
+                'chosen_at': time.time()
+            }
+            self._dirty = True
+
+    def save(self):
+        with self._lock:
+            if not self._dirty:
+                return
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            tmp_path = f"{self.path}.{os.getpid()}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self.entries, f, ensure_ascii=False, indent=2)
+            os.replace(tmp_path, self.path)
+            self._dirty = False
+
+
+def select_variant(session, channel_id, master_url, cache, timeout=10, max_height=None):
+    """為單一頻道選出最高質量的變體地址，無法取得或解析主播放清單時返回原地址"""
+    cached = cache.get(channel_id, master_url, max_height)
+    if cached:
+        return cached, 'cached'
+
+    try:
+        resp = session.get(master_url, timeout=timeout)
+        resp.raise_for_status()
+        variants = parse_master_playlist(resp.text, resp.url)
+    except Exception as e:
+        return master_url, f'failed: {e}'
+
+    variant = pick_variant(variants, max_height)
+    if not variant:
+        # 已是媒體播放清單或沒有變體
+        return master_url, 'single'
+
+    cache.set(channel_id, master_url, variant, max_height)
+    return variant['url'], f"{variant['height'] or '?'}p {variant['bandwidth'] // 1000}kbps"
+
+
+def select_variants(session, channels, cache, timeout=10, max_height=None, workers=DEFAULT_VARIANT_WORKERS):
+    """並發處理 [(頻道ID, 主播放清單地址)]，按輸入順序返回 [(變體地址, 說明)]"""
+    def run(item):
+        return select_variant(session, item[0], item[1], cache, timeout, max_height)
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        results = list(executor.map(run, channels))
+    cache.save()
+    return results
@@ -0,0 +1,146 @@
+import os
+import argparse
+import re
+import json
+import time
+import shutil
+import hashlib
+from xml.sax.saxutils import quoteattr
+from xml.etree import ElementTree as ET
+
+import pytz
+
+TAIPEI_TZ = pytz.timezone('Asia/Taipei')
+SHARD_MODES = ('channel', 'day')
+
+_UNSAFE_CHARS_RE = re.compile(r'[\\/:*?"<>|\s]+')
+
+
+def shard_filename(name, used):
+    """將頻道名稱轉為檔名，清理後重名時附加雜湊"""
+    safe = _UNSAFE_CHARS_RE.sub('_', name).strip('._') or 'channel'
+    if safe in used:
+        safe = f"{safe}-{hashlib.sha1(name.encode('utf-8')).hexdigest()[:8]}"
+    used.add(safe)
+    return f"{safe}.xml"
+
+
+class _ShardFile:
+    """單一分片檔案，寫入時同步計算大小與雜湊"""
+
+    def __init__(self, path, header, footer):
+        self.path = path
+        self.footer = footer
+        self.size = 0
+        self.programmes = 0
+        self.channels = set()
+        self._hash = hashlib.sha256()
+        self._file = open(path, 'wb')
+        self.write(header)
+
+    def write(self, text):
+        data = text.encode('utf-8')
+        self._file.write(data)
+        self._hash.update(data)
+        self.size += len(data)
+
+    def close(self):
+        self.write(self.footer)
+        self._file.close()
+        return {
+            'file': os.path.basename(self.path),
+            'size': self.size,
+            'sha256': self._hash.hexdigest(),
+            'channels': len(self.channels),
+            'programmes': self.programmes
+        }
+
+
+class XmltvShardWriter:
+    """在生成完整 XMLTV 的同一輪中，把每個 channel/programme 元素同時寫入按頻道及/或按日期的分片
+
+    分片先寫到暫存目錄，完成後整體替換舊目錄並寫出帶大小與 SHA-256 的 manifest.json。
+    """
+
+    def __init__(self, output_dir, root_attrib, modes=SHARD_MODES):
+        self.output_dir = output_dir
+        self.modes = [mode for mode in modes if mode in SHARD_MODES]
+        self._tmp_dir = f"{output_dir}.tmp"
+        self._header = '<?xml version="1.0" encoding="UTF-8"?>\n<tv%s>\n' % ''.join(
+            f" {key}={quoteattr(value)}" for key, value in root_attrib.items()
+        )
+        self._channels = {}        # 頻道ID -> 序列化後的 channel 元素
+        self._channel_shard = None
+        self._channel_names = set()
+        self._day_shards = {}
+        self._manifest = {mode: {} for mode in self.modes}
+
+        shutil.rmtree(self._tmp_dir, ignore_errors=True)
+        for mode in self.modes:
+            os.makedirs(os.path.join(self._tmp_dir, mode), exist_ok=True)
+
+    def _open(self, mode, filename):
+        return _ShardFile(os.path.join(self._tmp_dir, mode, filename), self._header, '</tv>\n')
+
+    def _close_channel_shard(self):
+        if self._channel_shard:
+            channel_id, shard = self._channel_shard
+            self._manifest['channel'][channel_id] = shard.close()
+            self._channel_shard = None
+
+    def add_channel(self, channel_id, channel_elem):
+        """登記頻道元素；按頻道分片時開始該頻道的分片 (生成器按頻道依序輸出)"""
+        serialized = ET.tostring(channel_elem, encoding='unicode') + '\n'
+        self._channels[channel_id] = serialized
+        if 'channel' in self.modes:
+            self._close_channel_shard()
+            shard = self._open('channel', shard_filename(channel_id, self._channel_names))
+            shard.write(serialized)
+            shard.channels.add(channel_id)
+            self._channel_shard = (channel_id, shard)
+
+    def add_programme(self, channel_id, programme_elem, start):
+        serialized = ET.tostring(programme_elem, encoding='unicode') + '\n'
+
+        if self._channel_shard and self._channel_shard[0] == channel_id:
+            shard = self._channel_shard[1]
+            shard.write(serialized)
+            shard.programmes += 1
+
+        if 'day' in self.modes:
+            day = start.astimezone(TAIPEI_TZ).strftime('%Y-%m-%d')
+            shard = self._day_shards.get(day)
+            if shard is None:
+                shard = self._day_shards[day] = self._open('day', f"{day}.xml")
+            if channel_id not in shard.channels:
+                shard.write(self._channels.get(channel_id, ''))
+                shard.channels.add(channel_id)
+            shard.write(serialized)
+            shard.programmes += 1
+
+    def close(self):
+        """完成所有分片、替換舊目錄並寫出 manifest，返回 manifest"""
+        self._close_channel_shard()
+        for day, shard in sorted(self._day_shards.items()):
+            self._manifest['day'][day] = shard.close()
+
+        manifest = {'generated_at': int(time.time()), 'modes': self.modes, **self._manifest}
+        with open(os.path.join(self._tmp_dir, 'manifest.json'), 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=2)
+
+        old_dir = f"{self.output_dir}.old"
+        shutil.rmtree(old_dir, ignore_errors=True)
+        if os.path.exists(self.output_dir):
+            os.rename(self.output_dir, old_dir)
+        os.rename(self._tmp_dir, self.output_dir)
+        shutil.rmtree(old_dir, ignore_errors=True)
+        return manifest
+
+
+def parse_shard_modes(value):
+    """解析命令行的分片方式，例如 'channel,day'"""
+    modes = [mode.strip() for mode in value.split(',') if mode.strip()]
+    invalid = [mode for mode in modes if mode not in SHARD_MODES]
+    if invalid:
+        raise argparse.ArgumentTypeError(f"未知的分片方式: {', '.join(invalid)} (可用: {', '.join(SHARD_MODES)})")
+    return modes